@@ -0,0 +1,70 @@
+"""Benchmark import throughput against the fake calibre toolchain
+
+Measures CalibreManager.import_books for several batch sizes, so the
+overhead of this app (process spawning, executor, parsing) can be told apart
+from calibre's own cost, which the fake replaces with a configurable latency.
+
+Usage: python -m benchmarks.bench_import [--sizes 1,10,100,1000] [--latency-ms MS]
+                                         [--fail-rate R]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.core.calibre import CalibreManager
+from src.core.executor import CalibreExecutor
+from src.core.scanner import Ebook
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+def make_ebooks(folder: Path, count: int):
+    folder.mkdir(parents=True)
+    ebooks = []
+    for i in range(count):
+        path = folder / f"book-{i:05d}.epub"
+        path.write_bytes(b"PK" + os.urandom(256))
+        ebooks.append(Ebook(path=path))
+    return ebooks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,10,100,1000")
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    options = parser.parse_args()
+
+    os.environ["FAKE_CALIBRE_LATENCY_MS"] = str(options.latency_ms)
+    os.environ["FAKE_CALIBRE_FAIL_RATE"] = str(options.fail_rate)
+    os.environ["KOBO_CONVERT"] = "none"
+
+    print(f"{'batch':>6} {'seconds':>9} {'books/s':>9} {'ms/book':>9} {'added':>6} {'failed':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        bin_dir = install_fake_calibre(tmp / "bin")
+        for size in (int(s) for s in options.sizes.split(",")):
+            library = tmp / f"library-{size}"
+            library.mkdir()
+            ebooks = make_ebooks(tmp / f"books-{size}", size)
+            manager = CalibreManager(
+                calibredb_path=str(bin_dir / "calibredb"),
+                library_path=str(library),
+                executor=CalibreExecutor(),
+            )
+
+            start = time.perf_counter()
+            result = manager.import_books(ebooks)
+            elapsed = time.perf_counter() - start
+
+            print(f"{size:>6} {elapsed:>9.3f} {size / elapsed:>9.1f} {elapsed / size * 1000:>9.1f} "
+                  f"{len(result.added):>6} {len(result.failed):>6}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
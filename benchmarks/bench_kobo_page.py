@@ -0,0 +1,83 @@
+"""Benchmark rendering the /kobo pages for a large catalog
+
+Builds a synthetic catalog, then times the first (uncached) and repeated
+(cached) requests for the first page of each sort order, and reports the
+page count and page sizes next to the size of the whole catalog on a single
+page, which is what the Kobo's browser used to get.
+
+Usage: python -m benchmarks.bench_kobo_page [--books 10000] [--budget 24576]
+                                            [--per-page 30]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+
+from flask import Flask, request
+
+from src.web.catalog import SORTS, Catalog, CatalogEntry
+from src.web.kobo_page import KoboPages
+
+WORDS = ("il", "nome", "della", "rosa", "notte", "città", "mare", "viaggio", "ultimo", "giardino",
+         "segreto", "Éclipse", "storia", "tempo", "fuoco", "inverno", "lettera", "isola", "ombra")
+NAMES = ("Italo", "Elsa", "Umberto", "Natalia", "Primo", "Alberto", "Grazia", "Cesare", "Dacia")
+SURNAMES = ("Calvino", "Morante", "Eco", "Ginzburg", "Levi", "Moravia", "Deledda", "Pavese", "Maraini")
+
+
+def make_catalog(books: int, seed: int = 1) -> Catalog:
+    rng = random.Random(seed)
+    catalog = Catalog()
+    catalog.entries = [
+        CatalogEntry(
+            index=i,
+            title=" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))).capitalize(),
+            author=f"{rng.choice(NAMES)} {rng.choice(SURNAMES)}" if rng.random() > 0.05 else "",
+            format=rng.choice(("EPUB", "KEPUB", "PDF")),
+            mtime=rng.uniform(0, 1e9),
+        )
+        for i in range(books)
+    ]
+    catalog.generation = 1
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--budget", type=int, default=24 * 1024)
+    parser.add_argument("--per-page", type=int, default=30)
+    options = parser.parse_args()
+
+    catalog = make_catalog(options.books)
+    pages = KoboPages(catalog, budget=options.budget, max_books=options.per_page)
+    app = Flask(__name__)
+
+    print(f"{'sort':>8} {'first ms':>9} {'cached ms':>10} {'304 ms':>8} {'pages':>6} {'max KB':>7} {'books/page':>11}")
+    for sort in SORTS:
+        with app.test_request_context("/kobo"):
+            start = time.perf_counter()
+            response = pages.response(sort, 1, request)
+            first = time.perf_counter() - start
+
+            start = time.perf_counter()
+            pages.response(sort, 1, request)
+            cached = time.perf_counter() - start
+        with app.test_request_context("/kobo", headers={"If-None-Match": response.get_etag()[0]}):
+            start = time.perf_counter()
+            assert pages.response(sort, 1, request).status_code == 304
+            not_modified = time.perf_counter() - start
+
+        layout = pages.layout(sort)
+        largest = max(len(pages.render(sort, n).encode("utf-8")) for n in range(1, len(layout.pages) + 1))
+        print(f"{sort:>8} {first * 1000:>9.1f} {cached * 1000:>10.2f} {not_modified * 1000:>8.2f} "
+              f"{len(layout.pages):>6} {largest / 1024:>7.1f} {options.books / len(layout.pages):>11.1f}")
+
+    single = KoboPages(make_catalog(options.books), budget=1 << 40, max_books=options.books)
+    print(f"\nWhole catalog on one page: {len(single.render(SORTS[0], 1).encode('utf-8')) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
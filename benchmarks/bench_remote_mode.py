@@ -0,0 +1,94 @@
+"""Benchmark calibredb direct mode against remote mode through the content server
+
+Runs against the fake calibre toolchain in tests/fakes, with the fake server
+periodically holding the library write lock the way a busy calibre-server does.
+
+Usage: python -m benchmarks.bench_remote_mode [--books N] [--busy-ms MS]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.core.calibre import CalibreManager
+from src.core.scanner import Ebook
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, deadline: float = 10.0):
+    end = time.monotonic() + deadline
+    while time.monotonic() < end:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f"fake content server did not start on port {port}")
+
+
+def import_one_by_one(manager: CalibreManager, ebooks) -> float:
+    start = time.perf_counter()
+    for ebook in ebooks:
+        manager.import_books([ebook])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=20)
+    parser.add_argument("--busy-ms", type=int, default=50)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        bin_dir = install_fake_calibre(tmp / "bin")
+        library = tmp / "Calibre Library"
+        library.mkdir()
+        ebooks = []
+        for i in range(options.books):
+            path = tmp / f"book-{i:04d}.epub"
+            path.write_bytes(b"PK")
+            ebooks.append(Ebook(path=path))
+
+        os.environ["FAKE_CALIBRE_SERVER_BUSY_MS"] = str(options.busy_ms)
+
+        # Direct mode: an unmanaged server holds the library while calibredb opens it
+        port = free_port()
+        server = subprocess.Popen([str(bin_dir / "calibre-server"), str(library), "--port", str(port)])
+        try:
+            wait_for_port(port)
+            direct = CalibreManager(calibredb_path=str(bin_dir / "calibredb"), library_path=str(library))
+            direct_time = import_one_by_one(direct, ebooks)
+        finally:
+            server.terminate()
+            server.wait()
+
+        # Remote mode: the manager starts the server and routes calibredb through it
+        port = free_port()
+        remote = CalibreManager(calibredb_path=str(bin_dir / "calibredb"), library_path=str(library))
+        remote.calibre_server = str(bin_dir / "calibre-server")
+        remote.start_content_server(port=port)
+        try:
+            remote_time = import_one_by_one(remote, ebooks)
+        finally:
+            remote.stop_content_server()
+
+    print(f"books={options.books} server busy={options.busy_ms}ms")
+    print(f"direct: {direct_time:.3f}s ({direct_time / options.books * 1000:.1f} ms/book)")
+    print(f"remote: {remote_time:.3f}s ({remote_time / options.books * 1000:.1f} ms/book)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
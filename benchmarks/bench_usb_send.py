@@ -0,0 +1,84 @@
+"""Benchmark USB sends to a simulated Kobo with different copy strategies
+
+Runs CalibreManager.send_to_kobo_usb against tests.fakes.kobo_device.FakeKobo
+for each combination of transfer method, worker count and fsync batch, with
+an optional per-file latency and throughput cap standing in for slow flash.
+
+Usage: python -m benchmarks.bench_usb_send [--books 200] [--size-kb 500]
+                                           [--latency-ms MS] [--mb-per-s N]
+                                           [--workers 1,2,4] [--fsync-batch 1,8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.core.calibre import CalibreManager
+from src.core.scanner import Ebook
+from src.core.usb_copy import UsbCopyEngine
+from tests.fakes.kobo_device import FakeKobo
+
+STRATEGIES = {
+    "copy_file_range": ("copy_file_range",),
+    "sendfile": ("sendfile",),
+    "buffered": ("buffered",),
+}
+
+
+def make_ebooks(folder: Path, count: int, size: int):
+    folder.mkdir(parents=True)
+    ebooks = []
+    for i in range(count):
+        path = folder / f"book-{i:05d}.epub"
+        path.write_bytes(b"PK" + os.urandom(size))
+        ebooks.append(Ebook(path=path))
+    return ebooks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--mb-per-s", type=float, default=0.0)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--fsync-batch", default="1,8")
+    options = parser.parse_args()
+
+    os.environ["KOBO_CONVERT"] = "none"
+    os.environ["KOBO_THUMBNAILS"] = "0"
+    os.environ["KOBO_RESERVE_MB"] = "0"
+
+    print(f"{'method':>16} {'workers':>8} {'batch':>6} {'seconds':>9} {'MB/s':>8} {'books/s':>8} {'failed':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        os.environ["KOBO_SYNC_CACHE_DIR"] = str(tmp / "cache")
+        ebooks = make_ebooks(tmp / "books", options.books, options.size_kb * 1024)
+        combinations = itertools.product(
+            STRATEGIES.items(),
+            (int(w) for w in options.workers.split(",")),
+            [int(b) for b in options.fsync_batch.split(",")],
+        )
+        for run, ((name, methods), workers, batch) in enumerate(combinations):
+            kobo = FakeKobo(tmp / f"device-{run}", write_latency_ms=options.latency_ms,
+                            write_mb_per_s=options.mb_per_s)
+            with kobo.attached():
+                manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp))
+                manager.copy_engine = UsbCopyEngine(workers=workers, fsync_batch=batch, methods=methods)
+                device = manager.check_kobo_usb()
+                start = time.perf_counter()
+                report = manager.send_to_kobo_usb(ebooks, device)
+                elapsed = time.perf_counter() - start
+
+            print(f"{name:>16} {workers:>8} {batch:>6} {elapsed:>9.3f} {report.copy.throughput:>8.1f} "
+                  f"{len(report.copied) / elapsed:>8.1f} {len(report.failed):>7}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
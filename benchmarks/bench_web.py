@@ -0,0 +1,156 @@
+"""Load-test the web app in development and production serving modes
+
+Starts ``python -m src.main`` against the fake calibre toolchain, then hits
+it from concurrent keep-alive clients for a fixed time and reports
+requests/s and latency percentiles. With --slow-import a client keeps an
+/api/import running (slowed by FAKE_CALIBRE_LATENCY_MS) to show whether a
+slow request holds up the others.
+
+Usage: python -m benchmarks.bench_web [--modes dev,production] [--clients 16]
+                                      [--seconds 5] [--threads 8]
+                                      [--path /api/kobo-status] [--slow-import]
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/libraries")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def client(port: int, path: str, stop: float, latencies: list, errors: list):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while time.monotonic() < stop:
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def slow_imports(port: int, stop: float):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    conn.request("GET", "/api/scan")
+    count = len(json.loads(conn.getresponse().read()).get("ebooks", []))
+    while time.monotonic() < stop:
+        body = json.dumps({"indices": list(range(count))})
+        conn.request("POST", "/api/import", body, {"Content-Type": "application/json"})
+        conn.getresponse().read()
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def run_mode(mode: str, options, tmp: Path, env: dict):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "src.main", "--server", mode, "--host", "127.0.0.1",
+         "--port", str(port), "--threads", str(options.threads)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(port)
+        stop = time.monotonic() + options.seconds
+        latencies, errors = [], []
+        threads = [threading.Thread(target=client, args=(port, options.path, stop, latencies, errors))
+                   for _ in range(options.clients)]
+        if options.slow_import:
+            threads.append(threading.Thread(target=slow_imports, args=(port, stop), daemon=True))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads[:options.clients]:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        shutdown_start = time.perf_counter()
+        server.terminate()
+        server.wait(timeout=60)
+        shutdown = time.perf_counter() - shutdown_start
+
+        print(f"{mode:>11} {len(latencies) / elapsed:>9.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.1f} {len(errors):>7} {shutdown:>10.2f}")
+    finally:
+        server.kill()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="dev,production")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--path", default="/api/kobo-status")
+    parser.add_argument("--slow-import", action="store_true")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        bin_dir = install_fake_calibre(tmp / "bin")
+        library = tmp / "library"
+        library.mkdir()
+        ebooks = tmp / "ebooks"
+        ebooks.mkdir()
+        for i in range(20):
+            (ebooks / f"book-{i:03d}.epub").write_bytes(b"PK" + os.urandom(256))
+        mount_table = tmp / "mountinfo"
+        mount_table.write_text("")
+        env = dict(os.environ,
+                   PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+                   CALIBRE_LIBRARY=str(library),
+                   EBOOK_SOURCE_DIR=str(ebooks),
+                   KOBO_MOUNT_TABLE=str(mount_table),
+                   KOBO_SYNC_CACHE_DIR=str(tmp / "cache"),
+                   KOBO_CONVERT="none",
+                   FAKE_CALIBRE_LATENCY_MS=os.environ.get("FAKE_CALIBRE_LATENCY_MS", "200"))
+
+        print(f"{'mode':>11} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'stop s':>10}")
+        for mode in options.modes.split(","):
+            run_mode(mode, options, tmp, env)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -81,7 +81,7 @@ cd "$APP_DIR"
 python3 -m venv .venv
 source .venv/bin/activate
 pip install --upgrade pip
-pip install flask ebooklib
+pip install flask ebooklib "waitress>=2.1,<4"
 deactivate
 chown -R "$APP_USER:$APP_USER" "$APP_DIR"
 
@@ -123,7 +123,7 @@ WorkingDirectory=$APP_DIR
 Environment="PATH=$APP_DIR/.venv/bin"
 Environment="EBOOK_SOURCE_DIR=$EBOOK_DIR"
 Environment="CALIBRE_LIBRARY=$CALIBRE_LIBRARY"
-ExecStart=$APP_DIR/.venv/bin/python -m src.main
+ExecStart=$APP_DIR/.venv/bin/python -m src.main --server production
 Restart=always
 RestartSec=5
 
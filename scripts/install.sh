@@ -60,7 +60,7 @@ cd "$APP_DIR"
 python3 -m venv .venv
 source .venv/bin/activate
 pip install --upgrade pip
-pip install flask ebooklib
+pip install flask ebooklib "waitress>=2.1,<4"
 
 echo -e "${YELLOW}[6/7] Configurazione permessi...${NC}"
 chown -R "$APP_USER:$APP_USER" "$APP_DIR"
@@ -84,7 +84,7 @@ WorkingDirectory=$APP_DIR
 Environment="PATH=$APP_DIR/.venv/bin"
 Environment="EBOOK_SOURCE_DIR=/home/$APP_USER/ebooks"
 Environment="CALIBRE_LIBRARY=/home/$APP_USER/calibre-library"
-ExecStart=$APP_DIR/.venv/bin/python -m src.main
+ExecStart=$APP_DIR/.venv/bin/python -m src.main --server production
 Restart=always
 RestartSec=5
 
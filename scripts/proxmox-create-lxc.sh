@@ -158,7 +158,7 @@ cd /opt/kobo-sync
 python3 -m venv .venv
 source .venv/bin/activate
 pip install --upgrade pip
-pip install flask ebooklib
+pip install flask ebooklib "waitress>=2.1,<4"
 deactivate
 chown -R kobo:kobo /opt/kobo-sync
 
@@ -192,7 +192,7 @@ WorkingDirectory=/opt/kobo-sync
 Environment="PATH=/opt/kobo-sync/.venv/bin"
 Environment="EBOOK_SOURCE_DIR=/mnt/ebooks"
 Environment="CALIBRE_LIBRARY=/home/kobo/calibre-library"
-ExecStart=/opt/kobo-sync/.venv/bin/python -m src.main
+ExecStart=/opt/kobo-sync/.venv/bin/python -m src.main --server production
 Restart=always
 RestartSec=5
 
@@ -0,0 +1,44 @@
+"""Local cache locations and memoised file hashing"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+
+# Root for everything this app caches on the host
+CACHE_ENV_VAR = "KOBO_SYNC_CACHE_DIR"
+
+
+def cache_root() -> Path:
+    """Cache root: KOBO_SYNC_CACHE_DIR or ~/.cache/kobo-calibre-sync"""
+    return Path(os.environ.get(CACHE_ENV_VAR) or Path.home() / ".cache" / "kobo-calibre-sync")
+
+
+class FileHasher:
+    """SHA-256 of files, memoised by (path, size, mtime) so unchanged files are read once"""
+
+    def __init__(self):
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: Path) -> str:
+        stat = path.stat()
+        stamp = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(stamp)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._digests[stamp] = digest
+        return digest
+
+
+file_hasher = FileHasher()
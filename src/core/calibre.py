@@ -2,29 +2,49 @@
 
 from __future__ import annotations
 
+import atexit
+import json
 import subprocess
 import shutil
 import os
 import re
-import socket
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, List, Tuple
-from dataclasses import dataclass
-
-
-def get_local_ip() -> str:
-    """Get the local IP address of this machine on the network"""
-    try:
-        # Create a socket to determine the local IP
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except:
-        return "127.0.0.1"
-
+from typing import Optional, List, Tuple, Dict
+from dataclasses import dataclass, field
+
+from src.core.changes import LibraryChangeFeed
+from src.core.convert import EbookConverter
+from src.core.detect import DeviceLocks, KoboDetector
+from src.core.eviction import Eviction, EvictionPolicy, EvictionReport, evict
+from src.core.executor import CalibreExecutor, CommandTimeout
+from src.core.kobo_db import DeviceIndex, KoboDatabase, device_db_stamp
+from src.core.layout import DeviceLayout, directories
+from src.core.manifest import DeviceManifest, device_id
+from src.core.metadata import BookMetadata, MetadataCache, MetadataExtractor
+from src.core.network import get_local_ip
+from src.core.planner import SpacePlan, SpacePlanner
+from src.core.reading import LibraryMatcher, ReadingSyncReport, ReadingSyncState, reading_columns
 from src.core.scanner import Ebook
+from src.core.server import (
+    DEFAULT_SERVER_PORT,
+    ContentServerDiscovery,
+    ContentServerSupervisor,
+    ServerStartError,
+    opds_path,
+)
+from src.core.thumbnails import ThumbnailGenerator
+from src.core.usb_copy import CopyReport, UsbCopyEngine
+from src.core.writeback import (
+    BULK_SCRIPT,
+    MetadataUpdate,
+    WriteOutcome,
+    metadata_fields,
+    set_metadata_args,
+)
 
 
 class CalibreError(Exception):
@@ -40,13 +60,141 @@ class DeviceInfo:
     connected: bool = False
 
 
+# Per-command timeouts in seconds; anything else uses the executor default
+COMMAND_TIMEOUTS = {
+    "add": 600.0,
+    "list": 60.0,
+}
+
+# Environment variable set by the installers to point at the library
+LIBRARY_ENV_VAR = "CALIBRE_LIBRARY"
+
+
+def resolve_library_path(library_path: Optional[str] = None) -> Optional[Path]:
+    """Resolve the Calibre library from config, environment or common locations
+
+    An explicitly configured path (argument or CALIBRE_LIBRARY) must be an
+    existing directory; calibredb initialises an empty one on first use.
+    Common locations are only accepted if they already hold a metadata.db.
+    """
+    configured = library_path or os.environ.get(LIBRARY_ENV_VAR)
+    if configured:
+        path = Path(configured).expanduser()
+        if not path.is_dir():
+            raise CalibreError(f"Calibre library not found: {path}")
+        return path.resolve()
+
+    home = Path.home()
+    common_paths = [
+        home / "Calibre Library",
+        home / "Documents" / "Calibre Library",
+        home / "Library" / "Calibre Library",
+    ]
+    for path in common_paths:
+        if (path / "metadata.db").exists():
+            return path
+    return None
+
+
+def library_id(library_path: Path) -> str:
+    """Library id used by calibre-server URLs (folder name, spaces as underscores)"""
+    return library_path.name.replace(" ", "_")
+
+
+@dataclass
+class UsbSendReport:
+    """What a USB send copied, skipped as already on the device, or failed on"""
+    copied: List[Path] = field(default_factory=list)
+    skipped: List[Path] = field(default_factory=list)
+    on_device: List[Path] = field(default_factory=list)
+    no_space: List[Path] = field(default_factory=list)
+    failed: List[Path] = field(default_factory=list)
+    copy: Optional[CopyReport] = None
+    thumbnails: Optional[CopyReport] = None
+    space: Optional[SpacePlan] = None
+    evicted: Optional[EvictionReport] = None
+
+
+@dataclass
+class UsbSendPlan:
+    """What a USB send will do, worked out before any bytes are copied"""
+    manifest: DeviceManifest
+    on_device: List[Path] = field(default_factory=list)
+    skipped: List[Path] = field(default_factory=list)
+    space: SpacePlan = field(default_factory=SpacePlan)
+    evict: List[Eviction] = field(default_factory=list)
+
+
+# Import outcomes
+ADDED = "added"
+DUPLICATE = "duplicate"
+FAILED = "failed"
+
+
+@dataclass
+class ImportedBook:
+    """Outcome of importing one ebook file"""
+    ebook: Ebook
+    status: str
+    book_id: Optional[int] = None
+    seconds: float = 0.0
+    error: str = ""
+
+
+@dataclass
+class ImportResult:
+    """Per-file outcomes of an import, keyed by source path"""
+    books: List[ImportedBook] = field(default_factory=list)
+
+    @property
+    def book_ids(self) -> List[int]:
+        """IDs of the books that were added"""
+        return [book.book_id for book in self.books if book.book_id is not None]
+
+    @property
+    def added(self) -> List[ImportedBook]:
+        return [book for book in self.books if book.status == ADDED]
+
+    @property
+    def duplicates(self) -> List[ImportedBook]:
+        return [book for book in self.books if book.status == DUPLICATE]
+
+    @property
+    def failed(self) -> List[ImportedBook]:
+        return [book for book in self.books if book.status == FAILED]
+
+    def by_path(self) -> Dict[Path, ImportedBook]:
+        return {book.ebook.path: book for book in self.books}
+
+
 class CalibreManager:
-    def __init__(self, calibredb_path: Optional[str] = None):
+    def __init__(self, calibredb_path: Optional[str] = None,
+                 library_path: Optional[str] = None,
+                 executor: Optional[CalibreExecutor] = None):
         self.calibre_base = "/Applications/calibre.app/Contents/MacOS"
         self.calibredb = calibredb_path or self._find_calibredb()
         self.calibre_debug = self._find_tool("calibre-debug")
         self.calibre_server = self._find_tool("calibre-server")
-        self._server_process = None
+        self.executor = executor or CalibreExecutor()
+        self.converter = self._make_converter()
+        self._change_feed: Optional[LibraryChangeFeed] = None
+        self.detector = KoboDetector()
+        # Shared with the other libraries when managed by a LibraryRegistry
+        self.device_locks = DeviceLocks()
+        self.copy_engine = UsbCopyEngine()
+        self.thumbnails = ThumbnailGenerator()
+        self.layout = DeviceLayout()
+        self.space_planner = SpacePlanner()
+        self.eviction = EvictionPolicy()
+        self.metadata_cache = MetadataCache()
+        self._device_indexes: Dict[str, Tuple[tuple, DeviceIndex]] = {}
+        # Shared with the other libraries when managed by a LibraryRegistry
+        self.discovery = ContentServerDiscovery()
+        self.server_port = DEFAULT_SERVER_PORT
+        self._server: Optional[ContentServerSupervisor] = None
+        self._library_config = library_path
+        self._library_path: Optional[Path] = None
+        self._library_resolved = False
 
     def _find_calibredb(self) -> str:
         """Find calibredb executable"""
@@ -69,108 +217,419 @@ class CalibreManager:
             return macos_path
         return shutil.which(name)
 
-    def _run(self, *args, tool: str = None) -> subprocess.CompletedProcess:
-        """Run a calibre command"""
+    def _make_converter(self) -> EbookConverter:
+        """Conversion stage for books sent to the Kobo (KOBO_CONVERT=kepub|epub|none)"""
+        target = os.environ.get("KOBO_CONVERT", "kepub").lower()
+        tool = None if target == "none" else self._find_tool("ebook-convert")
+        return EbookConverter(tool, target=target if tool else "kepub")
+
+    def _run(self, *args, tool: str = None, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a calibre command through the bounded executor"""
         executable = tool or self.calibredb
+        if executable == self.calibredb:
+            timeout = timeout or COMMAND_TIMEOUTS.get(args[0] if args else "")
+            args = self._with_library(args)
         cmd = [executable, *args]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            result = self.executor.run(cmd, timeout=timeout)
+        except CommandTimeout as e:
+            raise CalibreError(str(e))
         if result.returncode != 0 and "already exist" not in result.stderr.lower():
             raise CalibreError(f"calibre error: {result.stderr}")
         return result
 
-    def get_library_path(self) -> Optional[Path]:
-        """Get the path to the Calibre library"""
-        # Try common locations
-        home = Path.home()
-        common_paths = [
-            home / "Calibre Library",
-            home / "Documents" / "Calibre Library",
-            home / "Library" / "Calibre Library",
-        ]
-        for path in common_paths:
-            if path.exists():
-                return path
+    def _with_library(self, args: tuple) -> list:
+        """Insert the library option after the calibredb subcommand
 
-        # Try to get from calibredb
-        try:
-            result = self._run("list", "--limit", "0")
-            # Parse library path from output if available
-            return common_paths[0] if common_paths[0].exists() else None
-        except:
+        While a content server started by this manager is running, calibredb
+        talks to it remotely instead of opening the library itself, so the two
+        processes never contend for the database lock.
+        """
+        library = self.get_library_path()
+        if library is None or not args:
+            return list(args)
+        server_url = self.managed_server_url()
+        if server_url:
+            target = f"--with-library={server_url}/#{library_id(library)}"
+        else:
+            target = f"--library-path={library}"
+        return [args[0], target, *args[1:]]
+
+    def managed_server_url(self) -> Optional[str]:
+        """Local URL of the content server started by this manager, if alive"""
+        if self._server is None or not self._server.is_running():
             return None
+        return f"http://127.0.0.1:{self._server.port}"
 
-    def import_books(self, ebooks: List[Ebook]) -> List[int]:
-        """Import ebooks into Calibre library. Returns list of book IDs."""
-        imported_ids = []
+    def get_library_path(self) -> Optional[Path]:
+        """Get the path to the Calibre library (resolved once, then cached)"""
+        if not self._library_resolved:
+            self._library_path = resolve_library_path(self._library_config)
+            self._library_resolved = True
+        return self._library_path
+
+    def import_books(self, ebooks: List[Ebook]) -> ImportResult:
+        """Import ebooks into Calibre library, one calibredb add per file
+
+        Adding files one at a time keeps the mapping from each source file to
+        its new book ID, which calibredb does not report for batched adds.
+        """
+        imported = ImportResult()
 
         for ebook in ebooks:
+            start = time.perf_counter()
             try:
                 result = self._run("add", str(ebook.path))
-                # Parse the output to get the book ID
-                for line in result.stdout.splitlines():
-                    if "Added book ids:" in line:
-                        ids_str = line.split(":")[-1].strip()
-                        for id_str in ids_str.split(","):
-                            try:
-                                imported_ids.append(int(id_str.strip()))
-                            except ValueError:
-                                pass
-            except CalibreError:
-                # Book might already exist, continue
-                pass
-
-        return imported_ids
+            except CalibreError as e:
+                imported.books.append(ImportedBook(
+                    ebook, FAILED, seconds=time.perf_counter() - start, error=str(e)))
+                continue
+            elapsed = time.perf_counter() - start
+
+            book_ids = self._parse_added_ids(result.stdout)
+            output = (result.stdout + result.stderr).lower()
+            if book_ids:
+                imported.books.append(ImportedBook(ebook, ADDED, book_ids[0], elapsed))
+            elif "already exist" in output:
+                imported.books.append(ImportedBook(ebook, DUPLICATE, seconds=elapsed))
+            else:
+                imported.books.append(ImportedBook(
+                    ebook, FAILED, seconds=elapsed, error="calibredb reported no book id"))
+
+        return imported
+
+    @staticmethod
+    def _parse_added_ids(stdout: str) -> List[int]:
+        """Parse the "Added book ids: 1, 2" line printed by calibredb add"""
+        ids = []
+        for line in stdout.splitlines():
+            if "Added book ids:" in line:
+                ids_str = line.split(":")[-1].strip()
+                for id_str in ids_str.split(","):
+                    try:
+                        ids.append(int(id_str.strip()))
+                    except ValueError:
+                        pass
+        return ids
+
+    def write_back_metadata(self, imported: ImportResult,
+                            extractor: Optional[MetadataExtractor] = None) -> List[WriteOutcome]:
+        """Push cleaned-up metadata of newly added books into the library
+
+        Without an extractor, metadata comes from this manager's metadata cache.
+        """
+        extract = extractor.extract if extractor else self.metadata_cache.get
+        updates = []
+        for book in imported.added:
+            try:
+                updates.append(MetadataUpdate(book.book_id, metadata_fields(extract(book.ebook.path))))
+            except OSError as e:
+                print(f"Error reading metadata of {book.ebook.path}: {e}")
+        return self.write_metadata(updates)
+
+    def write_metadata(self, updates: List[MetadataUpdate]) -> List[WriteOutcome]:
+        """Write metadata for many books in as few calibre invocations as possible
+
+        With calibre-debug available and no managed content server, every
+        update is applied in a single process through calibre's database API.
+        Otherwise (or if that fails) each book gets one calibredb set_metadata
+        call carrying all of its fields.
+        """
+        updates = [update for update in updates if update.fields]
+        if not updates:
+            return []
+        if self.calibre_debug and not self.managed_server_url():
+            outcomes = self._write_metadata_bulk(updates)
+            if outcomes is not None:
+                return outcomes
+        return [self._write_metadata_one(update) for update in updates]
+
+    def _write_metadata_bulk(self, updates: List[MetadataUpdate]) -> Optional[List[WriteOutcome]]:
+        library = self.get_library_path()
+        if library is None:
+            return None
+        with tempfile.TemporaryDirectory() as tmp:
+            script = Path(tmp) / "writeback.py"
+            script.write_text(BULK_SCRIPT)
+            payload = Path(tmp) / "payload.json"
+            payload.write_text(json.dumps({
+                "library": str(library),
+                "updates": [{"book_id": u.book_id, "fields": u.fields} for u in updates],
+            }))
+            try:
+                result = self._run("-e", str(script), str(payload), tool=self.calibre_debug)
+                errors = json.loads(result.stdout.strip().splitlines()[-1])
+            except (CalibreError, ValueError, IndexError):
+                return None
+        return [
+            WriteOutcome(u.book_id, not errors.get(str(u.book_id)), errors.get(str(u.book_id), ""))
+            for u in updates
+        ]
+
+    def _write_metadata_one(self, update: MetadataUpdate) -> WriteOutcome:
+        try:
+            self._run(*set_metadata_args(update))
+        except CalibreError as e:
+            return WriteOutcome(update.book_id, False, str(e))
+        return WriteOutcome(update.book_id, True)
+
+    def change_feed(self) -> LibraryChangeFeed:
+        """Change feed over this manager's library (created once)"""
+        if self._change_feed is None:
+            library = self.get_library_path()
+            if library is None:
+                raise CalibreError("Calibre library not found")
+            self._change_feed = LibraryChangeFeed(library)
+        return self._change_feed
+
+    def library_formats(self, book_ids: List[int]) -> Dict[int, List[Path]]:
+        """Paths of the library copies of the given books, in one calibredb call"""
+        if not book_ids:
+            return {}
+        search = " or ".join(f"id:{book_id}" for book_id in book_ids)
+        try:
+            result = self._run("list", "--for-machine", "--fields", "formats", "--search", search)
+            rows = json.loads(result.stdout or "[]")
+        except (CalibreError, ValueError):
+            return {}
+        return {row["id"]: [Path(p) for p in row.get("formats") or []] for row in rows}
+
+    def library_copies(self, imported: ImportResult) -> List[Ebook]:
+        """Ebooks to send for an import: library copies where known, else sources"""
+        formats = self.library_formats(imported.book_ids)
+        ebooks = []
+        for book in imported.books:
+            if book.status == FAILED:
+                continue
+            source = book.ebook.path
+            copies = [p for p in formats.get(book.book_id, []) if p.suffix.lower() == source.suffix.lower()]
+            ebooks.append(Ebook(path=copies[0]) if copies else book.ebook)
+        return ebooks
 
     def check_kobo_usb(self) -> Optional[DeviceInfo]:
-        """Check if a Kobo is connected via USB"""
-        # Look for Kobo mount points on macOS
-        volumes = Path("/Volumes")
-        if not volumes.exists():
+        """Check if Kobo is connected via USB (cached until the mounts change)"""
+        mount_point = self.detector.find()
+        if mount_point is None:
             return None
+        return DeviceInfo(name=mount_point.name, path=str(mount_point), connected=True)
 
-        for vol in volumes.iterdir():
-            if vol.is_dir():
-                # Check for Kobo-specific files
-                kobo_dir = vol / ".kobo"
-                if kobo_dir.exists():
-                    return DeviceInfo(
-                        name=vol.name,
-                        path=str(vol),
-                        connected=True
-                    )
-        return None
-
-    def send_to_kobo_usb(self, ebooks: List[Ebook], device: DeviceInfo) -> int:
-        """Send ebooks directly to USB-connected Kobo"""
-        sent_count = 0
+    def plan_kobo_usb(self, ebooks: List[Ebook], device: DeviceInfo) -> UsbSendPlan:
+        """Work out which ebooks to copy, skip, or leave out for lack of space"""
         kobo_books_dir = Path(device.path)
+        plan = UsbSendPlan(manifest=DeviceManifest.load(kobo_books_dir))
+        index = self.device_index(device)
 
-        for ebook in ebooks:
+        def taken(source: Path, relative: str) -> bool:
+            # A file this app did not put there, and not just an older copy of this book
+            if relative in plan.manifest.entries:
+                return False
             try:
-                # Determine destination based on format
-                dest_dir = kobo_books_dir
-                dest_file = dest_dir / ebook.path.name
+                return (kobo_books_dir / relative).stat().st_size != source.stat().st_size
+            except OSError:
+                return False
+
+        items = []
+        for source, relative in self.layout.assign([e.path for e in ebooks], self._book_metadata, taken):
+            if index and relative not in plan.manifest.entries and self._on_device(index, source, relative):
+                plan.on_device.append(source)
+            else:
+                items.append((source, relative))
+        sync = plan.manifest.plan(items)
+        plan.skipped = [source for source, _ in sync.skipped]
+        plan.space = self.space_planner.plan(kobo_books_dir, sync.to_copy)
+        if plan.space.shortfall and index:
+            keep = [relative for _, relative in items]
+            plan.evict = self.eviction.choose(index, kobo_books_dir, plan.space.shortfall, keep)
+            if plan.evict:
+                plan.space = self.space_planner.plan(
+                    kobo_books_dir, sync.to_copy, reclaim=sum(e.size for e in plan.evict))
+        return plan
+
+    def send_to_kobo_usb(self, ebooks: List[Ebook], device: DeviceInfo,
+                         plan: Optional[UsbSendPlan] = None) -> UsbSendReport:
+        """Send ebooks directly to USB-connected Kobo, skipping unchanged files
+
+        Only the books that fit in the device's free space are copied; the
+        plan is printed before copying starts. Sends to the same device are
+        serialised, also across libraries.
+        """
+        with self.device_locks.hold(device.path):
+            return self._send_to_kobo_usb(ebooks, device, plan)
 
-                # Copy file
-                shutil.copy2(ebook.path, dest_file)
-                sent_count += 1
-            except Exception as e:
-                print(f"Error copying {ebook.path}: {e}")
+    def _send_to_kobo_usb(self, ebooks: List[Ebook], device: DeviceInfo,
+                          plan: Optional[UsbSendPlan]) -> UsbSendReport:
+        kobo_books_dir = Path(device.path)
+        plan = plan or self.plan_kobo_usb(ebooks, device)
+        manifest = plan.manifest
+        print(f"Kobo {device.name}: {plan.space.summary()}")
+        report = UsbSendReport(on_device=plan.on_device, skipped=plan.skipped, space=plan.space,
+                               no_space=[source for source, _ in plan.space.left_out])
+
+        if plan.evict:
+            print(f"Kobo {device.name}: rimozione di {len(plan.evict)} libri già letti")
+            report.evicted = evict(kobo_books_dir, plan.evict)
+            for eviction in report.evicted.removed:
+                manifest.forget(eviction.path)
+
+        to_copy = plan.space.fits
+        for directory in directories(relative for _, relative in to_copy):
+            try:
+                (kobo_books_dir / directory).mkdir(exist_ok=True)
+            except OSError as e:
+                print(f"Error creating {directory} on the Kobo: {e}")
+        # Covers are rendered on the host's cores while the books are copied
+        with ThreadPoolExecutor(max_workers=1) as background:
+            thumbnails = background.submit(self.thumbnails.generate, to_copy)
+            report.copy = self.copy_engine.copy(
+                [(source, kobo_books_dir / relative) for source, relative in to_copy])
+        for (source, relative), copied in zip(to_copy, report.copy.results):
+            if copied.ok:
+                manifest.record(source, relative)
+                report.copied.append(source)
+            else:
+                print(f"Error copying {source}: {copied.error}")
+                manifest.forget(relative)
+                report.failed.append(source)
+
+        if report.copied or report.failed or report.evicted:
+            manifest.save()
+        report.thumbnails = self._send_thumbnails(thumbnails, set(report.copied), kobo_books_dir)
+        return report
+
+    def _send_thumbnails(self, pending, copied: set, kobo_books_dir: Path) -> Optional[CopyReport]:
+        """Copy the rendered thumbnails of the books that made it to the device"""
+        try:
+            thumbnails = [t for t in pending.result() if t.source in copied]
+        except Exception as e:
+            print(f"Error generating thumbnails: {e}")
+            return None
+        if not thumbnails:
+            return None
+        items = [(t.host_path, kobo_books_dir / t.device_path) for t in thumbnails]
+        try:
+            for directory in {dest.parent for _, dest in items}:
+                directory.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print(f"Error creating thumbnail directories: {e}")
+            return None
+        return self.copy_engine.copy(items)
 
-        return sent_count
+    def _book_metadata(self, path: Path) -> Optional[BookMetadata]:
+        try:
+            return self.metadata_cache.get(path)
+        except OSError:
+            return None
+
+    def _on_device(self, index: DeviceIndex, source: Path, relative: str) -> bool:
+        """Whether the device already holds this book under another filename"""
+        metadata = self._book_metadata(source)
+        if metadata is None:
+            return False
+        match = index.find(title=metadata.title, author=metadata.author, isbn=metadata.isbn)
+        return match is not None and match.path != relative
+
+    def device_index(self, device: DeviceInfo) -> Optional[DeviceIndex]:
+        """Index of the books in the device database, rebuilt only when it changes"""
+        root = Path(device.path)
+        stamp = device_db_stamp(root)
+        if stamp is None:
+            return None
+        cached = self._device_indexes.get(device.path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        try:
+            with KoboDatabase(root) as db:
+                index = db.index()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error reading Kobo database: {e}")
+            return None
+        self._device_indexes[device.path] = (stamp, index)
+        return index
+
+    def sync_reading_state(self, device: DeviceInfo) -> ReadingSyncReport:
+        """Copy reading progress from the Kobo into Calibre custom columns
+
+        Only books whose status, percent or last-read date changed since the
+        previous sync are written, all in one batched metadata write. The
+        device database is read through the cached device index, so a
+        reconnect without reading progress costs a stat and a dict diff.
+        Does nothing unless KOBO_READING_COLUMNS names the columns.
+        """
+        columns = reading_columns()
+        if columns is None:
+            return ReadingSyncReport(enabled=False)
+        with self.device_locks.hold(device.path):
+            return self._sync_reading_state(device, columns)
+
+    def _sync_reading_state(self, device: DeviceInfo, columns: Tuple[str, str, str]) -> ReadingSyncReport:
+        report = ReadingSyncReport()
+        index = self.device_index(device)
+        library = self.get_library_path()
+        if index is None or library is None:
+            return report
+        state = ReadingSyncState.load(device_id(Path(device.path)), library_id(library))
+        changed = state.changed(index.books)
+        report.changed = len(changed)
+        if not changed:
+            return report
+
+        unknown = [book for book, _ in changed if book.content_id not in state.book_ids]
+        if unknown:
+            try:
+                matcher = LibraryMatcher(self._library_books())
+            except CalibreError as e:
+                print(f"Error listing library for reading sync: {e}")
+                return report
+            for book in unknown:
+                book_id = matcher.match(book)
+                if book_id is not None:
+                    state.book_ids[book.content_id] = book_id
+
+        updates = {}
+        for book, reading in changed:
+            book_id = state.book_ids.get(book.content_id)
+            if book_id is None:
+                # Not in this library; remember it so it is not matched again
+                report.unmatched.append(book.title)
+                state.books[book.content_id] = reading
+                continue
+            updates[book_id] = (book.content_id, reading)
+
+        outcomes = self.write_metadata(
+            [MetadataUpdate(book_id, reading.fields(columns)) for book_id, (_, reading) in updates.items()])
+        for outcome in outcomes:
+            content_id, reading = updates[outcome.book_id]
+            if outcome.ok:
+                state.books[content_id] = reading
+                report.written.append(outcome.book_id)
+            else:
+                print(f"Error writing reading state for book {outcome.book_id}: {outcome.error}")
+                report.failed.append(outcome.book_id)
+        state.save()
+        return report
+
+    def _library_books(self) -> List[dict]:
+        """id, title, authors and isbn of every library book, in one calibredb call"""
+        result = self._run("list", "--for-machine", "--fields", "title,authors,isbn")
+        try:
+            return json.loads(result.stdout or "[]")
+        except ValueError as e:
+            raise CalibreError(f"Unexpected calibredb list output: {e}")
 
     def import_and_send_usb(self, ebooks: List[Ebook]) -> Tuple[int, int]:
         """Import books to Calibre and send to USB-connected Kobo"""
         # First import to Calibre
-        imported_ids = self.import_books(ebooks)
+        imported = self.import_books(ebooks)
+        self.write_back_metadata(imported)
 
         # Check for USB Kobo
         device = self.check_kobo_usb()
         if device:
-            sent = self.send_to_kobo_usb(ebooks, device)
-            return len(imported_ids), sent
+            to_send = self.converter.converted(self.library_copies(imported))
+            report = self.send_to_kobo_usb(to_send, device)
+            return len(imported.book_ids), len(report.copied)
 
-        return len(imported_ids), 0
+        return len(imported.book_ids), 0
 
     def get_content_server_url(self, for_remote: bool = False) -> Optional[str]:
         """Get URL for Calibre content server if running
@@ -179,30 +638,29 @@ class CalibreManager:
             for_remote: If True, return URL with local network IP (for Kobo access)
                        If False, return localhost URL
         """
-        # Default port for Calibre content server
-        ports = [8080, 8180, 8081]
-
-        for port in ports:
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                result = sock.connect_ex(('127.0.0.1', port))
-                sock.close()
-                if result == 0:
-                    if for_remote:
-                        return f"http://{get_local_ip()}:{port}"
-                    return f"http://127.0.0.1:{port}"
-            except:
-                pass
+        if self.managed_server_url():
+            port = self._server.port
+        else:
+            # Only a server that has this library; another library's server won't do
+            port = self.discovery.find_port(self.library_id())
+        if port is None:
+            return None
+        if for_remote:
+            return f"http://{get_local_ip()}:{port}"
+        return f"http://127.0.0.1:{port}"
 
-        return None
+    def library_id(self) -> Optional[str]:
+        """Id of this manager's library in content server URLs"""
+        library = self.get_library_path()
+        return library_id(library) if library else None
 
-    def start_content_server(self, port: int = 8080) -> Tuple[str, str]:
+    def start_content_server(self, port: Optional[int] = None) -> Tuple[str, str]:
         """Start Calibre content server for OPDS access
 
         Returns:
             Tuple of (local_url, network_url)
         """
+        port = port or self.server_port
         if not self.calibre_server:
             raise CalibreError("calibre-server not found")
 
@@ -217,16 +675,31 @@ class CalibreManager:
             raise CalibreError("Calibre library not found")
 
         # Start server in background, listen on all interfaces
+        server = ContentServerSupervisor(
+            [self.calibre_server, str(library_path), "--port", str(port),
+             "--listen-on", "0.0.0.0", "--enable-local-write"],
+            port=port,
+            on_change=self.discovery.invalidate,
+        )
         try:
-            self._server_process = subprocess.Popen(
-                [self.calibre_server, str(library_path), "--port", str(port), "--listen-on", "0.0.0.0"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            local_ip = get_local_ip()
-            return f"http://127.0.0.1:{port}", f"http://{local_ip}:{port}"
-        except Exception as e:
+            server.start()
+        except (OSError, ServerStartError) as e:
             raise CalibreError(f"Failed to start content server: {e}")
+        if self._server is None:
+            atexit.register(self.stop_content_server)
+        self._server = server
+        local_ip = get_local_ip()
+        return f"http://127.0.0.1:{port}", f"http://{local_ip}:{port}"
+
+    def stop_content_server(self):
+        """Stop the content server started by this manager, if any"""
+        if self._server is not None:
+            self._server.stop()
+            self.discovery.invalidate()
+
+    def content_server_logs(self) -> List[str]:
+        """Recent output of the content server started by this manager"""
+        return self._server.logs() if self._server else []
 
     def get_opds_url(self, for_remote: bool = True) -> str:
         """Get OPDS feed URL for Kobo browser access
@@ -236,7 +709,7 @@ class CalibreManager:
         """
         server_url = self.get_content_server_url(for_remote=for_remote)
         if server_url:
-            return f"{server_url}/opds"
+            return f"{server_url}{opds_path(self.library_id())}"
         return ""
 
     def send_to_device(self, ebooks: List[Ebook]) -> dict:
@@ -247,22 +720,41 @@ class CalibreManager:
         result = {
             "imported": 0,
             "sent_usb": 0,
+            "skipped_usb": 0,
+            "no_space_usb": 0,
+            "reading_synced": 0,
+            "metadata_updated": 0,
             "kobo_connected": False,
             "opds_url": "",
             "local_ip": get_local_ip(),
             "message": ""
         }
 
-        # Import books first
-        imported_ids = self.import_books(ebooks)
-        result["imported"] = len(imported_ids)
+        # Import books first, with their cleaned-up metadata
+        imported = self.import_books(ebooks)
+        result["imported"] = len(imported.book_ids)
+        result["import_result"] = imported
+        written = self.write_back_metadata(imported)
+        result["metadata_updated"] = sum(1 for outcome in written if outcome.ok)
 
         # Check for USB Kobo
         device = self.check_kobo_usb()
         if device:
             result["kobo_connected"] = True
-            result["sent_usb"] = self.send_to_kobo_usb(ebooks, device)
+            to_send = self.converter.converted(self.library_copies(imported))
+            report = self.send_to_kobo_usb(to_send, device)
+            result["sent_usb"] = len(report.copied)
+            result["skipped_usb"] = len(report.skipped) + len(report.on_device)
+            result["no_space_usb"] = len(report.no_space)
             result["message"] = f"Inviati {result['sent_usb']} ebook al Kobo ({device.name}) via USB"
+            if result["skipped_usb"]:
+                result["message"] += f", {result['skipped_usb']} già presenti"
+            if report.evicted and report.evicted.removed:
+                result["message"] += f", {len(report.evicted.removed)} libri letti rimossi"
+            if report.no_space:
+                result["message"] += f", {len(report.no_space)} esclusi per spazio insufficiente"
+            reading = self.sync_reading_state(device)
+            result["reading_synced"] = len(reading.written)
             return result
 
         # No USB, check/start content server for OPDS
@@ -274,7 +766,7 @@ class CalibreManager:
             # Try to start server
             try:
                 local_url, network_url = self.start_content_server()
-                result["opds_url"] = f"{network_url}/opds"
+                result["opds_url"] = f"{network_url}{opds_path(self.library_id())}"
                 result["message"] = f"Server avviato. Accedi da Kobo browser: {result['opds_url']}"
             except:
                 result["message"] = (
@@ -0,0 +1,171 @@
+"""KEPUB/EPUB conversion with a content-addressed output cache"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Set
+
+from src.core.cache import cache_root, file_hasher
+from src.core.executor import CalibreExecutor, CommandTimeout
+from src.core.scanner import Ebook
+
+
+# Kobo renders KEPUBs natively, which gives faster page turns than plain EPUB
+KEPUB = "kepub"
+EPUB = "epub"
+
+
+def output_name(source: Path, target: str) -> str:
+    """File name the converted book is sent under"""
+    if target == KEPUB:
+        return f"{source.stem}.kepub.epub"
+    return f"{source.stem}.{target}"
+
+
+@dataclass
+class Conversion:
+    """Outcome of converting one ebook"""
+    source: Path
+    output: Path
+    cached: bool = False
+    seconds: float = 0.0
+    error: str = ""
+
+
+class EbookConverter:
+    """Converts ebooks with ebook-convert, caching outputs by content hash
+
+    Conversions run in parallel, one ebook-convert process per core. An
+    output is stored under the hash of the source file and the conversion
+    options, so converting the same book again is a cache lookup. Sources
+    that are already in the target format (or that fail to convert) are
+    passed through unchanged.
+    """
+
+    def __init__(self, ebook_convert: Optional[str], cache_dir: Optional[Path] = None,
+                 target: str = KEPUB, options: Sequence[str] = (),
+                 max_workers: Optional[int] = None, timeout: float = 600.0):
+        self.ebook_convert = ebook_convert
+        self.cache_dir = Path(cache_dir or cache_root() / "convert")
+        self.target = target
+        self.options = tuple(options)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = CalibreExecutor(max_processes=self.max_workers, timeout=timeout, retries=0)
+        # Cache paths whose conversion failed, so they are not retried every send
+        self._failed: Set[Path] = set()
+        # Sources queued by convert_in_background and not converted yet
+        self._queued: Set[Path] = set()
+        self._lock = threading.Lock()
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="convert")
+
+    def needs_conversion(self, source: Path) -> bool:
+        if self.ebook_convert is None:
+            return False
+        name = source.name.lower()
+        if self.target == KEPUB:
+            return name.endswith(".epub") and not name.endswith(".kepub.epub")
+        return source.suffix.lower() != f".{self.target}"
+
+    def convert(self, ebooks: List[Ebook]) -> List[Conversion]:
+        """Convert ebooks in parallel; results are in input order"""
+        if not ebooks:
+            return []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(self.convert_one, [ebook.path for ebook in ebooks]))
+
+    def converted(self, ebooks: List[Ebook]) -> List[Ebook]:
+        """Ebooks to send: converted outputs, or the sources where not converted"""
+        return [Ebook(path=conversion.output) for conversion in self.convert(ebooks)]
+
+    def cached_output(self, source: Path) -> Path:
+        """File to serve for a source right now, without converting
+
+        The cached conversion if there is one, else the source itself.
+        """
+        if not self.needs_conversion(source):
+            return source
+        try:
+            output = self.cache_path(source)
+        except OSError:
+            return source
+        return output if output.exists() else source
+
+    def convert_in_background(self, source: Path) -> Optional[Future]:
+        """Queue a conversion so a later cached_output finds it ready
+
+        Returns None if there is nothing to convert or it is already queued.
+        """
+        if not self.needs_conversion(source):
+            return None
+        with self._lock:
+            if source in self._queued:
+                return None
+            self._queued.add(source)
+        return self._background.submit(self._convert_queued, source)
+
+    def _convert_queued(self, source: Path):
+        try:
+            conversion = self.convert_one(source)
+            # A cached failure was already reported when it happened
+            if conversion.error and not conversion.cached:
+                print(f"Error converting {source.name}: {conversion.error}")
+        finally:
+            with self._lock:
+                self._queued.discard(source)
+
+    def convert_one(self, source: Path) -> Conversion:
+        if not self.needs_conversion(source):
+            return Conversion(source, source)
+
+        start = time.perf_counter()
+        try:
+            output = self.cache_path(source)
+        except OSError as e:
+            return Conversion(source, source, error=str(e))
+        if output.exists():
+            return Conversion(source, output, cached=True, seconds=time.perf_counter() - start)
+        if output in self._failed:
+            return Conversion(source, source, cached=True, error="conversion failed previously")
+
+        try:
+            output.parent.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            return Conversion(source, source, error=str(e))
+        # ebook-convert picks the output format from the extension
+        with tempfile.TemporaryDirectory(dir=output.parent) as tmp:
+            partial = Path(tmp) / f"{source.stem}.{self.target}"
+            try:
+                result = self.executor.run(
+                    [self.ebook_convert, str(source), str(partial), *self.options])
+            except CommandTimeout as e:
+                self._failed.add(output)
+                return Conversion(source, source, seconds=time.perf_counter() - start, error=str(e))
+            if result.returncode != 0 or not partial.exists():
+                self._failed.add(output)
+                error = (result.stderr or result.stdout or "").strip().splitlines()[-1:] or ["failed"]
+                return Conversion(source, source, seconds=time.perf_counter() - start, error=error[0])
+            os.replace(partial, output)
+
+        return Conversion(source, output, seconds=time.perf_counter() - start)
+
+    def cache_path(self, source: Path) -> Path:
+        """Cache location for a source under the current target and options"""
+        key = hashlib.sha256()
+        key.update(file_hasher.digest(source).encode())
+        key.update(self.target.encode())
+        for option in self.options:
+            key.update(b"\0" + option.encode())
+        digest = key.hexdigest()
+        return self.cache_dir / digest[:2] / digest / output_name(source, self.target)
+
+    def clear_cache(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self._failed.clear()
@@ -0,0 +1,205 @@
+"""Kobo detection from the mount table, cached between plug events"""
+
+from __future__ import annotations
+
+import os
+import select
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# Mount table to read instead of /proc/self/mountinfo (tests, containers)
+MOUNT_TABLE_ENV_VAR = "KOBO_MOUNT_TABLE"
+
+PROC_MOUNTINFO = Path("/proc/self/mountinfo")
+
+# Where macOS mounts volumes when there is no /proc
+MACOS_VOLUMES = Path("/Volumes")
+
+# Filesystems a Kobo's USB storage shows up as
+REMOVABLE_FILESYSTEMS = {"vfat", "msdos", "exfat", "fuseblk", "fuse.exfat", "fuse.fuseblk"}
+
+
+@dataclass
+class Mount:
+    """One mount table entry"""
+    mount_point: Path
+    fstype: str
+    source: str
+
+
+def unescape(field: str) -> str:
+    """Undo the octal escapes (\\040 for space...) used in mount tables"""
+    if "\\" not in field:
+        return field
+    out, i = [], 0
+    while i < len(field):
+        if field[i] == "\\" and field[i + 1:i + 4].isdigit():
+            out.append(chr(int(field[i + 1:i + 4], 8)))
+            i += 4
+        else:
+            out.append(field[i])
+            i += 1
+    return "".join(out)
+
+
+def parse_mountinfo(text: str) -> List[Mount]:
+    """Parse /proc/<pid>/mountinfo content
+
+    Each line is ``id parent major:minor root mount-point options
+    [optional fields...] - fstype source super-options``.
+    """
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split()
+        try:
+            separator = fields.index("-", 6)
+            mounts.append(Mount(
+                mount_point=Path(unescape(fields[4])),
+                fstype=fields[separator + 1],
+                source=unescape(fields[separator + 2]),
+            ))
+        except (ValueError, IndexError):
+            continue
+    return mounts
+
+
+class MountTable:
+    """A mount table file that can tell whether it changed since the last read
+
+    /proc mount tables report changes through poll(): the file descriptor
+    raises POLLPRI after a mount or unmount until it is read again. Plain
+    files (tests) are compared by size and mtime instead.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._fd: Optional[int] = None
+        self._poll = None
+        self._stamp = None
+        if str(self.path).startswith("/proc/") and hasattr(select, "poll"):
+            self._fd = os.open(self.path, os.O_RDONLY)
+            self._poll = select.poll()
+            self._poll.register(self._fd, select.POLLPRI | select.POLLERR)
+
+    def changed(self) -> bool:
+        if self._poll is not None:
+            return bool(self._poll.poll(0))
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return self._stamp is not None
+        return (stat.st_size, stat.st_mtime_ns) != self._stamp
+
+    def read(self) -> List[Mount]:
+        if self._fd is not None:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            chunks = []
+            while True:
+                chunk = os.read(self._fd, 65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return parse_mountinfo(b"".join(chunks).decode(errors="replace"))
+        try:
+            stat = self.path.stat()
+            self._stamp = (stat.st_size, stat.st_mtime_ns)
+            return parse_mountinfo(self.path.read_text(errors="replace"))
+        except OSError:
+            self._stamp = None
+            return []
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._poll = None
+
+
+def is_kobo(mount_point: Path) -> bool:
+    return (mount_point / ".kobo").is_dir()
+
+
+class KoboDetector:
+    """Finds a mounted Kobo, re-checking only when the mounts change
+
+    On Linux the mount table (KOBO_MOUNT_TABLE or /proc/self/mountinfo) is
+    parsed and removable filesystems with a .kobo directory are taken as
+    Kobos. Elsewhere /Volumes is scanned and its mtime, which changes when
+    a volume is mounted or ejected, stands in for the change notification.
+    Between changes ``find`` returns the cached result without any I/O
+    beyond one poll or stat.
+    """
+
+    def __init__(self, mount_table: Optional[Path] = None, volumes: Path = MACOS_VOLUMES):
+        configured = mount_table or os.environ.get(MOUNT_TABLE_ENV_VAR)
+        if configured:
+            table = Path(configured)
+        elif PROC_MOUNTINFO.exists():
+            table = PROC_MOUNTINFO
+        else:
+            table = None
+        self._table = MountTable(table) if table else None
+        self.volumes = volumes
+        self._lock = threading.Lock()
+        self._volumes_stamp = None
+        self._loaded = False
+        self._device: Optional[Path] = None
+
+    def find(self) -> Optional[Path]:
+        """Mount point of the connected Kobo, or None"""
+        with self._lock:
+            if not self._loaded or self._changed():
+                self._device = self._scan()
+                self._loaded = True
+            return self._device
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def _changed(self) -> bool:
+        if self._table is not None:
+            return self._table.changed()
+        return self._stat_volumes() != self._volumes_stamp
+
+    def _stat_volumes(self):
+        try:
+            return self.volumes.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self) -> Optional[Path]:
+        if self._table is not None:
+            for mount in self._table.read():
+                if mount.fstype in REMOVABLE_FILESYSTEMS and is_kobo(mount.mount_point):
+                    return mount.mount_point
+            return None
+
+        self._volumes_stamp = self._stat_volumes()
+        if self._volumes_stamp is None:
+            return None
+        for volume in self.volumes.iterdir():
+            if volume.is_dir() and is_kobo(volume):
+                return volume
+        return None
+
+
+class DeviceLocks:
+    """One lock per mounted device, so only one send or sync touches it at a time
+
+    Shared by every library of a registry: their writer threads run in
+    parallel, but copies, evictions and manifest updates on the same Kobo
+    must not interleave. Locks are re-entrant.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, threading.RLock] = {}
+        self._lock = threading.Lock()
+
+    def hold(self, device_path: str) -> threading.RLock:
+        key = os.path.realpath(device_path)
+        with self._lock:
+            return self._locks.setdefault(key, threading.RLock())
@@ -0,0 +1,135 @@
+"""Freeing device space by removing books that have been read"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Collection, List, Optional
+
+from src.core.kobo_db import FINISHED, DeviceBook, DeviceIndex, remove_books
+from src.core.planner import on_disk_size
+from src.core.thumbnails import thumbnail_paths
+
+
+# Set to 1 to let finished books be removed when a send needs space
+EVICT_FINISHED_ENV_VAR = "KOBO_EVICT_FINISHED"
+
+# Books last opened more than this many days ago may be removed too
+EVICT_DAYS_ENV_VAR = "KOBO_EVICT_DAYS"
+
+
+def last_read(book: DeviceBook) -> Optional[datetime]:
+    """DateLastRead as a naive UTC datetime ("2024-05-01T20:15:00Z" and variants)"""
+    try:
+        return datetime.fromisoformat(book.date_last_read[:19])
+    except ValueError:
+        return None
+
+
+@dataclass
+class Eviction:
+    """A book chosen for removal, with the space it frees"""
+    book: DeviceBook
+    path: str
+    size: int
+
+
+@dataclass
+class EvictionReport:
+    """What an eviction pass removed"""
+    removed: List[Eviction] = field(default_factory=list)
+    failed: List[Eviction] = field(default_factory=list)
+    rows: int = 0
+
+    @property
+    def bytes(self) -> int:
+        return sum(e.size for e in self.removed)
+
+
+class EvictionPolicy:
+    """Picks sideloaded books to remove when a send does not fit
+
+    A book is eligible if it is finished (with ``finished``) or was last
+    opened more than ``days`` days ago; books never opened are kept. Finished
+    books go first, then the least recently read, until the requested space
+    is covered. Nothing is eligible unless one of the two is configured.
+    """
+
+    def __init__(self, finished: Optional[bool] = None, days: Optional[int] = None):
+        if finished is None:
+            finished = os.environ.get(EVICT_FINISHED_ENV_VAR, "0") == "1"
+        if days is None:
+            value = os.environ.get(EVICT_DAYS_ENV_VAR, "")
+            days = int(value) if value.isdigit() else None
+        self.finished = finished
+        self.days = days
+
+    @property
+    def enabled(self) -> bool:
+        return self.finished or self.days is not None
+
+    def eligible(self, book: DeviceBook, now: datetime) -> bool:
+        if self.finished and book.read_status == FINISHED:
+            return True
+        opened = last_read(book)
+        return self.days is not None and opened is not None and now - opened > timedelta(days=self.days)
+
+    def choose(self, index: DeviceIndex, device_root: Path, needed: int,
+               keep: Collection[str] = (), now: Optional[datetime] = None) -> List[Eviction]:
+        """Books to remove to free at least ``needed`` bytes (or as much as allowed)"""
+        if not self.enabled or needed <= 0:
+            return []
+        # Naive UTC, to compare with last_read()
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        try:
+            block_size = os.statvfs(device_root).f_frsize
+        except (AttributeError, OSError):
+            block_size = 0
+
+        keep = {path.casefold() for path in keep}
+        candidates = []
+        for book in index.books:
+            if not book.path or book.path.casefold() in keep or not self.eligible(book, now):
+                continue
+            try:
+                size = (Path(device_root) / book.path).stat().st_size
+            except OSError:
+                continue
+            candidates.append(Eviction(book, book.path, on_disk_size(size, block_size)))
+        candidates.sort(key=lambda e: (e.book.read_status != FINISHED, last_read(e.book) or now, e.path))
+
+        chosen, freed = [], 0
+        for candidate in candidates:
+            if freed >= needed:
+                break
+            chosen.append(candidate)
+            freed += candidate.size
+        return chosen
+
+
+def evict(device_root: Path, evictions: List[Eviction]) -> EvictionReport:
+    """Remove books, their thumbnails and their database rows in one pass"""
+    report = EvictionReport()
+    root = Path(device_root)
+    for eviction in evictions:
+        try:
+            (root / eviction.path).unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Error removing {eviction.path} from the Kobo: {e}")
+            report.failed.append(eviction)
+            continue
+        for thumbnail in thumbnail_paths(eviction.path).values():
+            try:
+                (root / thumbnail).unlink(missing_ok=True)
+            except OSError:
+                pass
+        report.removed.append(eviction)
+    try:
+        report.rows = remove_books(root, [e.book.content_id for e in report.removed])
+    except (OSError, sqlite3.Error) as e:
+        # The Kobo drops rows for missing files itself on its next scan
+        print(f"Error cleaning up the Kobo database: {e}")
+    return report
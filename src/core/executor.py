@@ -0,0 +1,130 @@
+"""Bounded subprocess executor for calibre command-line tools"""
+
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+# Substrings (lowercased) of calibre errors caused by another process holding the library
+LOCK_ERRORS = (
+    "database is locked",
+    "another calibre program",
+    "lock file",
+)
+
+DEFAULT_MAX_PROCESSES = 2
+DEFAULT_TIMEOUT = 120.0
+
+
+class CommandTimeout(Exception):
+    """Raised when a command exceeds its timeout and has been killed"""
+    pass
+
+
+@dataclass
+class ExecutorMetrics:
+    """Snapshot of executor activity"""
+    queued: int = 0
+    running: int = 0
+    max_queued: int = 0
+    completed: int = 0
+    timeouts: int = 0
+    retries: int = 0
+
+
+class CalibreExecutor:
+    """Runs calibre tools with a concurrency cap, timeouts and lock retries
+
+    At most ``max_processes`` commands run at once; callers beyond that wait
+    in line. A command that outlives its timeout is killed together with its
+    whole process group. Failures that look like library lock contention are
+    retried with exponential backoff, releasing the slot while waiting.
+    """
+
+    def __init__(self, max_processes: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 retries: int = 3, backoff: float = 0.5):
+        self.max_processes = max_processes or int(
+            os.environ.get("CALIBRE_MAX_PROCESSES", DEFAULT_MAX_PROCESSES))
+        self.timeout = timeout or float(os.environ.get("CALIBRE_TIMEOUT", DEFAULT_TIMEOUT))
+        self.retries = retries
+        self.backoff = backoff
+        self._slots = threading.BoundedSemaphore(self.max_processes)
+        self._lock = threading.Lock()
+        self._metrics = ExecutorMetrics()
+
+    def run(self, cmd: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a command, returning its completed process
+
+        Raises:
+            CommandTimeout: if the command did not finish within the timeout
+        """
+        for attempt in range(self.retries + 1):
+            result = self._run_in_slot(cmd, timeout or self.timeout)
+            if attempt == self.retries or not self.is_lock_error(result):
+                return result
+            with self._lock:
+                self._metrics.retries += 1
+            time.sleep(self.backoff * (2 ** attempt))
+        return result
+
+    @staticmethod
+    def is_lock_error(result: subprocess.CompletedProcess) -> bool:
+        if result.returncode == 0:
+            return False
+        stderr = (result.stderr or "").lower()
+        return any(message in stderr for message in LOCK_ERRORS)
+
+    def metrics(self) -> ExecutorMetrics:
+        """Return a copy of the current metrics"""
+        with self._lock:
+            return ExecutorMetrics(**vars(self._metrics))
+
+    def _run_in_slot(self, cmd: List[str], timeout: float) -> subprocess.CompletedProcess:
+        with self._lock:
+            self._metrics.queued += 1
+            self._metrics.max_queued = max(self._metrics.max_queued, self._metrics.queued)
+        self._slots.acquire()
+        with self._lock:
+            self._metrics.queued -= 1
+            self._metrics.running += 1
+        try:
+            return self._run_once(cmd, timeout)
+        finally:
+            with self._lock:
+                self._metrics.running -= 1
+                self._metrics.completed += 1
+            self._slots.release()
+
+    def _run_once(self, cmd: List[str], timeout: float) -> subprocess.CompletedProcess:
+        # A new session makes the command the leader of its own process group,
+        # so children it spawns (calibre forks helpers) are killed with it.
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self._kill_group(process)
+            process.communicate()
+            with self._lock:
+                self._metrics.timeouts += 1
+            raise CommandTimeout(f"{cmd[0]} timed out after {timeout:.0f}s")
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+    @staticmethod
+    def _kill_group(process: subprocess.Popen):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
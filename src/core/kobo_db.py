@@ -0,0 +1,197 @@
+"""Read-only access to a Kobo's KoboReader.sqlite"""
+
+from __future__ import annotations
+
+import re
+import shutil
+import sqlite3
+import tempfile
+import unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+DEVICE_DB = Path(".kobo") / "KoboReader.sqlite"
+
+# ContentID prefix of sideloaded books; the rest is the path on the volume
+ONBOARD_PREFIX = "file:///mnt/onboard/"
+
+# content.ContentType of a book (chapters and other rows use other types)
+BOOK_CONTENT_TYPE = 6
+
+# content.ReadStatus values
+UNREAD = 0
+READING = 1
+FINISHED = 2
+
+
+def normalise(text: Optional[str]) -> str:
+    """Casefolded text without accents, punctuation or repeated spaces"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text.casefold())
+    return " ".join(text.split())
+
+
+def normalise_isbn(value: Optional[str]) -> str:
+    return re.sub(r"[^0-9X]", "", (value or "").upper())
+
+
+@dataclass
+class DeviceBook:
+    """A book row from the device database"""
+    content_id: str
+    title: str
+    author: str
+    isbn: str = ""
+    read_status: int = UNREAD
+    percent_read: float = 0.0
+    date_last_read: str = ""
+    file_size: int = 0
+
+    @property
+    def path(self) -> Optional[str]:
+        """Path relative to the volume root for sideloaded books, else None"""
+        if self.content_id.startswith(ONBOARD_PREFIX):
+            return self.content_id[len(ONBOARD_PREFIX):]
+        return None
+
+
+@dataclass
+class DeviceIndex:
+    """On-device books indexed by path, ISBN and (title, author)"""
+    books: List[DeviceBook] = field(default_factory=list)
+    by_path: Dict[str, DeviceBook] = field(default_factory=dict)
+    by_isbn: Dict[str, DeviceBook] = field(default_factory=dict)
+    by_title_author: Dict[tuple, DeviceBook] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, books: List[DeviceBook]) -> "DeviceIndex":
+        index = cls(books=books)
+        for book in books:
+            if book.path:
+                index.by_path[book.path.casefold()] = book
+            isbn = normalise_isbn(book.isbn)
+            if isbn:
+                index.by_isbn[isbn] = book
+            key = (normalise(book.title), normalise(book.author))
+            if key[0]:
+                index.by_title_author[key] = book
+        return index
+
+    def find(self, title: Optional[str] = None, author: Optional[str] = None,
+             isbn: Optional[str] = None, path: Optional[str] = None) -> Optional[DeviceBook]:
+        """Find a book by path, then ISBN, then title and author"""
+        if path and path.casefold() in self.by_path:
+            return self.by_path[path.casefold()]
+        isbn = normalise_isbn(isbn)
+        if isbn and isbn in self.by_isbn:
+            return self.by_isbn[isbn]
+        if title:
+            return self.by_title_author.get((normalise(title), normalise(author)))
+        return None
+
+
+class KoboDatabase:
+    """Snapshot of KoboReader.sqlite, opened on a temporary copy
+
+    The Kobo writes to its database while mounted; copying it first (with
+    any WAL file) means this app never holds a lock on the device's file.
+    """
+
+    def __init__(self, device_root: Path):
+        self.device_root = Path(device_root)
+        self._tmp = tempfile.TemporaryDirectory(prefix="kobo-db-")
+        source = self.device_root / DEVICE_DB
+        copy = Path(self._tmp.name) / source.name
+        shutil.copyfile(source, copy)
+        for suffix in ("-wal", "-shm"):
+            extra = source.with_name(source.name + suffix)
+            if extra.exists():
+                shutil.copyfile(extra, copy.with_name(copy.name + suffix))
+        self.conn = sqlite3.connect(str(copy))
+
+    def __enter__(self) -> "KoboDatabase":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+        self._tmp.cleanup()
+
+    def books(self) -> List[DeviceBook]:
+        rows = self.conn.execute(
+            "SELECT ContentID, Title, Attribution, ISBN, ReadStatus, ___PercentRead, "
+            "DateLastRead, ___FileSize FROM content WHERE ContentType = ?",
+            (BOOK_CONTENT_TYPE,),
+        )
+        return [
+            DeviceBook(
+                content_id=content_id,
+                title=title or "",
+                author=author or "",
+                isbn=isbn or "",
+                read_status=read_status or UNREAD,
+                percent_read=float(percent or 0),
+                date_last_read=last_read or "",
+                file_size=size or 0,
+            )
+            for content_id, title, author, isbn, read_status, percent, last_read, size in rows
+        ]
+
+    def index(self) -> DeviceIndex:
+        return DeviceIndex.build(self.books())
+
+
+# Tables holding per-book rows, and the column naming the book
+BOOK_TABLES = (
+    ("content", "ContentID"),
+    ("content", "BookID"),
+    ("ShelfContent", "ContentId"),
+    ("Bookmark", "VolumeID"),
+    ("volume_shortcovers", "volumeId"),
+    ("content_keys", "volumeId"),
+)
+
+
+def remove_books(device_root: Path, content_ids: List[str]) -> int:
+    """Delete the rows of these books from the device database in one transaction
+
+    Unlike KoboDatabase this writes to the device's own file, so it is only
+    used while the Kobo is mounted for a sync. Tables missing from older
+    firmware are skipped. Returns the number of rows deleted.
+    """
+    if not content_ids:
+        return 0
+    conn = sqlite3.connect(str(Path(device_root) / DEVICE_DB), timeout=30)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        deleted = 0
+        with conn:
+            for table, column in BOOK_TABLES:
+                if table in tables:
+                    cursor = conn.executemany(f"DELETE FROM {table} WHERE {column} = ?",
+                                              [(content_id,) for content_id in content_ids])
+                    deleted += cursor.rowcount
+        return deleted
+    finally:
+        conn.close()
+
+
+def device_db_stamp(device_root: Path) -> Optional[tuple]:
+    """Size and mtime of the device database and WAL, or None if absent"""
+    stamp = []
+    for name in (DEVICE_DB.name, DEVICE_DB.name + "-wal"):
+        try:
+            stat = (Path(device_root) / DEVICE_DB.parent / name).stat()
+            stamp.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            if name == DEVICE_DB.name:
+                return None
+            stamp.append(None)
+    return tuple(stamp)
@@ -0,0 +1,139 @@
+"""Where books go on the device: path templates, FAT32-safe names, collisions"""
+
+from __future__ import annotations
+
+import os
+import posixpath
+import re
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.core.metadata import BookMetadata
+from src.core.writeback import author_sort
+
+
+# Template for paths on the device, e.g. "{author}/{title}"; the file
+# extension is always taken from the book being sent
+LAYOUT_ENV_VAR = "KOBO_LAYOUT"
+
+# Every book in the volume root, named as in the library (the old behaviour)
+FLAT_LAYOUT = "{filename}"
+
+# Characters FAT32 does not allow in names
+FAT_FORBIDDEN = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+FAT_RESERVED = {"CON", "PRN", "AUX", "NUL", *(f"COM{i}" for i in range(1, 10)),
+                *(f"LPT{i}" for i in range(1, 10))}
+
+# Per path component; well under FAT32's 255, leaving room for the
+# extension and the Kobo's own path handling
+MAX_COMPONENT = 120
+
+UNKNOWN = "Sconosciuto"
+
+
+def book_extension(path: Path) -> str:
+    """Extension including compound ones such as .kepub.epub"""
+    name = path.name.lower()
+    if name.endswith(".kepub.epub"):
+        return path.name[-len(".kepub.epub"):]
+    return path.suffix
+
+
+def book_stem(path: Path) -> str:
+    return path.name[:len(path.name) - len(book_extension(path))]
+
+
+def sanitise_component(name: str, limit: int = MAX_COMPONENT) -> str:
+    """A single path component that FAT32 and the Kobo accept"""
+    name = FAT_FORBIDDEN.sub("_", name)
+    name = " ".join(name.split())[:limit].rstrip(" .")
+    if not name:
+        return UNKNOWN
+    if name.split(".")[0].upper() in FAT_RESERVED:
+        name = f"{name}_"
+    return name
+
+
+class DeviceLayout:
+    """Maps books to paths on the device from a template
+
+    Template fields are {title}, {author}, {author_sort}, {series},
+    {series_index} and {filename} (the library file name without
+    extension); "/" separates directories. Each component is sanitised for
+    FAT32. Books that would land on the same path (FAT32 compares names
+    case-insensitively) get " (2)", " (3)"... in source path order, so the
+    same batch always produces the same names.
+    """
+
+    def __init__(self, template: Optional[str] = None):
+        self.template = (template or os.environ.get(LAYOUT_ENV_VAR) or FLAT_LAYOUT).strip("/")
+
+    @property
+    def flat(self) -> bool:
+        return self.template == FLAT_LAYOUT
+
+    def relative_path(self, path: Path, metadata: Optional[BookMetadata]) -> str:
+        values = {
+            "filename": book_stem(path),
+            "title": book_stem(path),
+            "author": UNKNOWN,
+            "author_sort": UNKNOWN,
+            "series": "",
+            "series_index": "",
+        }
+        if metadata is not None:
+            if metadata.title:
+                values["title"] = metadata.title
+            if metadata.author:
+                values["author"] = metadata.author
+                values["author_sort"] = metadata.author_sort or author_sort(metadata.author)
+            if metadata.series:
+                values["series"] = metadata.series
+                if metadata.series_index is not None:
+                    values["series_index"] = f"{metadata.series_index:g}"
+        # Split the template before filling it in, so a "/" inside a title
+        # or author ("Either/Or") can't create directories
+        try:
+            rendered = [part.format(**values) for part in self.template.split("/")]
+        except (KeyError, IndexError, ValueError):
+            rendered = [values["filename"]]
+        components = [sanitise_component(part) for part in rendered if part.strip()]
+        components = components or [sanitise_component(values["filename"])]
+        return posixpath.join(*components) + book_extension(path)
+
+    def assign(self, paths: List[Path], metadata: Callable[[Path], Optional[BookMetadata]],
+               taken: Callable[[Path, str], bool] = lambda path, relative: False) -> List[Tuple[Path, str]]:
+        """(source, relative destination) pairs for a batch, in input order
+
+        ``taken(source, relative)`` tells whether a path is already used on
+        the device by something other than this source.
+        """
+        wanted: Dict[Path, str] = {}
+        for path in paths:
+            wanted[path] = path.name if self.flat else self.relative_path(path, metadata(path))
+
+        assigned: Dict[Path, str] = {}
+        used: Set[str] = set()
+        for path in sorted(wanted, key=str):
+            relative = wanted[path]
+            extension = book_extension(Path(relative))
+            stem = relative[:len(relative) - len(extension)]
+            n = 1
+            while relative.casefold() in used or taken(path, relative):
+                n += 1
+                relative = f"{stem} ({n}){extension}"
+            used.add(relative.casefold())
+            assigned[path] = relative
+        return [(path, assigned[path]) for path in paths]
+
+
+def directories(relatives: Iterable[str]) -> List[str]:
+    """Directories a batch of relative paths needs, parents first"""
+    needed = set()
+    for relative in relatives:
+        parent = posixpath.dirname(relative)
+        while parent and parent not in needed:
+            needed.add(parent)
+            parent = posixpath.dirname(parent)
+    return sorted(needed, key=lambda d: (d.count("/"), d))
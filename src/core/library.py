@@ -0,0 +1,146 @@
+"""Registry of Calibre libraries, each with its own cache and writer queue"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from src.core.calibre import CalibreError, CalibreManager, ImportResult
+from src.core.changes import BookChange
+from src.core.detect import DeviceLocks
+from src.core.executor import CalibreExecutor
+from src.core.scanner import Ebook
+from src.core.server import CANDIDATE_PORTS, DEFAULT_SERVER_PORT, ContentServerDiscovery
+
+
+# name=path pairs separated by os.pathsep, e.g. "it=/srv/libri:en=/srv/books"
+LIBRARIES_ENV_VAR = "CALIBRE_LIBRARIES"
+
+DEFAULT_LIBRARY = "default"
+
+
+def parse_libraries(value: str) -> Dict[str, str]:
+    """Parse the CALIBRE_LIBRARIES format into an ordered name -> path dict"""
+    libraries = {}
+    for entry in value.split(os.pathsep):
+        name, sep, path = entry.partition("=")
+        if not entry.strip():
+            continue
+        if not sep or not name.strip() or not path.strip():
+            raise CalibreError(f"Invalid {LIBRARIES_ENV_VAR} entry: {entry!r} (expected name=path)")
+        libraries[name.strip()] = path.strip()
+    return libraries
+
+
+class Library:
+    """One Calibre library with its manager, book index, metadata cache and writer
+
+    Calibre libraries cannot take concurrent writes, so every write goes
+    through a single-threaded queue owned by the library. Reads are not
+    queued, and writes to different libraries proceed in parallel; USB
+    sends from different libraries still take turns on the same device.
+    """
+
+    def __init__(self, name: str, manager: CalibreManager):
+        self.name = name
+        self.manager = manager
+        self.metadata = manager.metadata_cache
+        self.books: Dict[int, BookChange] = {}
+        self._index_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"calibre-{name}")
+
+    @property
+    def path(self) -> Optional[Path]:
+        return self.manager.get_library_path()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue a write operation for this library; the book index is refreshed after it"""
+        def write():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.refresh_index()
+        return self._writer.submit(write)
+
+    def import_books(self, ebooks: List[Ebook]) -> Future:
+        """Queue an import; the future resolves to an ImportResult"""
+        return self.submit(self.manager.import_books, ebooks)
+
+    def refresh_index(self) -> bool:
+        """Apply library changes to the book index; returns True if anything changed"""
+        path = self.path
+        if path is None or not (path / "metadata.db").exists():
+            return False
+        with self._index_lock:
+            try:
+                changes = self.manager.change_feed().poll()
+            except (CalibreError, sqlite3.Error) as e:
+                print(f"Error reading changes of library {self.name}: {e}")
+                return False
+            for book in changes.changed:
+                self.books[book.book_id] = book
+            for book_id in changes.removed:
+                self.books.pop(book_id, None)
+            return bool(changes)
+
+    def shutdown(self):
+        self._writer.shutdown(wait=True)
+
+
+class LibraryRegistry:
+    """The configured libraries, by name; the first one is the default"""
+
+    def __init__(self, libraries: Optional[Dict[str, Optional[str]]] = None,
+                 calibredb_path: Optional[str] = None):
+        configured = libraries or {DEFAULT_LIBRARY: None}
+        # Each library's content server gets its own port; one discovery,
+        # which matches servers by library id, is shared by all of them
+        ports = [DEFAULT_SERVER_PORT + i for i in range(len(configured))]
+        self.discovery = ContentServerDiscovery(ports=tuple(dict.fromkeys(CANDIDATE_PORTS + tuple(ports))))
+        # Writers run per library, but work on a Kobo is serialised per device
+        self.device_locks = DeviceLocks()
+        self._libraries: Dict[str, Library] = {}
+        for (name, path), port in zip(configured.items(), ports):
+            manager = CalibreManager(calibredb_path=calibredb_path, library_path=path,
+                                     executor=CalibreExecutor())
+            manager.server_port = port
+            manager.discovery = self.discovery
+            manager.device_locks = self.device_locks
+            self._libraries[name] = Library(name, manager)
+
+    @classmethod
+    def from_env(cls, calibredb_path: Optional[str] = None) -> "LibraryRegistry":
+        """Libraries from CALIBRE_LIBRARIES, else the single CALIBRE_LIBRARY/default one"""
+        value = os.environ.get(LIBRARIES_ENV_VAR)
+        return cls(parse_libraries(value) if value else None, calibredb_path=calibredb_path)
+
+    def names(self) -> List[str]:
+        return list(self._libraries)
+
+    def get(self, name: Optional[str] = None) -> Library:
+        if name is None:
+            return self.default()
+        try:
+            return self._libraries[name]
+        except KeyError:
+            raise CalibreError(f"Unknown library: {name}")
+
+    def default(self) -> Library:
+        return next(iter(self._libraries.values()))
+
+    def refresh_indexes(self):
+        """Pick up changes made to any library outside this app (Calibre GUI, other tools)"""
+        for library in self._libraries.values():
+            library.refresh_index()
+
+    def import_books(self, name: Optional[str], ebooks: List[Ebook]) -> ImportResult:
+        """Import into a library, waiting behind earlier writes to that library only"""
+        return self.get(name).import_books(ebooks).result()
+
+    def shutdown(self):
+        for library in self._libraries.values():
+            library.shutdown()
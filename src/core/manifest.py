@@ -0,0 +1,119 @@
+"""Per-device manifest of synced books, used to skip unchanged files"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.core.cache import cache_root, file_hasher
+
+
+# Manifest location on the device, relative to the volume root
+DEVICE_MANIFEST = Path(".kobo-calibre-sync") / "manifest.json"
+
+
+@dataclass
+class ManifestEntry:
+    """A file this app put on the device"""
+    path: str
+    size: int
+    mtime: int
+    sha256: str
+
+
+@dataclass
+class SyncPlan:
+    """Which (source, relative destination) pairs need copying"""
+    to_copy: List[Tuple[Path, str]] = field(default_factory=list)
+    skipped: List[Tuple[Path, str]] = field(default_factory=list)
+
+
+def device_id(device_root: Path) -> str:
+    """Stable id for a Kobo: the serial from .kobo/version, else the volume name"""
+    try:
+        serial = (device_root / ".kobo" / "version").read_text().split(",")[0].strip()
+        if serial:
+            return re.sub(r"[^A-Za-z0-9_-]", "_", serial)
+    except OSError:
+        pass
+    return re.sub(r"[^A-Za-z0-9_-]", "_", device_root.name) or "kobo"
+
+
+class DeviceManifest:
+    """Manifest of (relative path, size, mtime, hash) for books on a device
+
+    It is stored on the device itself, so it follows the Kobo between
+    computers, and mirrored in the local cache in case the device copy is
+    missing. A file is skipped when its manifest entry matches both the
+    source hash and the size and mtime currently on the device, so books
+    deleted or replaced on the device are copied again.
+    """
+
+    def __init__(self, device_root: Path, cache_dir: Optional[Path] = None):
+        self.device_root = Path(device_root)
+        self.cache_path = Path(cache_dir or cache_root() / "devices") / f"{device_id(self.device_root)}.json"
+        self.entries: Dict[str, ManifestEntry] = {}
+
+    @classmethod
+    def load(cls, device_root: Path, cache_dir: Optional[Path] = None) -> "DeviceManifest":
+        manifest = cls(device_root, cache_dir)
+        for path in (manifest.device_root / DEVICE_MANIFEST, manifest.cache_path):
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            manifest.entries = {e["path"]: ManifestEntry(**e) for e in data.get("entries", [])}
+            break
+        return manifest
+
+    def save(self):
+        data = json.dumps({"entries": [asdict(e) for e in self.entries.values()]}, indent=1)
+        for path in (self.device_root / DEVICE_MANIFEST, self.cache_path):
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(path.name + ".tmp")
+                tmp.write_text(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Error saving manifest {path}: {e}")
+
+    def plan(self, items: List[Tuple[Path, str]]) -> SyncPlan:
+        """Split (source, relative destination) pairs into copies and skips"""
+        plan = SyncPlan()
+        for source, relative in items:
+            if self.is_current(source, relative):
+                plan.skipped.append((source, relative))
+            else:
+                plan.to_copy.append((source, relative))
+        return plan
+
+    def is_current(self, source: Path, relative: str) -> bool:
+        entry = self.entries.get(relative)
+        if entry is None:
+            return False
+        try:
+            on_device = (self.device_root / relative).stat()
+            if on_device.st_size != entry.size or on_device.st_mtime_ns != entry.mtime:
+                return False
+            if source.stat().st_size != entry.size:
+                return False
+            return file_hasher.digest(source) == entry.sha256
+        except OSError:
+            return False
+
+    def record(self, source: Path, relative: str):
+        """Record a file just copied from source to the device"""
+        on_device = (self.device_root / relative).stat()
+        self.entries[relative] = ManifestEntry(
+            path=relative,
+            size=on_device.st_size,
+            mtime=on_device.st_mtime_ns,
+            sha256=file_hasher.digest(source),
+        )
+
+    def forget(self, relative: str):
+        self.entries.pop(relative, None)
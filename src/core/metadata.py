@@ -2,9 +2,10 @@
 
 from __future__ import annotations
 
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from ebooklib import epub
 
@@ -17,6 +18,14 @@ class BookMetadata:
     publisher: Optional[str] = None
     description: Optional[str] = None
     isbn: Optional[str] = None
+    series: Optional[str] = None
+    series_index: Optional[float] = None
+    # Only when the EPUB declares it (opf:file-as) for every creator
+    author_sort: Optional[str] = None
+
+
+# EPUB 2 attribute on dc:creator, as ebooklib reports it
+OPF_FILE_AS = "{http://www.idpf.org/2007/opf}file-as"
 
 
 class MetadataExtractor:
@@ -50,6 +59,9 @@ class MetadataExtractor:
                     isbn = id_value
                     break
 
+            series, series_index = self._get_series(book)
+            author_sort = self._get_author_sort(book)
+
             return BookMetadata(
                 title=title,
                 author=author,
@@ -57,6 +69,9 @@ class MetadataExtractor:
                 publisher=publisher,
                 description=description,
                 isbn=isbn,
+                series=series,
+                series_index=series_index,
+                author_sort=author_sort,
             )
         except Exception:
             return BookMetadata()
@@ -73,3 +88,64 @@ class MetadataExtractor:
         except Exception:
             pass
         return None
+
+    def _get_author_sort(self, book) -> Optional[str]:
+        """Sort form of all creators as declared by the EPUB, e.g. "Pratchett, Terry & Gaiman, Neil"
+
+        Read from opf:file-as (EPUB 2) or a file-as meta refining the creator
+        (EPUB 3). None unless every creator has one: guessing is left to Calibre.
+        """
+        try:
+            refined = {
+                attrs.get("refines", "").lstrip("#"): value
+                for value, attrs in book.get_metadata("OPF", "meta")
+                if attrs.get("property") == "file-as" and value
+            }
+            sorts = []
+            for name, attrs in book.get_metadata("DC", "creator"):
+                file_as = attrs.get(OPF_FILE_AS) or refined.get(attrs.get("id", ""))
+                if not file_as or not file_as.strip():
+                    return None
+                sorts.append(file_as.strip())
+            return " & ".join(sorts) or None
+        except Exception:
+            return None
+
+    def _get_series(self, book) -> Tuple[Optional[str], Optional[float]]:
+        """Get series name and index from calibre's OPF meta tags"""
+        series = None
+        series_index = None
+        try:
+            for _, attrs in book.get_metadata("OPF", "meta"):
+                name = attrs.get("name")
+                if name == "calibre:series":
+                    series = attrs.get("content") or None
+                elif name == "calibre:series_index":
+                    try:
+                        series_index = float(attrs.get("content"))
+                    except (TypeError, ValueError):
+                        pass
+        except Exception:
+            pass
+        return series, series_index
+
+
+class MetadataCache:
+    """Extracted metadata memoised by file path, size and mtime"""
+
+    def __init__(self, extractor: Optional[MetadataExtractor] = None):
+        self.extractor = extractor or MetadataExtractor()
+        self._entries: Dict[str, Tuple[Tuple[int, int], BookMetadata]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> BookMetadata:
+        stat = path.stat()
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(str(path))
+        if entry and entry[0] == stamp:
+            return entry[1]
+        metadata = self.extractor.extract(path)
+        with self._lock:
+            self._entries[str(path)] = (stamp, metadata)
+        return metadata
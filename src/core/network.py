@@ -0,0 +1,122 @@
+"""Local network address discovery"""
+
+from __future__ import annotations
+
+import fcntl
+import ipaddress
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+# Environment variable that pins the address advertised to the Kobo
+ADVERTISED_IP_ENV_VAR = "ADVERTISED_IP"
+
+# ioctl request returning an interface's IPv4 address
+SIOCGIFADDR = 0xC0206921 if sys.platform == "darwin" else 0x8915
+
+# Container, VM and VPN bridges: their addresses are not reachable from the LAN
+VIRTUAL_INTERFACES = ("docker", "br-", "lxcbr", "virbr", "veth", "utun")
+
+
+def route_address() -> Optional[str]:
+    """Address of the interface holding the default route
+
+    Connecting a UDP socket only selects a route; no packet is sent.
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("8.8.8.8", 80))
+            return sock.getsockname()[0]
+    except OSError:
+        return None
+
+
+def interface_addresses() -> List[Tuple[str, str]]:
+    """(interface, IPv4 address) of the local interfaces, read without any network traffic"""
+    addresses = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _, name in socket.if_nameindex():
+            request = struct.pack("256s", name.encode()[:15])
+            try:
+                reply = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)
+            except OSError:
+                # Interface is down or has no IPv4 address
+                continue
+            addresses.append((name, socket.inet_ntoa(reply[20:24])))
+    return addresses
+
+
+def pick_address(interfaces: List[Tuple[str, str]]) -> Optional[str]:
+    """Choose the address a device on the LAN is most likely to reach
+
+    Used when there is no default route. Bridge and virtual interfaces are
+    skipped; among the rest, private addresses win over public ones and
+    interface order is kept otherwise.
+    """
+    public = None
+    for name, address in interfaces:
+        if name.startswith(VIRTUAL_INTERFACES):
+            continue
+        ip = ipaddress.ip_address(address)
+        if ip.is_loopback or ip.is_link_local or ip.is_unspecified:
+            continue
+        if ip.is_private:
+            return address
+        public = public or address
+    return public
+
+
+class LocalAddress:
+    """Memoised local IP address
+
+    The address is re-discovered at most every ``ttl`` seconds, when the set
+    of network interfaces changes, or after ``invalidate``. An address pinned
+    through the argument or ADVERTISED_IP is returned as is.
+    """
+
+    def __init__(self, ttl: float = 60.0, pinned: Optional[str] = None):
+        self.ttl = ttl
+        self.pinned = pinned or os.environ.get(ADVERTISED_IP_ENV_VAR)
+        self._lock = threading.Lock()
+        self._cached: Optional[Tuple[str, float, tuple]] = None
+
+    def get(self) -> str:
+        if self.pinned:
+            return self.pinned
+        interfaces = tuple(socket.if_nameindex())
+        with self._lock:
+            if self._cached:
+                address, found_at, known_interfaces = self._cached
+                if interfaces == known_interfaces and time.monotonic() - found_at < self.ttl:
+                    return address
+            address = self._discover()
+            self._cached = (address, time.monotonic(), interfaces)
+            return address
+
+    def invalidate(self):
+        """Signal a network change; the next call re-discovers the address"""
+        with self._lock:
+            self._cached = None
+
+    def _discover(self) -> str:
+        address = route_address()
+        if address and not ipaddress.ip_address(address).is_loopback:
+            return address
+        # No default route: look through the interfaces instead
+        try:
+            return pick_address(interface_addresses()) or "127.0.0.1"
+        except OSError:
+            return "127.0.0.1"
+
+
+local_address = LocalAddress()
+
+
+def get_local_ip() -> str:
+    """Get the local IP address of this machine on the network"""
+    return local_address.get()
@@ -0,0 +1,116 @@
+"""Free-space-aware selection of the books to send to a device"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+# Send priorities
+NEWEST = "newest"
+SELECTION = "selection"
+
+PRIORITY_ENV_VAR = "KOBO_SEND_PRIORITY"
+RESERVE_ENV_VAR = "KOBO_RESERVE_MB"
+
+# Left free for the device database, thumbnails and the manifest
+DEFAULT_RESERVE = 32 * 1024 * 1024
+
+
+def on_disk_size(size: int, block_size: int) -> int:
+    """Bytes a file of this size occupies once rounded up to whole clusters"""
+    if block_size <= 0:
+        return size
+    return -(-size // block_size) * block_size
+
+
+@dataclass
+class SpacePlan:
+    """Which (source, relative destination) pairs fit on the device"""
+    fits: List[Tuple[Path, str]] = field(default_factory=list)
+    left_out: List[Tuple[Path, str]] = field(default_factory=list)
+    free: int = 0
+    reserve: int = 0
+    required: int = 0
+    planned: int = 0
+
+    @property
+    def available(self) -> int:
+        return max(self.free - self.reserve, 0)
+
+    @property
+    def shortfall(self) -> int:
+        """Bytes that would have to be freed to send everything"""
+        return max(self.required - self.available, 0)
+
+    def summary(self) -> str:
+        mb = 1024 * 1024
+        text = (f"{len(self.fits)} libri da copiare ({self.planned / mb:.1f} MB), "
+                f"spazio libero {self.available / mb:.1f} MB")
+        if self.left_out:
+            text += f", {len(self.left_out)} esclusi per spazio insufficiente"
+        return text
+
+
+class SpacePlanner:
+    """Chooses the books that fit in a device's free space, by priority
+
+    Sizes are measured on the files that will actually be copied (after
+    conversion) and rounded up to the device's cluster size. Every book is
+    counted at full size, even if it replaces an older copy, because the
+    new file is written next to the old one before the rename. Books are
+    taken in priority order (newest first, or the order they were selected
+    in); one that does not fit is left out and smaller ones after it may
+    still be taken.
+    """
+
+    def __init__(self, priority: Optional[str] = None, reserve: Optional[int] = None):
+        self.priority = (priority or os.environ.get(PRIORITY_ENV_VAR, NEWEST)).lower()
+        if self.priority not in (NEWEST, SELECTION):
+            self.priority = NEWEST
+        if reserve is None:
+            env = os.environ.get(RESERVE_ENV_VAR)
+            reserve = int(float(env) * 1024 * 1024) if env else DEFAULT_RESERVE
+        self.reserve = reserve
+
+    def plan(self, device_root: Path, items: List[Tuple[Path, str]], reclaim: int = 0) -> SpacePlan:
+        """Split (source, relative destination) pairs into those that fit and the rest
+
+        ``reclaim`` is space that will be freed before copying (evictions).
+        """
+        device_root = Path(device_root)
+        plan = SpacePlan(free=shutil.disk_usage(device_root).free + reclaim, reserve=self.reserve)
+        try:
+            block_size = os.statvfs(device_root).f_frsize
+        except (AttributeError, OSError):
+            block_size = 0
+
+        sized = []
+        chosen = []
+        for order, (source, relative) in enumerate(items):
+            try:
+                stat = source.stat()
+            except OSError:
+                # Leave it to the copy step to report the missing file
+                chosen.append((order, source, relative))
+                continue
+            size = on_disk_size(stat.st_size, block_size)
+            plan.required += size
+            sized.append((order, stat.st_mtime, size, source, relative))
+
+        if self.priority == NEWEST:
+            sized.sort(key=lambda item: (-item[1], item[0]))
+
+        for order, _, size, source, relative in sized:
+            if plan.planned + size <= plan.available:
+                plan.planned += size
+                chosen.append((order, source, relative))
+            else:
+                plan.left_out.append((source, relative))
+
+        # Copy in selection order regardless of priority
+        plan.fits.extend((source, relative) for _, source, relative in sorted(chosen, key=lambda c: c[0]))
+        return plan
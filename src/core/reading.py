@@ -0,0 +1,144 @@
+"""Reading-state sync from a Kobo's database back into Calibre"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.core.cache import cache_root
+from src.core.kobo_db import FINISHED, READING, UNREAD, DeviceBook, normalise, normalise_isbn
+
+
+# Calibre custom columns receiving read status, percent read and last-read
+# date ("a,b,c", or 1 for the default names). Unset means no reading sync:
+# a stock library has no such columns
+READING_COLUMNS_ENV_VAR = "KOBO_READING_COLUMNS"
+DEFAULT_READING_COLUMNS = ("#kobo_status", "#kobo_percent", "#kobo_last_read")
+
+STATUS_LABELS = {
+    UNREAD: "Non letto",
+    READING: "In lettura",
+    FINISHED: "Letto",
+}
+
+
+def reading_columns() -> Optional[Tuple[str, str, str]]:
+    """Status, percent and last-read column names, or None if reading sync is off"""
+    value = os.environ.get(READING_COLUMNS_ENV_VAR, "").strip()
+    if not value or value == "0":
+        return None
+    if value == "1":
+        return DEFAULT_READING_COLUMNS
+    names = tuple(name.strip() for name in value.split(",") if name.strip())
+    if len(names) != 3:
+        print(f"{READING_COLUMNS_ENV_VAR} needs three column names, using {','.join(DEFAULT_READING_COLUMNS)}")
+        return DEFAULT_READING_COLUMNS
+    return names
+
+
+@dataclass(frozen=True)
+class ReadingState:
+    """Reading progress of one book as the device reports it"""
+    status: int
+    percent: int
+    last_read: str
+
+    @classmethod
+    def of(cls, book: DeviceBook) -> "ReadingState":
+        return cls(book.read_status, int(round(book.percent_read)), book.date_last_read)
+
+    def fields(self, columns: Tuple[str, str, str]) -> Dict[str, str]:
+        status, percent, last_read = columns
+        fields = {
+            status: STATUS_LABELS.get(self.status, STATUS_LABELS[UNREAD]),
+            percent: str(self.percent),
+        }
+        if self.last_read:
+            fields[last_read] = self.last_read
+        return fields
+
+
+@dataclass
+class ReadingSyncReport:
+    """What a reading-state sync changed"""
+    enabled: bool = True
+    changed: int = 0
+    written: List[int] = field(default_factory=list)
+    unmatched: List[str] = field(default_factory=list)
+    failed: List[int] = field(default_factory=list)
+
+
+class LibraryMatcher:
+    """Finds the Calibre book for a device book by ISBN or title and author"""
+
+    def __init__(self, books: List[dict]):
+        self.by_isbn: Dict[str, int] = {}
+        self.by_title_author: Dict[tuple, int] = {}
+        for book in books:
+            isbn = normalise_isbn(book.get("isbn"))
+            if isbn:
+                self.by_isbn[isbn] = book["id"]
+            authors = book.get("authors") or ""
+            if isinstance(authors, list):
+                authors = " & ".join(authors)
+            self.by_title_author[(normalise(book.get("title")), normalise(authors))] = book["id"]
+
+    def match(self, book: DeviceBook) -> Optional[int]:
+        isbn = normalise_isbn(book.isbn)
+        if isbn and isbn in self.by_isbn:
+            return self.by_isbn[isbn]
+        return self.by_title_author.get((normalise(book.title), normalise(book.author)))
+
+
+class ReadingSyncState:
+    """Reading state last written to Calibre, per device and library
+
+    Kept in the local cache so a sync only writes books whose progress
+    moved since the previous one. Also remembers which Calibre book each
+    device book matched, so matching only runs for books new to the device.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.books: Dict[str, ReadingState] = {}
+        self.book_ids: Dict[str, int] = {}
+
+    @classmethod
+    def load(cls, device: str, library: str, cache_dir: Optional[Path] = None) -> "ReadingSyncState":
+        state = cls(Path(cache_dir or cache_root() / "reading") / f"{device}-{library}.json")
+        try:
+            data = json.loads(state.path.read_text())
+            state.books = {k: ReadingState(*v) for k, v in data.get("books", {}).items()}
+            state.book_ids = {k: int(v) for k, v in data.get("book_ids", {}).items()}
+        except (OSError, ValueError, TypeError):
+            pass
+        return state
+
+    def save(self):
+        data = {
+            "books": {k: [s.status, s.percent, s.last_read] for k, s in self.books.items()},
+            "book_ids": self.book_ids,
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Error saving reading state {self.path}: {e}")
+
+    def changed(self, books: List[DeviceBook]) -> List[Tuple[DeviceBook, ReadingState]]:
+        """Device books whose reading state differs from the last synced one"""
+        changed = []
+        for book in books:
+            current = ReadingState.of(book)
+            previous = self.books.get(book.content_id)
+            if previous is None and current == ReadingState(UNREAD, 0, ""):
+                # Never opened: nothing worth writing
+                continue
+            if current != previous:
+                changed.append((book, current))
+        return changed
@@ -0,0 +1,227 @@
+"""Calibre content server discovery"""
+
+from __future__ import annotations
+
+import http.client
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+
+# Ports calibre-server is commonly started on, in order of preference
+CANDIDATE_PORTS = (8080, 8180, 8081)
+
+# Seconds a discovery result is reused; longer than the UI's 10 s status
+# poll, so polling hits the cache. Starting or stopping a server here
+# invalidates it immediately
+DISCOVERY_TTL = 30.0
+
+# Port of the content server started for the first library; further
+# libraries get the following ports
+DEFAULT_SERVER_PORT = CANDIDATE_PORTS[0]
+
+
+def opds_path(library_id: Optional[str] = None) -> str:
+    """OPDS feed path, for a specific library when the server has several"""
+    return "/opds" if library_id is None else f"/opds?library_id={quote(library_id)}"
+
+
+def is_calibre_server(port: int, host: str = "127.0.0.1", timeout: float = 1.0,
+                      library_id: Optional[str] = None) -> bool:
+    """Check that the service on a port is a calibre content server
+
+    A plain connect only proves something is listening, so this asks for the
+    OPDS feed: calibre answers with an Atom feed, or with 401 and a "calibre"
+    realm when authentication is enabled. With ``library_id`` the server must
+    also serve that library (calibre answers 404 for libraries it lacks).
+    """
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("GET", opds_path(library_id))
+        response = conn.getresponse()
+        body = response.read(4096)
+        if response.status == 200:
+            return b"<feed" in body
+        if response.status == 401:
+            return "calibre" in response.getheader("WWW-Authenticate", "").lower()
+        return False
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        conn.close()
+
+
+class ContentServerDiscovery:
+    """Finds a running content server by probing candidate ports in parallel
+
+    The result (including "no server") is cached per library id for ``ttl``
+    seconds, so frequent status checks do not touch the network. Call
+    ``invalidate`` when a server is started or stopped.
+    """
+
+    def __init__(self, ports: Sequence[int] = CANDIDATE_PORTS, ttl: float = DISCOVERY_TTL,
+                 probe_timeout: float = 1.0):
+        self.ports = tuple(ports)
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._cached: Dict[Optional[str], Tuple[Optional[int], float]] = {}
+
+    def find_port(self, library_id: Optional[str] = None) -> Optional[int]:
+        """Return the port of a running calibre server (serving ``library_id``), or None"""
+        with self._lock:
+            cached = self._cached.get(library_id)
+            if cached and time.monotonic() - cached[1] < self.ttl:
+                return cached[0]
+            port = self._probe_all(library_id)
+            self._cached[library_id] = (port, time.monotonic())
+            return port
+
+    def invalidate(self):
+        with self._lock:
+            self._cached.clear()
+
+    def _probe_all(self, library_id: Optional[str]) -> Optional[int]:
+        if not self.ports:
+            return None
+        with ThreadPoolExecutor(max_workers=len(self.ports)) as pool:
+            results = list(pool.map(
+                lambda port: is_calibre_server(port, timeout=self.probe_timeout, library_id=library_id),
+                self.ports,
+            ))
+        for port, found in zip(self.ports, results):
+            if found:
+                return port
+        return None
+
+
+class ServerStartError(Exception):
+    """Raised when the content server does not become ready in time"""
+    pass
+
+
+class ContentServerSupervisor:
+    """Runs calibre-server as a supervised child process
+
+    ``start`` blocks until the server answers its OPDS endpoint (or the
+    deadline passes), so callers only ever hand out working URLs. Output is
+    kept in a ring buffer, an unexpected exit triggers a restart with
+    exponential backoff, and ``stop`` terminates the whole process group.
+    """
+
+    def __init__(self, command: List[str], port: int, ready_timeout: float = 30.0,
+                 max_restarts: int = 5, backoff: float = 1.0, log_lines: int = 500,
+                 on_change: Optional[Callable[[], None]] = None):
+        self.command = command
+        self.port = port
+        self.ready_timeout = ready_timeout
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.on_change = on_change
+        self.restarts = 0
+        self._logs = deque(maxlen=log_lines)
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Start the server and wait until it is ready
+
+        Raises:
+            ServerStartError: if the server exits or is not ready by the deadline
+        """
+        self._stopping.clear()
+        self._spawn()
+        if not self.wait_ready(self.ready_timeout):
+            self.stop()
+            tail = "".join(list(self._logs)[-5:]).strip()
+            raise ServerStartError(f"calibre-server not ready on port {self.port}: {tail}")
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Poll the OPDS endpoint until it answers, the process dies or time runs out"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            process = self._process
+            if process is None or process.poll() is not None:
+                return False
+            if is_calibre_server(self.port, timeout=0.5):
+                return True
+            time.sleep(0.1)
+        return False
+
+    def is_running(self) -> bool:
+        process = self._process
+        return process is not None and process.poll() is None
+
+    def logs(self) -> List[str]:
+        """Most recent output lines from the server"""
+        return list(self._logs)
+
+    def stop(self, timeout: float = 10.0):
+        """Terminate the server and stop supervising it"""
+        self._stopping.set()
+        with self._lock:
+            process = self._process
+        if process is None or process.poll() is not None:
+            return
+        self._signal(process, signal.SIGTERM)
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self._signal(process, signal.SIGKILL)
+            process.wait()
+        self._changed()
+
+    def _spawn(self):
+        with self._lock:
+            self._process = subprocess.Popen(
+                self.command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                start_new_session=True,
+            )
+            process = self._process
+        threading.Thread(target=self._collect_output, args=(process,), daemon=True).start()
+        self._changed()
+
+    def _collect_output(self, process: subprocess.Popen):
+        for line in process.stdout:
+            self._logs.append(line)
+
+    def _monitor(self):
+        while not self._stopping.is_set():
+            process = self._process
+            returncode = process.wait()
+            if self._stopping.is_set():
+                return
+            self._changed()
+            if self.restarts >= self.max_restarts:
+                self._logs.append(f"calibre-server exited ({returncode}), giving up\n")
+                return
+            delay = self.backoff * (2 ** self.restarts)
+            self.restarts += 1
+            self._logs.append(f"calibre-server exited ({returncode}), restarting in {delay:.0f}s\n")
+            if self._stopping.wait(delay):
+                return
+            self._spawn()
+            if self.wait_ready(self.ready_timeout):
+                self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    @staticmethod
+    def _signal(process: subprocess.Popen, signum: int):
+        try:
+            os.killpg(process.pid, signum)
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,207 @@
+"""Host-side generation of the cover thumbnails a Kobo keeps in .kobo-images"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import multiprocessing
+import os
+import posixpath
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from src.core.cache import cache_root, file_hasher
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency: without it the Kobo renders its own covers
+    Image = None
+
+
+KOBO_IMAGES = ".kobo-images"
+
+# Same prefix as kobo_db.ONBOARD_PREFIX; the image id is derived from the ContentID
+ONBOARD_PREFIX = "file:///mnt/onboard/"
+
+# Bounding boxes the firmware looks for, per thumbnail type
+THUMBNAIL_SIZES: Dict[str, Tuple[int, int]] = {
+    "N3_FULL": (1072, 1448),
+    "N3_LIBRARY_FULL": (355, 530),
+    "N3_LIBRARY_GRID": (149, 233),
+}
+
+# Full-screen cover size, e.g. "1264x1680" for a Libra 2
+COVER_SIZE_ENV_VAR = "KOBO_COVER_SIZE"
+
+# Marker left in a cache entry for books without a usable cover
+NO_COVER = ".no-cover"
+
+# Set to 0 to leave thumbnail generation to the device
+THUMBNAILS_ENV_VAR = "KOBO_THUMBNAILS"
+
+JPEG_QUALITY = 85
+
+OPF_NS = "{http://www.idpf.org/2007/opf}"
+CONTAINER_NS = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+
+
+def qhash(text: str) -> int:
+    """The Qt qHash the firmware uses to spread images over directories"""
+    h = 0
+    for byte in text.encode("utf-8"):
+        h = (h << 4) + byte
+        h ^= (h & 0xF0000000) >> 23
+        h &= 0x0FFFFFFF
+    return h
+
+
+def image_id(relative: str) -> str:
+    """ImageID of a sideloaded book at this path relative to the volume root"""
+    return re.sub(r"[/ :.]", "_", ONBOARD_PREFIX + relative)
+
+
+def thumbnail_paths(relative: str, sizes: Dict[str, Tuple[int, int]] = THUMBNAIL_SIZES) -> Dict[str, str]:
+    """Thumbnail type -> path relative to the volume root, for a book"""
+    image = image_id(relative)
+    h = qhash(image)
+    directory = posixpath.join(KOBO_IMAGES, str(h & 0xFF), str((h & 0xFF00) >> 8))
+    return {kind: posixpath.join(directory, f"{image} - {kind}.parsed") for kind in sizes}
+
+
+def configured_sizes() -> Dict[str, Tuple[int, int]]:
+    sizes = dict(THUMBNAIL_SIZES)
+    value = os.environ.get(COVER_SIZE_ENV_VAR, "")
+    match = re.fullmatch(r"\s*(\d+)\s*x\s*(\d+)\s*", value)
+    if match:
+        sizes["N3_FULL"] = (int(match.group(1)), int(match.group(2)))
+    return sizes
+
+
+def epub_cover(path: Path) -> Optional[bytes]:
+    """Cover image bytes of an EPUB/KEPUB, or None if it has none"""
+    try:
+        with zipfile.ZipFile(path) as book:
+            container = ElementTree.fromstring(book.read("META-INF/container.xml"))
+            rootfile = container.find(f".//{CONTAINER_NS}rootfile")
+            opf_path = rootfile.get("full-path")
+            opf = ElementTree.fromstring(book.read(opf_path))
+            items = opf.findall(f".//{OPF_NS}manifest/{OPF_NS}item")
+
+            href = None
+            for item in items:
+                if "cover-image" in (item.get("properties") or "").split():
+                    href = item.get("href")
+            if href is None:
+                meta = opf.find(f".//{OPF_NS}metadata/{OPF_NS}meta[@name='cover']")
+                cover_id = meta.get("content") if meta is not None else None
+                href = next((item.get("href") for item in items if item.get("id") == cover_id), None)
+            if href is None:
+                href = next((item.get("href") for item in items
+                             if (item.get("media-type") or "").startswith("image/")
+                             and "cover" in (item.get("id", "") + item.get("href", "")).lower()), None)
+            if href is None:
+                return None
+            return book.read(posixpath.normpath(posixpath.join(posixpath.dirname(opf_path), href)))
+    except (OSError, KeyError, AttributeError, zipfile.BadZipFile, ElementTree.ParseError):
+        return None
+
+
+def render_thumbnails(source: str, out_dir: str, sizes: Dict[str, Tuple[int, int]]) -> bool:
+    """Write one JPEG per thumbnail type into out_dir; runs in a worker process"""
+    os.makedirs(out_dir, exist_ok=True)
+    cover = epub_cover(Path(source))
+    try:
+        image = Image.open(io.BytesIO(cover))
+        image.load()
+    except Exception:
+        # No cover, or not an image Pillow can read
+        Path(out_dir, NO_COVER).touch()
+        return False
+    image = image.convert("RGB")
+    for kind, (width, height) in sizes.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail((width, height), Image.LANCZOS)
+        partial = os.path.join(out_dir, f".{kind}.jpg.part")
+        thumbnail.save(partial, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        os.replace(partial, os.path.join(out_dir, f"{kind}.jpg"))
+    return True
+
+
+@dataclass
+class Thumbnail:
+    """A rendered thumbnail on the host and where it goes on the device"""
+    source: Path
+    host_path: Path
+    device_path: str
+
+
+class ThumbnailGenerator:
+    """Renders Kobo cover thumbnails on the host, in a process pool
+
+    Resizing covers is CPU-bound, so it runs on one process per core
+    instead of on the Kobo's own CPU after the sync. Rendered thumbnails
+    are cached by the book's content hash and the requested sizes; books
+    without a cover (or when Pillow is not installed) get none and the
+    device renders them as before.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None,
+                 sizes: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_workers: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or cache_root() / "thumbnails")
+        self.sizes = sizes or configured_sizes()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.enabled = Image is not None and os.environ.get(THUMBNAILS_ENV_VAR, "1") != "0"
+
+    def cache_path(self, source: Path) -> Path:
+        key = hashlib.sha256(file_hasher.digest(source).encode())
+        for kind, (width, height) in sorted(self.sizes.items()):
+            key.update(f"\0{kind}={width}x{height}".encode())
+        digest = key.hexdigest()
+        return self.cache_dir / digest[:2] / digest
+
+    def generate(self, items: List[Tuple[Path, str]]) -> List[Thumbnail]:
+        """Thumbnails for (source, relative destination) pairs of books sent to a device"""
+        if not self.enabled or not items:
+            return []
+
+        pending = {}
+        for source, relative in items:
+            if not source.name.lower().endswith(".epub"):
+                continue
+            try:
+                out_dir = self.cache_path(source)
+            except OSError:
+                continue
+            done = all((out_dir / f"{kind}.jpg").exists() for kind in self.sizes)
+            if not done and not (out_dir / NO_COVER).exists():
+                pending[out_dir] = source
+
+        if pending:
+            workers = min(self.max_workers, len(pending))
+            # Spawned, not forked: this runs on a background thread of a
+            # multi-threaded server, and a forked child could inherit a held lock
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                list(pool.map(render_thumbnails, [str(s) for s in pending.values()],
+                              [str(d) for d in pending], [self.sizes] * len(pending),
+                              chunksize=max(1, len(pending) // (workers * 4))))
+
+        thumbnails = []
+        for source, relative in items:
+            if not source.name.lower().endswith(".epub"):
+                continue
+            try:
+                out_dir = self.cache_path(source)
+            except OSError:
+                continue
+            for kind, device_path in thumbnail_paths(relative, self.sizes).items():
+                host_path = out_dir / f"{kind}.jpg"
+                if host_path.exists():
+                    thumbnails.append(Thumbnail(source, host_path, device_path))
+        return thumbnails
@@ -0,0 +1,114 @@
+"""Batched metadata write-back into a Calibre library"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.core.metadata import BookMetadata
+
+
+# Runs inside calibre-debug: applies all updates through calibre's database
+# API in one process, one set_field call per field across all books.
+BULK_SCRIPT = r'''
+import json, sys
+from calibre.library import db
+
+payload = json.load(open(sys.argv[-1]))
+cache = db(payload["library"]).new_api
+known = set(cache.all_book_ids())
+outcomes = {}
+by_field = {}
+for update in payload["updates"]:
+    book_id = update["book_id"]
+    if book_id not in known:
+        outcomes[book_id] = "no book with id %d" % book_id
+        continue
+    for name, value in update["fields"].items():
+        if name == "isbn":
+            identifiers = dict(cache.field_for("identifiers", book_id))
+            identifiers["isbn"] = value
+            by_field.setdefault("identifiers", {})[book_id] = identifiers
+        elif name == "series_index":
+            by_field.setdefault(name, {})[book_id] = float(value)
+        else:
+            by_field.setdefault(name, {})[book_id] = value
+for name, values in by_field.items():
+    try:
+        cache.set_field(name, values)
+    except Exception as e:
+        for book_id in values:
+            outcomes.setdefault(book_id, "%s: %s" % (name, e))
+for update in payload["updates"]:
+    outcomes.setdefault(update["book_id"], "")
+print(json.dumps({str(k): v for k, v in outcomes.items()}))
+'''
+
+
+@dataclass
+class MetadataUpdate:
+    """Field values to set on one library book (calibredb field names)"""
+    book_id: int
+    fields: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class WriteOutcome:
+    """Result of writing one book's metadata"""
+    book_id: int
+    ok: bool
+    error: str = ""
+
+
+def author_sort(author: str) -> str:
+    """Sort form of an author name: "Italo Calvino" -> "Calvino, Italo"
+
+    Multiple authors separated by "&" or " and " are sorted individually and
+    joined with " & ", as calibre does. Names already containing a comma are
+    assumed to be in sort form. A heuristic for on-device paths and catalog
+    ordering; it is never written to Calibre.
+    """
+    names = [n.strip() for n in re.split(r"\s*&\s*|\s+and\s+", author) if n.strip()]
+    sorted_names = []
+    for name in names:
+        parts = name.split()
+        if "," in name or len(parts) < 2:
+            sorted_names.append(name)
+        else:
+            sorted_names.append(f"{parts[-1]}, {' '.join(parts[:-1])}")
+    return " & ".join(sorted_names)
+
+
+def normalise_isbn(value: str) -> Optional[str]:
+    """Digits of an ISBN-10/13 from strings like "urn:isbn:978-0-306-40615-7" """
+    digits = re.sub(r"[^0-9Xx]", "", value.split(":")[-1]).upper()
+    if len(digits) in (10, 13):
+        return digits
+    return None
+
+
+def metadata_fields(metadata: BookMetadata) -> Dict[str, str]:
+    """Cleaned-up fields from extracted metadata worth pushing into Calibre"""
+    fields = {}
+    # Only a declared sort: Calibre computes a better one than author_sort()
+    # would, and it covers every author, not just the first
+    if metadata.author_sort:
+        fields["author_sort"] = metadata.author_sort
+    if metadata.isbn:
+        isbn = normalise_isbn(metadata.isbn)
+        if isbn:
+            fields["isbn"] = isbn
+    if metadata.series:
+        fields["series"] = metadata.series
+        if metadata.series_index is not None:
+            fields["series_index"] = str(metadata.series_index)
+    return fields
+
+
+def set_metadata_args(update: MetadataUpdate) -> List[str]:
+    """calibredb set_metadata arguments applying all fields of one update"""
+    args = ["set_metadata", str(update.book_id)]
+    for name, value in update.fields.items():
+        args += ["--field", f"{name}:{value}"]
+    return args
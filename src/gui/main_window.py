@@ -415,7 +415,9 @@ class MainWindow(QMainWindow):
 
         self.action_panel.set_status("IMPORTAZIONE...", "primary_blue")
         try:
-            imported_ids = self.calibre.import_books(selected)
+            imported = self.calibre.import_books(selected)
+            self.calibre.write_back_metadata(imported)
+            imported_ids = imported.book_ids
             QMessageBox.information(
                 self, "COMPLETATO", f"Importati {len(imported_ids)} ebook in Calibre"
             )
@@ -369,7 +369,9 @@ class MainWindow:
         self.root.update()
 
         try:
-            imported_ids = self.calibre.import_books(selected)
+            imported = self.calibre.import_books(selected)
+            self.calibre.write_back_metadata(imported)
+            imported_ids = imported.book_ids
             messagebox.showinfo("COMPLETATO", f"Importati {len(imported_ids)} ebook in Calibre")
             self._set_status(f"{len(imported_ids)} IMPORTATI", "primary_blue")
         except Exception as e:
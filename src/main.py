@@ -3,11 +3,26 @@ Kobo Calibre Sync - Main entry point
 Web-based GUI to import ebooks into Calibre and sync to Kobo via wireless
 """
 
-from src.web.app import run
+import argparse
 
+from src.web.serve import DEFAULT_PORT, DEV, PRODUCTION, ServeOptions
 
-def main():
-    run()
+
+def parse_args(argv=None) -> ServeOptions:
+    parser = argparse.ArgumentParser(description="Kobo Calibre Sync web app")
+    parser.add_argument("--server", choices=[DEV, PRODUCTION],
+                        help="dev (Flask) or production (waitress); default KOBO_SERVER or dev")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--threads", type=int, help="worker threads in production mode (KOBO_THREADS)")
+    args = parser.parse_args(argv)
+    return ServeOptions(host=args.host, port=args.port, mode=args.server, threads=args.threads)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    from src.web.app import run
+    run(options)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,25 @@
 """Flask web application for Kobo Calibre Sync"""
 
 import json
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from pathlib import Path
+from typing import Optional
 from flask import Flask, render_template_string, jsonify, request
 
 from src.core.scanner import EbookScanner
-from src.core.calibre import CalibreManager
+from src.core.library import LibraryRegistry
 from src.core.metadata import MetadataExtractor
+from src.web.catalog import Catalog
+from src.web.kobo_page import KoboPages
+from src.web.serve import DEFAULT_PORT, ServeOptions, request_timeout, serve
 
 app = Flask(__name__)
 
 scanner = EbookScanner()
-calibre = CalibreManager()
+libraries = LibraryRegistry.from_env()
+calibre = libraries.default().manager
 metadata_extractor = MetadataExtractor()
+catalog = Catalog(calibre.metadata_cache)
 
 # Store scanned ebooks in memory
 current_ebooks = []
@@ -242,6 +249,15 @@ HTML_TEMPLATE = '''
         .btn-blue { background: var(--blue); color: var(--white); }
         .btn-red { background: var(--red); color: var(--white); }
 
+        .library-select {
+            font-family: 'Outfit', sans-serif;
+            font-weight: 700;
+            font-size: 13px;
+            padding: 10px;
+            border: 3px solid var(--fg);
+            background: var(--white);
+        }
+
         .status-box {
             margin-left: auto;
             background: var(--white);
@@ -445,6 +461,8 @@ HTML_TEMPLATE = '''
         <label>SORGENTE</label>
         <button class="btn-yellow" onclick="scanDownloads()">SCANSIONA DOWNLOADS</button>
         <button class="btn-white" onclick="browsePath()">SFOGLIA...</button>
+        <label id="library-label" style="display:none;">LIBRERIA</label>
+        <select id="library-select" class="library-select" style="display:none;"></select>
         <div class="status-box">
             <div class="status-dot" id="status-dot"></div>
             <span id="status-text">PRONTO</span>
@@ -588,6 +606,25 @@ HTML_TEMPLATE = '''
             document.querySelectorAll('#ebook-table input[type="checkbox"]').forEach(cb => cb.checked = false);
         }
 
+        async function loadLibraries() {
+            try {
+                const res = await fetch('/api/libraries');
+                const data = await res.json();
+                if (data.libraries.length < 2) return;
+                const select = document.getElementById('library-select');
+                select.innerHTML = data.libraries.map(name =>
+                    `<option value="${name}"${name === data.default ? ' selected' : ''}>${name.toUpperCase()}</option>`
+                ).join('');
+                select.style.display = '';
+                document.getElementById('library-label').style.display = '';
+            } catch (e) {}
+        }
+
+        function getSelectedLibrary() {
+            const select = document.getElementById('library-select');
+            return select.value || null;
+        }
+
         function getSelectedIndices() {
             const indices = [];
             document.querySelectorAll('#ebook-table input[type="checkbox"]:checked').forEach(cb => {
@@ -608,7 +645,7 @@ HTML_TEMPLATE = '''
                 const res = await fetch('/api/import', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({indices})
+                    body: JSON.stringify({indices, library: getSelectedLibrary()})
                 });
                 const data = await res.json();
 
@@ -636,7 +673,7 @@ HTML_TEMPLATE = '''
                 const res = await fetch('/api/send', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({indices})
+                    body: JSON.stringify({indices, library: getSelectedLibrary()})
                 });
                 const data = await res.json();
 
@@ -670,6 +707,8 @@ HTML_TEMPLATE = '''
             } catch (e) {}
         }
 
+        loadLibraries();
+
         // Check status every 10 seconds
         checkKoboStatus();
         setInterval(checkKoboStatus, 10000);
@@ -679,6 +718,17 @@ HTML_TEMPLATE = '''
 '''
 
 
+def wait(future: Future):
+    """Result of a queued library operation, bounded by the request timeout
+
+    The operation keeps running in the library's queue if the wait times out.
+    """
+    try:
+        return future.result(timeout=request_timeout())
+    except FutureTimeout:
+        raise TimeoutError("Operazione ancora in corso sulla libreria, riprova tra poco")
+
+
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
@@ -701,15 +751,17 @@ def scan():
     else:
         folder = Path(path).expanduser()
 
-    current_ebooks = scanner.scan(folder)
+    # A changed catalog starts a new generation and re-renders /kobo in the background
+    catalog.update(scanner.scan(folder))
+    libraries.refresh_indexes()
+    current_ebooks = catalog.ebooks
 
     ebooks_data = []
-    for ebook in current_ebooks:
-        metadata = metadata_extractor.extract(ebook.path)
+    for entry, ebook in zip(catalog.entries, current_ebooks):
         ebooks_data.append({
-            'title': metadata.title or ebook.path.stem,
-            'author': metadata.author or '—',
-            'format': ebook.path.suffix.upper().replace('.', ''),
+            'title': entry.title,
+            'author': entry.author or '—',
+            'format': entry.format,
             'path': str(ebook.path)
         })
 
@@ -725,9 +777,20 @@ def import_books():
         indices = data.get('indices', [])
 
         selected = [current_ebooks[i] for i in indices if i < len(current_ebooks)]
-        imported_ids = calibre.import_books(selected)
+        library = libraries.get(data.get('library'))
+        # Writes to one library are queued; other libraries are not blocked
+        imported = wait(library.import_books(selected))
+        written = wait(library.submit(
+            library.manager.write_back_metadata, imported, metadata_extractor
+        ))
 
-        return jsonify({'success': True, 'count': len(imported_ids)})
+        return jsonify({
+            'success': True,
+            'count': len(imported.book_ids),
+            'duplicates': len(imported.duplicates),
+            'failed': len(imported.failed),
+            'metadata_updated': sum(1 for outcome in written if outcome.ok),
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -742,12 +805,17 @@ def send_books():
         indices = data.get('indices', [])
 
         selected = [current_ebooks[i] for i in indices if i < len(current_ebooks)]
-        result = calibre.send_to_device(selected)
+        library = libraries.get(data.get('library'))
+        result = wait(library.submit(library.manager.send_to_device, selected))
 
         return jsonify({
             'success': True,
             'imported': result['imported'],
             'sent_usb': result['sent_usb'],
+            'skipped_usb': result['skipped_usb'],
+            'no_space_usb': result['no_space_usb'],
+            'reading_synced': result['reading_synced'],
+            'metadata_updated': result['metadata_updated'],
             'kobo_connected': result['kobo_connected'],
             'opds_url': result['opds_url'],
             'local_ip': get_local_ip(),
@@ -757,76 +825,53 @@ def send_books():
         return jsonify({'success': False, 'error': str(e)})
 
 
+@app.route('/api/reading-sync', methods=['POST'])
+def reading_sync():
+    """Copy reading progress from the connected Kobo into Calibre"""
+    try:
+        data = request.json or {}
+        library = libraries.get(data.get('library'))
+        device = library.manager.check_kobo_usb()
+        if device is None:
+            return jsonify({'success': False, 'error': 'Kobo non collegato via USB'})
+        report = wait(library.submit(library.manager.sync_reading_state, device))
+        if not report.enabled:
+            return jsonify({'success': False, 'error': 'Sincronizzazione lettura non attiva: imposta KOBO_READING_COLUMNS'})
+        return jsonify({
+            'success': True,
+            'changed': report.changed,
+            'written': len(report.written),
+            'unmatched': len(report.unmatched),
+            'failed': len(report.failed),
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/libraries')
+def list_libraries():
+    """Configured Calibre libraries, with the number of books in each"""
+    libraries.refresh_indexes()
+    return jsonify({
+        'libraries': libraries.names(),
+        'default': libraries.default().name,
+        'books': {name: len(libraries.get(name).books) for name in libraries.names()},
+    })
+
+
+kobo_pages = KoboPages(catalog)
+kobo_pages.prerender()
+
+
 @app.route('/kobo')
 def kobo_page():
-    """Simple HTML page for Kobo browser to download books"""
-    from src.core.calibre import get_local_ip
-    local_ip = get_local_ip()
-
-    # Get list of recently imported books from current_ebooks
-    books_html = ""
-    if current_ebooks:
-        for i, ebook in enumerate(current_ebooks):
-            metadata = metadata_extractor.extract(ebook.path)
-            title = metadata.title or ebook.path.stem
-            author = metadata.author or "Sconosciuto"
-            fmt = ebook.path.suffix.upper().replace(".", "")
-            books_html += f'''
-            <div style="background:#fff;border:2px solid #000;padding:15px;margin:10px 0;">
-                <b style="font-size:18px;">{title}</b><br>
-                <span style="color:#666;">{author}</span><br>
-                <span style="background:#1040C0;color:#fff;padding:2px 8px;font-size:12px;">{fmt}</span>
-                <br><br>
-                <a href="/download/{i}" style="background:#D02020;color:#fff;padding:10px 20px;text-decoration:none;font-weight:bold;">
-                    ⬇ SCARICA
-                </a>
-            </div>
-            '''
-    else:
-        books_html = '<p style="color:#666;padding:20px;">Nessun libro. Scansiona prima dal Mac.</p>'
-
-    html = f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <title>Kobo Calibre Sync</title>
-        <style>
-            body {{
-                font-family: sans-serif;
-                background: #F0F0F0;
-                margin: 0;
-                padding: 10px;
-            }}
-            h1 {{
-                background: #121212;
-                color: #fff;
-                padding: 15px;
-                margin: -10px -10px 15px -10px;
-                font-size: 20px;
-            }}
-            .refresh {{
-                background: #F0C020;
-                color: #000;
-                padding: 10px 20px;
-                text-decoration: none;
-                font-weight: bold;
-                display: inline-block;
-                margin-bottom: 15px;
-                border: 2px solid #000;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>■ KOBO CALIBRE SYNC</h1>
-        <a href="/kobo" class="refresh">🔄 AGGIORNA</a>
-        <p><b>{len(current_ebooks)}</b> libri disponibili</p>
-        {books_html}
-    </body>
-    </html>
-    '''
-    return html
+    """Paginated HTML catalog for the Kobo's browser (?sort=recent|title|author&page=N)"""
+    page = request.args.get('page', '1')
+    return kobo_pages.response(
+        request.args.get('sort', 'recent'),
+        int(page) if page.isdigit() else 1,
+        request,
+    )
 
 
 @app.route('/download/<int:index>')
@@ -837,11 +882,16 @@ def download_book(index):
     if index < 0 or index >= len(current_ebooks):
         return "Libro non trovato", 404
 
-    ebook = current_ebooks[index]
+    # Never convert inside the request: serve the cached conversion, or the
+    # source while the conversion runs in the background for next time
+    source = current_ebooks[index].path
+    output = calibre.converter.cached_output(source)
+    if output == source:
+        calibre.converter.convert_in_background(source)
     return send_file(
-        ebook.path,
+        output,
         as_attachment=True,
-        download_name=ebook.path.name
+        download_name=output.name
     )
 
 
@@ -859,14 +909,17 @@ def kobo_status():
         'device_name': device.name if device else None,
         'opds_url': opds_url,
         'local_ip': local_ip,
-        'app_url': f"http://{local_ip}:5050"
+        'app_url': f"http://{local_ip}:{app.config.get('PORT', DEFAULT_PORT)}"
     })
 
 
-def run():
+def run(options: Optional[ServeOptions] = None):
     from src.core.calibre import get_local_ip
+    options = options or ServeOptions()
     local_ip = get_local_ip()
-    port = 5050
+    port = options.port
+    # Advertised in /api/kobo-status
+    app.config['PORT'] = port
 
     print("\n" + "="*50)
     print("  KOBO CALIBRE SYNC")
@@ -874,7 +927,7 @@ def run():
     print(f"  Mac:  http://127.0.0.1:{port}")
     print(f"  Kobo: http://{local_ip}:{port}")
     print("="*50 + "\n")
-    app.run(debug=False, port=port, host='0.0.0.0')
+    serve(app, options)
 
 
 if __name__ == '__main__':
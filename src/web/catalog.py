@@ -0,0 +1,216 @@
+"""Scanned ebook catalog with pre-rendered pages cached per generation"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from flask import Response
+
+from src.core.metadata import MetadataCache
+from src.core.scanner import Ebook
+from src.core.writeback import author_sort
+
+
+RECENT = "recent"
+TITLE = "title"
+AUTHOR = "author"
+SORTS = (RECENT, TITLE, AUTHOR)
+
+# Letter-jump group for titles and authors not starting with A-Z
+OTHER = "#"
+
+
+@dataclass
+class CatalogEntry:
+    """Display metadata of one scanned ebook; ``index`` is its /download index"""
+    index: int
+    title: str
+    author: str
+    format: str
+    mtime: float = 0.0
+
+
+@dataclass
+class RenderedPage:
+    body: bytes
+    etag: str
+
+    def response(self, request) -> Response:
+        """The page with its ETag, or an empty 304 if the client already has it"""
+        response = Response(self.body, mimetype="text/html")
+        response.set_etag(self.etag)
+        # Always revalidate, so a refresh after a scan shows the new catalog
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+Renderer = Callable[["Catalog"], str]
+
+
+def fold(text: str) -> str:
+    """Case- and accent-insensitive form used for sorting ("Èra" -> "era")"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def initial(key: str) -> str:
+    """Letter-jump group of a folded sort key"""
+    first = key[:1].upper()
+    return first if "A" <= first <= "Z" else OTHER
+
+
+def sort_keys(entry: CatalogEntry) -> Dict[str, tuple]:
+    title = fold(entry.title)
+    author = fold(author_sort(entry.author)) if entry.author else ""
+    return {
+        RECENT: (-entry.mtime, title),
+        TITLE: (title, author),
+        # Books without an author go last
+        AUTHOR: (not author, author, title),
+    }
+
+
+def paginate(sizes: List[int], budget: int, max_items: int) -> List[Tuple[int, int]]:
+    """(start, end) slices of items whose sizes fit ``budget`` and ``max_items``
+
+    An item bigger than the budget on its own gets a page to itself.
+    """
+    pages = []
+    start, used = 0, 0
+    for i, size in enumerate(sizes):
+        if i > start and (used + size > budget or i - start >= max_items):
+            pages.append((start, i))
+            start, used = i, 0
+        used += size
+    if start < len(sizes) or not pages:
+        pages.append((start, len(sizes)))
+    return pages
+
+
+class Catalog:
+    """The scanned ebooks, their metadata and the pages rendered from them
+
+    Every scan that changes the set of files (or any file's size or mtime)
+    starts a new generation. Pages are rendered once per generation and
+    served from memory with a content-hash ETag; registered pages are
+    re-rendered in the background as soon as a scan changes the catalog,
+    so the next request finds them ready.
+    """
+
+    def __init__(self, metadata: Optional[MetadataCache] = None):
+        self.metadata = metadata or MetadataCache()
+        self.ebooks: List[Ebook] = []
+        self.entries: List[CatalogEntry] = []
+        self.generation = 0
+        self._stamp: Tuple = ()
+        self._pages: Dict[Hashable, RenderedPage] = {}
+        self._derived: Dict[Hashable, Any] = {}
+        self._prerender: Dict[Hashable, Renderer] = {}
+        self._pending: Optional[Future] = None
+        self._lock = threading.RLock()
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog")
+
+    def update(self, ebooks: List[Ebook]) -> bool:
+        """Replace the catalog after a scan; returns True if anything changed"""
+        stamp = []
+        for ebook in ebooks:
+            try:
+                stat = ebook.path.stat()
+                stamp.append((str(ebook.path), stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                stamp.append((str(ebook.path), None, None))
+        stamp = tuple(stamp)
+        with self._lock:
+            if stamp == self._stamp:
+                return False
+        entries = [self._entry(i, ebook) for i, ebook in enumerate(ebooks)]
+        with self._lock:
+            self.ebooks = list(ebooks)
+            self.entries = entries
+            self._stamp = stamp
+            self.generation += 1
+            self._pages.clear()
+            self._derived.clear()
+            if self._prerender:
+                self._pending = self._background.submit(self._render_registered, self.generation)
+        return True
+
+    def _entry(self, index: int, ebook: Ebook) -> CatalogEntry:
+        try:
+            metadata = self.metadata.get(ebook.path)
+            mtime = ebook.path.stat().st_mtime
+        except OSError:
+            metadata, mtime = None, 0.0
+        return CatalogEntry(
+            index=index,
+            title=(metadata and metadata.title) or ebook.path.stem,
+            author=(metadata and metadata.author) or "",
+            format=ebook.path.suffix.upper().replace(".", ""),
+            mtime=mtime,
+        )
+
+    def derived(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """A value computed from the catalog, memoised for the current generation"""
+        with self._lock:
+            generation = self.generation
+            if key in self._derived:
+                return self._derived[key]
+        value = compute()
+        with self._lock:
+            if generation == self.generation:
+                self._derived[key] = value
+        return value
+
+    def sort_keys(self) -> List[Dict[str, tuple]]:
+        """Every entry's sort keys, by catalog index"""
+        return self.derived("sort-keys", lambda: [sort_keys(entry) for entry in self.entries])
+
+    def ordered(self, sort: str) -> List[CatalogEntry]:
+        """Entries in one of the SORTS orders"""
+        def compute():
+            keys = self.sort_keys()
+            return sorted(self.entries, key=lambda entry: keys[entry.index][sort])
+        return self.derived(("ordered", sort), compute)
+
+    def register(self, key: Hashable, render: Renderer):
+        """Render this page in the background whenever the catalog changes"""
+        with self._lock:
+            self._prerender[key] = render
+
+    def page(self, key: Hashable, render: Renderer) -> RenderedPage:
+        """The page for this key in the current generation, rendering it if needed"""
+        with self._lock:
+            page = self._pages.get(key)
+            pending = self._pending
+        if page is not None:
+            return page
+        if pending is not None and key in self._prerender:
+            pending.result()
+            with self._lock:
+                page = self._pages.get(key)
+            if page is not None:
+                return page
+        return self._render(key, render, self.generation)
+
+    def _render(self, key: Hashable, render: Renderer, generation: int) -> RenderedPage:
+        body = render(self).encode("utf-8")
+        page = RenderedPage(body, hashlib.sha256(body).hexdigest()[:20])
+        with self._lock:
+            # Rendered from a catalog that changed meanwhile: serve it, don't keep it
+            if generation == self.generation:
+                self._pages[key] = page
+        return page
+
+    def _render_registered(self, generation: int):
+        for key, render in list(self._prerender.items()):
+            if generation != self.generation:
+                return
+            try:
+                self._render(key, render, generation)
+            except Exception as e:
+                print(f"Error rendering catalog page {key}: {e}")
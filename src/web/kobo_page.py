@@ -0,0 +1,163 @@
+"""The /kobo pages: a paginated catalog sized for the Kobo's e-ink browser"""
+
+from __future__ import annotations
+
+import os
+import string
+from dataclasses import dataclass
+from html import escape
+from typing import Dict, List, Optional, Tuple
+
+from src.web.catalog import AUTHOR, OTHER, RECENT, SORTS, TITLE, Catalog, CatalogEntry, \
+    initial, paginate
+
+
+# Upper bound for one page of HTML, in bytes
+PAGE_BYTES_ENV_VAR = "KOBO_PAGE_BYTES"
+DEFAULT_PAGE_BYTES = 24 * 1024
+
+# Books per page, whatever their size
+PAGE_BOOKS_ENV_VAR = "KOBO_PAGE_BOOKS"
+DEFAULT_PAGE_BOOKS = 30
+
+# Long titles and authors are cut so one book can't blow the page budget
+MAX_TITLE = 150
+MAX_AUTHOR = 80
+
+LETTERS = tuple(string.ascii_uppercase) + (OTHER,)
+
+SORT_LABELS = {
+    RECENT: "Recenti",
+    TITLE: "Titolo",
+    AUTHOR: "Autore",
+}
+
+# One stylesheet for the whole page; system fonts only, black on white,
+# large tap targets
+STYLE = (
+    "body{font-family:serif;background:#fff;color:#000;margin:0;padding:8px}"
+    "h1{background:#000;color:#fff;font-size:20px;margin:-8px -8px 8px;padding:12px}"
+    "a{color:#000}"
+    "p{margin:8px 0}"
+    "nav a,nav b,nav i{display:inline-block;padding:8px 6px;min-width:20px;text-align:center}"
+    "nav i{color:#999;font-style:normal}"
+    "ol{list-style:none;margin:0;padding:0}"
+    "li{border-bottom:1px solid #000;padding:10px 0}"
+    "li a{display:block;font-size:18px;font-weight:bold;text-decoration:none}"
+    "li span{font-size:14px}"
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name, "")
+    return int(value) if value.isdigit() and int(value) > 0 else default
+
+
+def _cut(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def page_url(sort: str, page: int) -> str:
+    return f"/kobo?sort={sort}&amp;page={page}"
+
+
+@dataclass
+class Layout:
+    """How one sort order is split into pages"""
+    pages: List[Tuple[int, int]]
+    letters: Dict[str, int]
+
+
+class KoboPages:
+    """Renders the catalog as pages of at most ``budget`` bytes
+
+    Each book is one list item styled by the shared stylesheet. Page
+    boundaries are worked out once per catalog generation and sort order
+    from the size of each book's markup, with room kept for the header,
+    sort links, letter jumps and pager, so every page stays within the
+    budget. The letter bar links to the page where each letter starts.
+    """
+
+    def __init__(self, catalog: Catalog, budget: Optional[int] = None, max_books: Optional[int] = None):
+        self.catalog = catalog
+        self.budget = budget or _env_int(PAGE_BYTES_ENV_VAR, DEFAULT_PAGE_BYTES)
+        self.max_books = max_books or _env_int(PAGE_BOOKS_ENV_VAR, DEFAULT_PAGE_BOOKS)
+
+    def response(self, sort: str, page: int, request):
+        """The requested page as a cached, conditional response"""
+        sort = sort if sort in SORTS else RECENT
+        pages = len(self.layout(sort).pages)
+        page = min(max(page, 1), pages)
+        return self.catalog.page(("kobo", sort, page), lambda c: self.render(sort, page)).response(request)
+
+    def prerender(self):
+        """Render the first page of the default order whenever the catalog changes"""
+        self.catalog.register(("kobo", RECENT, 1), lambda c: self.render(RECENT, 1))
+
+    def rows(self) -> List[str]:
+        """Markup of every book, by catalog index"""
+        return self.catalog.derived("kobo-rows", lambda: [self.row(e) for e in self.catalog.entries])
+
+    @staticmethod
+    def row(entry: CatalogEntry) -> str:
+        details = escape(_cut(entry.author or "Sconosciuto", MAX_AUTHOR))
+        return (f'<li><a href="/download/{entry.index}">{escape(_cut(entry.title, MAX_TITLE))}</a>'
+                f'<span>{details} · {escape(entry.format)}</span></li>\n')
+
+    def layout(self, sort: str) -> Layout:
+        def compute():
+            entries = self.catalog.ordered(sort)
+            rows = self.rows()
+            # Chrome for the worst case: both pager links, every letter linked,
+            # page numbers as long as they can get
+            worst = len(entries) + 1
+            reserve = len(self.chrome(sort, worst, worst + 1, dict.fromkeys(LETTERS, worst)).encode("utf-8"))
+            sizes = [len(rows[entry.index].encode("utf-8")) for entry in entries]
+            pages = paginate(sizes, self.budget - reserve, self.max_books)
+            letters: Dict[str, int] = {}
+            if sort != RECENT:
+                keys = self.catalog.sort_keys()
+                # Folded title, or folded author sort ("" for no author, grouped under OTHER)
+                position = 1 if sort == AUTHOR else 0
+                for number, (start, end) in enumerate(pages, 1):
+                    for entry in entries[start:end]:
+                        letters.setdefault(initial(keys[entry.index][sort][position]), number)
+            return Layout(pages, letters)
+        return self.catalog.derived(("kobo-layout", sort), compute)
+
+    def render(self, sort: str, page: int) -> str:
+        layout = self.layout(sort)
+        header, footer = self.chrome(sort, page, len(layout.pages), layout.letters).split("\0")
+        entries = self.catalog.ordered(sort)
+        rows = self.rows()
+        start, end = layout.pages[page - 1]
+        if entries:
+            books = "".join(rows[entry.index] for entry in entries[start:end])
+        else:
+            books = "<li>Nessun libro. Scansiona prima dal Mac.</li>\n"
+        return f"{header}{books}{footer}"
+
+    def chrome(self, sort: str, page: int, pages: int, letters: Dict[str, int]) -> str:
+        """Everything around the book list, with a NUL where the list goes"""
+        sorts = " ".join(f"<b>{label}</b>" if key == sort else f'<a href="{page_url(key, 1)}">{label}</a>'
+                         for key, label in SORT_LABELS.items())
+        jumps = ""
+        if sort != RECENT:
+            jumps = "<nav>" + "".join(
+                f'<a href="{page_url(sort, letters[letter])}">{letter}</a>' if letter in letters
+                else f"<i>{letter}</i>"
+                for letter in LETTERS) + "</nav>\n"
+        previous = f'<a href="{page_url(sort, page - 1)}">« Indietro</a>' if page > 1 else ""
+        following = f'<a href="{page_url(sort, page + 1)}">Avanti »</a>' if page < pages else ""
+        return (
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="UTF-8">\n'
+            '<meta name="viewport" content="width=device-width, initial-scale=1">\n'
+            f"<title>Kobo Calibre Sync</title>\n<style>{STYLE}</style>\n</head>\n<body>\n"
+            "<h1>■ KOBO CALIBRE SYNC</h1>\n"
+            f'<p><b>{len(self.catalog.entries)}</b> libri disponibili · '
+            f'<a href="{page_url(sort, page)}">Aggiorna</a></p>\n'
+            f"<nav>Ordina: {sorts}</nav>\n{jumps}"
+            "<ol>\n\0</ol>\n"
+            f"<nav>{previous} <b>Pagina {page} di {pages}</b> {following}</nav>\n"
+            "</body>\n</html>\n"
+        )
@@ -0,0 +1,137 @@
+"""Serving the web app: Flask's development server or a production WSGI server"""
+
+from __future__ import annotations
+
+import os
+import signal
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    from waitress.server import create_server
+except ImportError:  # Optional dependency, only needed for the production mode
+    create_server = None
+
+
+# dev (Flask's own server) or production (waitress)
+SERVER_ENV_VAR = "KOBO_SERVER"
+THREADS_ENV_VAR = "KOBO_THREADS"
+# Seconds a request may wait for a library's write queue before giving up
+REQUEST_TIMEOUT_ENV_VAR = "KOBO_REQUEST_TIMEOUT"
+# Seconds an idle keep-alive connection is kept open
+IDLE_TIMEOUT_ENV_VAR = "KOBO_IDLE_TIMEOUT"
+
+DEV = "dev"
+PRODUCTION = "production"
+
+DEFAULT_PORT = 5050
+DEFAULT_THREADS = 8
+DEFAULT_REQUEST_TIMEOUT = 600.0
+DEFAULT_IDLE_TIMEOUT = 30
+# Seconds in-flight requests get to finish after SIGTERM
+DEFAULT_GRACE = 20.0
+
+
+def _env_number(name: str, default, cast=float):
+    try:
+        return cast(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def request_timeout() -> float:
+    return _env_number(REQUEST_TIMEOUT_ENV_VAR, DEFAULT_REQUEST_TIMEOUT)
+
+
+@dataclass
+class ServeOptions:
+    """How to serve the app; unset fields come from the environment"""
+    host: str = "0.0.0.0"
+    port: int = DEFAULT_PORT
+    mode: Optional[str] = None
+    threads: Optional[int] = None
+    idle_timeout: Optional[int] = None
+    grace: float = DEFAULT_GRACE
+
+    def __post_init__(self):
+        self.mode = (self.mode or os.environ.get(SERVER_ENV_VAR) or DEV).lower()
+        if self.threads is None:
+            self.threads = _env_number(THREADS_ENV_VAR, DEFAULT_THREADS, int)
+        if self.idle_timeout is None:
+            self.idle_timeout = _env_number(IDLE_TIMEOUT_ENV_VAR, DEFAULT_IDLE_TIMEOUT, int)
+
+
+def make_production_server(app, options: ServeOptions):
+    """A waitress server: a pool of worker threads behind one I/O loop
+
+    Connections are HTTP/1.1 keep-alive and closed after ``idle_timeout``
+    seconds without traffic. Slow clients are buffered by the I/O loop, so
+    workers are only held for the time the app spends on a request.
+    """
+    return create_server(
+        app,
+        host=options.host,
+        port=options.port,
+        threads=options.threads,
+        channel_timeout=options.idle_timeout,
+        connection_limit=max(100, options.threads * 16),
+        ident="kobo-calibre-sync",
+    )
+
+
+# busy() and shutdown_gracefully() rely on waitress internals (server._map,
+# channel.requests, channel.total_outbufs_len, server.trigger), which is why
+# the "server" extra pins waitress to the 2.x/3.x series they were checked on
+
+def busy(server) -> bool:
+    """Whether any connection still has a request being handled or unsent output"""
+    for channel in list(server._map.values()):
+        if getattr(channel, "requests", None) or getattr(channel, "total_outbufs_len", 0):
+            return True
+    return False
+
+
+def shutdown_gracefully(server, grace: float = DEFAULT_GRACE):
+    """Stop accepting, let in-flight requests finish (up to ``grace`` s), then stop
+
+    Safe to call from a signal handler: the waiting happens on a thread and
+    the I/O loop is stopped from inside itself once the server is idle.
+    """
+    server.accepting = False
+
+    def close_all():
+        for channel in list(server._map.values()):
+            channel.close()
+
+    def drain():
+        deadline = time.monotonic() + grace
+        while busy(server) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        server.trigger.pull_trigger(close_all)
+
+    threading.Thread(target=drain, name="graceful-shutdown", daemon=True).start()
+
+
+def serve(app, options: ServeOptions):
+    """Serve until SIGTERM/Ctrl-C, then return so atexit handlers run"""
+    if options.mode == PRODUCTION and create_server is None:
+        print("waitress non installato (pip install waitress): uso il server di sviluppo")
+        options.mode = DEV
+
+    if options.mode != PRODUCTION:
+        # systemd stops the service with SIGTERM; exit normally so the
+        # content server started by CalibreManager is shut down via atexit
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        app.run(debug=False, port=options.port, host=options.host, threaded=True)
+        return
+
+    server = make_production_server(app, options)
+    signal.signal(signal.SIGTERM, lambda signum, frame: shutdown_gracefully(server, options.grace))
+    print(f"  Server: waitress, {options.threads} thread")
+    try:
+        server.run()
+    finally:
+        server.task_dispatcher.shutdown(timeout=options.grace)
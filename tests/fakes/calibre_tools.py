@@ -0,0 +1,430 @@
+"""Stand-in calibredb, calibre-server, ebook-convert and calibre-debug executables
+
+The fake tools keep their library in a SQLite metadata.db using a subset of
+calibre's own ``books`` schema. calibredb either opens the database directly
+(``--library-path``) or forwards the command to a running fake content server
+(``--with-library=http://...``), mirroring calibre's remote mode. Supported calibredb commands are ``add``,
+``list`` (including ``--for-machine``) and ``set_metadata``; calibre-debug runs
+``-e`` scripts against a stub ``calibre.library.db`` over the same database. Latency and
+failures can be injected through the FAKE_CALIBRE_* environment variables
+described in ``_inject_faults``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import stat
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL DEFAULT 'Unknown',
+    sort TEXT,
+    author_sort TEXT,
+    isbn TEXT DEFAULT '',
+    authors TEXT DEFAULT 'Unknown',
+    series TEXT,
+    series_index REAL DEFAULT 1.0,
+    path TEXT NOT NULL DEFAULT '',
+    uuid TEXT,
+    has_cover BOOL DEFAULT 0,
+    timestamp TIMESTAMP,
+    last_modified TIMESTAMP NOT NULL DEFAULT '2000-01-01 00:00:00+00:00'
+);
+"""
+
+SHIM = """#!{python}
+import sys
+sys.path.insert(0, {root!r})
+from tests.fakes.calibre_tools import {entry}
+sys.exit({entry}(sys.argv[1:]))
+"""
+
+
+def install_fake_calibre(bin_dir: Path) -> Path:
+    """Write executable shims for the fake calibre tools into bin_dir"""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name, entry in (("calibredb", "calibredb_main"),
+                        ("calibre-server", "server_main"),
+                        ("ebook-convert", "convert_main"),
+                        ("calibre-debug", "debug_main")):
+        script = bin_dir / name
+        script.write_text(SHIM.format(python=sys.executable, root=str(REPO_ROOT), entry=entry))
+        script.chmod(script.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(sep=" ")
+
+
+def connect(library: Path) -> sqlite3.Connection:
+    """Open (and initialise if needed) the fake library database"""
+    library.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(library / "metadata.db"), timeout=60,
+                           isolation_level=None, check_same_thread=False)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def run_command(conn: sqlite3.Connection, library: Path, command: str,
+                args: List[str]) -> Tuple[int, str, str]:
+    """Execute a calibredb command; returns (returncode, stdout, stderr)"""
+    handler = COMMANDS.get(command)
+    if handler is None:
+        return 1, "", f"Unknown command: {command}\n"
+    return handler(conn, library, args)
+
+
+def _add(conn: sqlite3.Connection, library: Path, args: List[str]) -> Tuple[int, str, str]:
+    files = [Path(a) for a in args if not a.startswith("-")]
+    ids, duplicates = [], []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for source in files:
+            if not source.exists():
+                conn.execute("ROLLBACK")
+                return 1, "", f"No such file: {source}\n"
+            title = source.stem
+            if conn.execute("SELECT 1 FROM books WHERE title = ?", (title,)).fetchone():
+                duplicates.append(title)
+                continue
+            now = _now()
+            cursor = conn.execute(
+                "INSERT INTO books (title, sort, author_sort, uuid, timestamp, last_modified) "
+                "VALUES (?, ?, 'Unknown', ?, ?, ?)",
+                (title, title, str(uuid.uuid4()), now, now),
+            )
+            book_id = cursor.lastrowid
+            book_dir = f"Unknown/{title} ({book_id})"
+            (library / book_dir).mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, library / book_dir / source.name)
+            conn.execute("UPDATE books SET path = ? WHERE id = ?", (book_dir, book_id))
+            ids.append(book_id)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    stdout = ""
+    if duplicates:
+        stdout += ("The following books were not added as they already exist in the "
+                   "database (see --duplicates option):\n")
+        stdout += "".join(f"  {title}\n" for title in duplicates)
+    if ids:
+        stdout += "Added book ids: " + ", ".join(str(i) for i in ids) + "\n"
+    return 0, stdout, ""
+
+
+def _option(args: List[str], name: str, default: str = "") -> str:
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def _book_row(library: Path, row: sqlite3.Row, fields: List[str]) -> dict:
+    book = {"id": row["id"]}
+    for name in fields:
+        if name == "formats":
+            book_dir = library / row["path"]
+            book[name] = sorted(str(p) for p in book_dir.iterdir()) if book_dir.is_dir() else []
+        elif name == "authors":
+            book[name] = row["authors"]
+        elif name in row.keys():
+            book[name] = row[name]
+    return book
+
+
+def _list(conn: sqlite3.Connection, library: Path, args: List[str]) -> Tuple[int, str, str]:
+    fields = _option(args, "--fields", "title,authors").split(",")
+    search = _option(args, "--search")
+    limit = int(_option(args, "--limit", "-1"))
+
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("SELECT * FROM books ORDER BY id").fetchall()
+    ids = {int(i) for i in re.findall(r"id:(\d+)", search)}
+    if ids:
+        rows = [row for row in rows if row["id"] in ids]
+    elif search:
+        rows = [row for row in rows if search.lower() in row["title"].lower()]
+    if limit >= 0:
+        rows = rows[:limit]
+
+    books = [_book_row(library, row, fields) for row in rows]
+    if "--for-machine" in args:
+        return 0, json.dumps(books, indent=2), ""
+    lines = [" ".join(str(book.get(name, "")) for name in ["id", *fields]) for book in books]
+    return 0, "\n".join(lines) + "\n", ""
+
+
+# calibredb --field names mapped to columns of the fake books table
+FIELD_COLUMNS = {
+    "title": "title",
+    "authors": "authors",
+    "author_sort": "author_sort",
+    "isbn": "isbn",
+    "series": "series",
+    "series_index": "series_index",
+}
+
+
+def _set_metadata(conn: sqlite3.Connection, library: Path, args: List[str]) -> Tuple[int, str, str]:
+    positional = [a for i, a in enumerate(args)
+                  if not a.startswith("-") and (i == 0 or args[i - 1] not in ("--field", "-f"))]
+    book_id = int(positional[0])
+    updates = {}
+    for i, arg in enumerate(args):
+        if arg in ("--field", "-f"):
+            name, _, value = args[i + 1].partition(":")
+            if name not in FIELD_COLUMNS:
+                return 1, "", f"Unknown field: {name}\n"
+            updates[FIELD_COLUMNS[name]] = value
+    if not conn.execute("SELECT 1 FROM books WHERE id = ?", (book_id,)).fetchone():
+        return 1, "", f"No book with id: {book_id}\n"
+    if updates:
+        assignments = ", ".join(f"{column} = ?" for column in updates)
+        conn.execute(f"UPDATE books SET {assignments}, last_modified = ? WHERE id = ?",
+                     (*updates.values(), _now(), book_id))
+    return 0, "", ""
+
+
+COMMANDS = {
+    "add": _add,
+    "list": _list,
+    "set_metadata": _set_metadata,
+}
+
+
+def _inject_faults(command: str) -> Optional[Tuple[int, str, str]]:
+    """Apply configured latency; return a failure result if one is injected
+
+    FAKE_CALIBRE_LATENCY_MS     delay added to every command
+    FAKE_CALIBRE_FAIL_RATE      probability (0-1) that a command fails
+    FAKE_CALIBRE_FAIL_COMMANDS  comma-separated commands eligible to fail (default all)
+    FAKE_CALIBRE_FAIL_MESSAGE   stderr of injected failures
+    """
+    latency = int(os.environ.get("FAKE_CALIBRE_LATENCY_MS", "0"))
+    if latency:
+        time.sleep(latency / 1000)
+    rate = float(os.environ.get("FAKE_CALIBRE_FAIL_RATE", "0"))
+    eligible = os.environ.get("FAKE_CALIBRE_FAIL_COMMANDS", "")
+    if rate and (not eligible or command in eligible.split(",")) and random.random() < rate:
+        message = os.environ.get("FAKE_CALIBRE_FAIL_MESSAGE", "injected failure")
+        return 1, "", message + "\n"
+    return None
+
+
+def _split_library(argv: List[str]) -> Tuple[str, List[str]]:
+    """Separate the library option from the remaining calibredb arguments"""
+    library = ""
+    rest = []
+    for arg in argv:
+        if arg.startswith(("--library-path=", "--with-library=")):
+            library = arg.split("=", 1)[1]
+        else:
+            rest.append(arg)
+    return library, rest
+
+
+def calibredb_main(argv: List[str]) -> int:
+    command, args = argv[0], argv[1:]
+    library, args = _split_library(args)
+
+    failure = _inject_faults(command)
+    if failure:
+        returncode, stdout, stderr = failure
+    elif library.startswith("http"):
+        base, _, library_id = library.partition("/#")
+        request = urllib.request.Request(
+            f"{base}/cdb/cmd/{command}/0?library_id={library_id}",
+            data=json.dumps({"args": args}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=60) as response:
+            payload = json.load(response)
+        returncode, stdout, stderr = payload["returncode"], payload["stdout"], payload["stderr"]
+    else:
+        library_dir = Path(library or ".")
+        conn = connect(library_dir)
+        try:
+            returncode, stdout, stderr = run_command(conn, library_dir, command, args)
+        finally:
+            conn.close()
+
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return returncode
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_FakeContentServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/opds"):
+            # Like calibre, 404 for a library this server does not serve
+            _, _, query = self.path.partition("?library_id=")
+            if query and query != self.server.library.name.replace(" ", "_"):
+                self._send(404, b"", "text/plain")
+                return
+            body = (b'<?xml version="1.0" encoding="UTF-8"?>'
+                    b'<feed xmlns="http://www.w3.org/2005/Atom"><title>calibre</title></feed>')
+            self._send(200, body, "application/atom+xml")
+        else:
+            self._send(404, b"", "text/plain")
+
+    def do_POST(self):
+        if not self.path.startswith("/cdb/cmd/"):
+            self._send(404, b"", "text/plain")
+            return
+        command = self.path[len("/cdb/cmd/"):].split("/", 1)[0]
+        length = int(self.headers.get("Content-Length", 0))
+        args = json.loads(self.rfile.read(length) or b"{}").get("args", [])
+        with self.server.db_lock:
+            returncode, stdout, stderr = run_command(
+                self.server.conn, self.server.library, command, args)
+        body = json.dumps({"returncode": returncode, "stdout": stdout, "stderr": stderr})
+        self._send(200, body.encode(), "application/json")
+
+
+class _FakeContentServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, library: Path):
+        super().__init__(address, _Handler)
+        self.library = library
+        self.conn = connect(library)
+        self.conn.execute("PRAGMA busy_timeout = 60000")
+        self.db_lock = threading.Lock()
+
+
+def _simulate_server_activity(server: _FakeContentServer, busy_ms: int):
+    """Hold the library write lock periodically, like a busy content server"""
+    while True:
+        with server.db_lock:
+            server.conn.execute("BEGIN EXCLUSIVE")
+            time.sleep(busy_ms / 1000)
+            server.conn.execute("COMMIT")
+        time.sleep(busy_ms / 1000)
+
+
+def server_main(argv: List[str]) -> int:
+    library = Path(next(a for a in argv if not a.startswith("-")))
+    port = int(argv[argv.index("--port") + 1]) if "--port" in argv else 8080
+    server = _FakeContentServer(("127.0.0.1", port), library)
+    busy_ms = int(os.environ.get("FAKE_CALIBRE_SERVER_BUSY_MS", "0"))
+    if busy_ms:
+        threading.Thread(target=_simulate_server_activity, args=(server, busy_ms),
+                         daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def convert_main(argv: List[str]) -> int:
+    """ebook-convert stand-in: copies the input, tagged with the output format"""
+    source, output = Path(argv[0]), Path(argv[1])
+    if not source.exists():
+        sys.stderr.write(f"No such file: {source}\n")
+        return 1
+    output.write_bytes(source.read_bytes() + f"\nconverted:{output.suffix}".encode())
+    sys.stdout.write(f"Output saved to {output}\n")
+    return 0
+
+
+class _FakeCache:
+    """The subset of calibre's ``db(library).new_api`` used by the write-back script"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def all_book_ids(self):
+        return {row[0] for row in self.conn.execute("SELECT id FROM books")}
+
+    def field_for(self, name: str, book_id: int):
+        if name != "identifiers":
+            raise ValueError(f"Unsupported field: {name}")
+        row = self.conn.execute("SELECT isbn FROM books WHERE id = ?", (book_id,)).fetchone()
+        return {"isbn": row[0]} if row and row[0] else {}
+
+    def set_field(self, name: str, values: dict):
+        if name == "identifiers":
+            values = {book_id: identifiers.get("isbn", "") for book_id, identifiers in values.items()}
+            name = "isbn"
+        elif name not in FIELD_COLUMNS:
+            raise ValueError(f"Unknown field: {name}")
+        elif name == "series_index" and not all(isinstance(v, float) for v in values.values()):
+            raise TypeError("series_index must be a float")
+        for book_id, value in values.items():
+            self.conn.execute(f"UPDATE books SET {FIELD_COLUMNS[name]} = ?, last_modified = ? WHERE id = ?",
+                              (value, _now(), book_id))
+
+
+def _calibre_stub(conn: sqlite3.Connection) -> dict:
+    """Stub ``calibre`` and ``calibre.library`` modules backed by the fake database"""
+    import types
+    calibre = types.ModuleType("calibre")
+    library = types.ModuleType("calibre.library")
+    library.db = lambda path: types.SimpleNamespace(new_api=_FakeCache(conn))
+    calibre.library = library
+    return {"calibre": calibre, "calibre.library": library}
+
+
+def debug_main(argv: List[str]) -> int:
+    """calibre-debug stand-in for ``-e script payload.json``
+
+    Runs the given script for real, with ``calibre.library.db`` stubbed by a
+    cache that reads and writes the fake metadata.db in one transaction.
+    """
+    failure = _inject_faults("calibre-debug")
+    if failure:
+        sys.stderr.write(failure[2])
+        return failure[0]
+    if argv[:1] != ["-e"] or len(argv) < 2:
+        sys.stderr.write("Only -e script is supported\n")
+        return 2
+    script = Path(argv[1])
+    payload = json.loads(Path(argv[-1]).read_text())
+    conn = connect(Path(payload["library"]))
+    sys.modules.update(_calibre_stub(conn))
+    sys.argv = [str(script)] + argv[2:]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        exec(compile(script.read_text(), str(script), "exec"), {"__name__": "__main__"})
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    conn.close()
+    return 0
@@ -0,0 +1,189 @@
+"""Builders for a simulated Kobo volume and a fake Kobo device"""
+
+from __future__ import annotations
+
+import contextlib
+import errno
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import Iterable, Optional
+from unittest import mock
+
+import src.core.usb_copy as usb_copy
+from src.core.calibre import DeviceInfo
+
+# Subset of the content table of a real KoboReader.sqlite
+CONTENT_SCHEMA = """
+CREATE TABLE content (
+    ContentID TEXT NOT NULL,
+    ContentType TEXT NOT NULL,
+    MimeType TEXT NOT NULL DEFAULT 'application/x-kobo-epub+zip',
+    BookID TEXT,
+    BookTitle TEXT,
+    Title TEXT,
+    Attribution TEXT,
+    ISBN TEXT,
+    ReadStatus INT DEFAULT 0,
+    ___PercentRead INTEGER DEFAULT 0,
+    DateLastRead TEXT,
+    ___FileSize INT DEFAULT 0,
+    PRIMARY KEY (ContentID)
+);
+"""
+
+
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+ROOT_MOUNT = "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n"
+
+
+def create_kobo_db(device_root: Path, books: Iterable[dict] = ()) -> Path:
+    """Create .kobo/KoboReader.sqlite with one content row per book dict
+
+    Book dicts use the column names of the content table; ContentType
+    defaults to 6 (book). A ``path`` key is turned into a sideloaded
+    ContentID (file:///mnt/onboard/<path>).
+    """
+    db_path = Path(device_root) / ".kobo" / "KoboReader.sqlite"
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(CONTENT_SCHEMA)
+    for book in books:
+        add_content(conn, **book)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def add_content(conn: sqlite3.Connection, path: Optional[str] = None, **columns):
+    if path is not None:
+        columns["ContentID"] = f"file:///mnt/onboard/{path}"
+    columns.setdefault("ContentType", 6)
+    names = ", ".join(columns)
+    marks = ", ".join("?" for _ in columns)
+    conn.execute(f"INSERT INTO content ({names}) VALUES ({marks})", tuple(columns.values()))
+
+
+class FakeKobo:
+    """A simulated Kobo: a directory that looks like its USB volume
+
+    The volume has a .kobo/KoboReader.sqlite and, while ``attached()``, an
+    entry in a private mount table that KOBO_MOUNT_TABLE points at, so
+    check_kobo_usb finds it like a real mount. Optionally the volume gets a
+    free-space quota (reported through shutil.disk_usage and enforced with
+    ENOSPC on writes), a per-file write latency, a write throughput cap and
+    a random write failure rate; these apply to files the USB copy engine
+    writes under the volume and nothing else.
+    """
+
+    def __init__(self, base: Path, name: str = "KOBOeReader", books: Iterable[dict] = (),
+                 quota: Optional[int] = None, write_latency_ms: float = 0.0,
+                 write_mb_per_s: float = 0.0, fail_rate: float = 0.0, seed: int = 0):
+        self.root = Path(base) / name
+        self.mount_table = Path(base) / "mountinfo"
+        self.quota = quota
+        self.write_latency_ms = write_latency_ms
+        self.write_mb_per_s = write_mb_per_s
+        self.fail_rate = fail_rate
+        self.writes = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Bytes of writes under way, not yet visible in the files' sizes
+        self._in_flight = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = create_kobo_db(self.root, books)
+        (self.root / ".kobo" / "version").write_text(
+            "N000000000000,4.9.77,4.38.21908,4.9.77,4.9.77,00000000-0000-0000-0000-000000000387\n")
+        self.mount_table.write_text(ROOT_MOUNT)
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return DeviceInfo(name=self.root.name, path=str(self.root), connected=True)
+
+    def used(self) -> int:
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.stat(os.path.join(directory, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def mount(self):
+        escaped = str(self.root).replace(" ", "\\040")
+        self.mount_table.write_text(
+            ROOT_MOUNT + f"98 22 8:17 / {escaped} rw,nosuid shared:50 - vfat /dev/sdb rw,uid=1000\n")
+        self._bump_mount_table()
+
+    def unmount(self):
+        self.mount_table.write_text(ROOT_MOUNT)
+        self._bump_mount_table()
+
+    def _bump_mount_table(self):
+        stat = self.mount_table.stat()
+        os.utime(self.mount_table, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    @contextlib.contextmanager
+    def attached(self):
+        """Mount the device and install the quota and write fault hooks"""
+        real_transfer = usb_copy.transfer
+        real_disk_usage = shutil.disk_usage
+
+        def disk_usage(path):
+            if self.quota is None or not self._owns(path):
+                return real_disk_usage(path)
+            used = self.used()
+            return DiskUsage(self.quota, used, max(self.quota - used, 0))
+
+        def transfer(src_fd, dst_fd, size, *args, **kwargs):
+            if not self._owns(os.readlink(f"/proc/self/fd/{dst_fd}")):
+                return real_transfer(src_fd, dst_fd, size, *args, **kwargs)
+            with self._lock:
+                self.writes += 1
+                fail = self.fail_rate and self._random.random() < self.fail_rate
+                full = self.quota is not None and self.used() + self._in_flight + size > self.quota
+                if fail:
+                    self.failures += 1
+                elif not full:
+                    self._in_flight += size
+            if fail:
+                raise OSError(errno.EIO, "Input/output error (injected)")
+            if full:
+                raise OSError(errno.ENOSPC, "No space left on device (quota)")
+            start = time.perf_counter()
+            try:
+                method = real_transfer(src_fd, dst_fd, size, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= size
+            delay = self.write_latency_ms / 1000
+            if self.write_mb_per_s:
+                delay += size / (self.write_mb_per_s * 1e6)
+            remaining = delay - (time.perf_counter() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+            return method
+
+        self.mount()
+        try:
+            with mock.patch.dict(os.environ, {"KOBO_MOUNT_TABLE": str(self.mount_table)}), \
+                    mock.patch.object(shutil, "disk_usage", disk_usage), \
+                    mock.patch.object(usb_copy, "transfer", transfer):
+                yield self
+        finally:
+            self.unmount()
+
+    def _owns(self, path) -> bool:
+        try:
+            Path(path).resolve().relative_to(self.root.resolve())
+            return True
+        except ValueError:
+            return False
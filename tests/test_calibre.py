@@ -0,0 +1,191 @@
+"""Tests for Calibre integration"""
+
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from src.core.calibre import (
+    ADDED,
+    DUPLICATE,
+    FAILED,
+    CalibreError,
+    CalibreManager,
+    resolve_library_path,
+)
+from src.core.executor import CalibreExecutor
+from src.core.scanner import Ebook, EbookScanner
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+class TestLibraryPath:
+    def test_env_var_is_used(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CALIBRE_LIBRARY", str(tmp_path))
+        assert resolve_library_path() == tmp_path.resolve()
+
+    def test_explicit_path_wins_over_env(self, tmp_path, monkeypatch):
+        explicit = tmp_path / "explicit"
+        explicit.mkdir()
+        monkeypatch.setenv("CALIBRE_LIBRARY", str(tmp_path))
+        assert resolve_library_path(str(explicit)) == explicit.resolve()
+
+    def test_missing_configured_path_raises(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CALIBRE_LIBRARY", str(tmp_path / "missing"))
+        with pytest.raises(CalibreError):
+            resolve_library_path()
+
+    def test_common_path_requires_metadata_db(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("CALIBRE_LIBRARY", raising=False)
+        monkeypatch.setattr("pathlib.Path.home", lambda: tmp_path)
+        library = tmp_path / "Calibre Library"
+        library.mkdir()
+        assert resolve_library_path() is None
+
+        (library / "metadata.db").touch()
+        assert resolve_library_path() == library
+
+
+class RecordingExecutor:
+    """Executor stand-in that records commands instead of running them"""
+
+    def __init__(self):
+        self.calls = []
+
+    def run(self, cmd, timeout=None):
+        self.calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+
+class TestRun:
+    def test_library_path_passed_to_calibredb(self, tmp_path):
+        executor = RecordingExecutor()
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path),
+                                 executor=executor)
+        manager._run("add", "book.epub")
+        manager._run("list")
+
+        library_arg = f"--library-path={tmp_path.resolve()}"
+        assert executor.calls == [
+            ["calibredb", "add", library_arg, "book.epub"],
+            ["calibredb", "list", library_arg],
+        ]
+
+    def test_library_resolved_once(self, tmp_path):
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path))
+        first = manager.get_library_path()
+        tmp_path.rename(tmp_path.with_name(tmp_path.name + "-moved"))
+        assert manager.get_library_path() == first
+
+    def test_managed_server_routes_through_content_server(self, tmp_path):
+        class RunningServer:
+            port = 8080
+
+            def is_running(self):
+                return True
+
+        library = tmp_path / "Calibre Library"
+        library.mkdir()
+        executor = RecordingExecutor()
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(library),
+                                 executor=executor)
+        manager._server = RunningServer()
+        manager._run("add", "book.epub")
+
+        assert executor.calls == [[
+            "calibredb", "add",
+            "--with-library=http://127.0.0.1:8080/#Calibre_Library",
+            "book.epub",
+        ]]
+
+
+class ScriptedExecutor:
+    """Executor stand-in answering each calibredb subcommand from a callback"""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+
+    def run(self, cmd, timeout=None):
+        self.calls.append(cmd)
+        returncode, stdout, stderr = self.respond(cmd)
+        return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+
+
+class TestImportBooks:
+    def respond(self, cmd):
+        if cmd[1] == "list":
+            formats = [{"id": 7, "formats": ["/library/A/new.epub"]}]
+            return 0, json.dumps(formats), ""
+        name = Path(cmd[-1]).name
+        if name == "new.epub":
+            return 0, "Added book ids: 7\n", ""
+        if name == "dup.epub":
+            return 0, "The following books were not added as they already exist in the database\n", ""
+        return 1, "", "Traceback: corrupt file"
+
+    def test_maps_each_file_to_outcome(self, tmp_path):
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path),
+                                 executor=ScriptedExecutor(self.respond))
+        ebooks = [Ebook(path=Path(f"/src/{name}")) for name in ("new.epub", "dup.epub", "bad.epub")]
+
+        result = manager.import_books(ebooks)
+
+        by_path = result.by_path()
+        assert by_path[Path("/src/new.epub")].status == ADDED
+        assert by_path[Path("/src/new.epub")].book_id == 7
+        assert by_path[Path("/src/dup.epub")].status == DUPLICATE
+        assert by_path[Path("/src/bad.epub")].status == FAILED
+        assert "corrupt" in by_path[Path("/src/bad.epub")].error
+        assert result.book_ids == [7]
+
+    def test_library_copies_replace_sources(self, tmp_path):
+        executor = ScriptedExecutor(self.respond)
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path),
+                                 executor=executor)
+        ebooks = [Ebook(path=Path(f"/src/{name}")) for name in ("new.epub", "dup.epub", "bad.epub")]
+
+        copies = manager.library_copies(manager.import_books(ebooks))
+
+        assert [e.path for e in copies] == [Path("/library/A/new.epub"), Path("/src/dup.epub")]
+        list_calls = [cmd for cmd in executor.calls if cmd[1] == "list"]
+        assert len(list_calls) == 1
+
+
+class TestWithFakeToolchain:
+    @pytest.fixture
+    def manager(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("KOBO_CONVERT", "none")
+        bin_dir = install_fake_calibre(tmp_path / "bin")
+        library = tmp_path / "library"
+        library.mkdir()
+        return CalibreManager(calibredb_path=str(bin_dir / "calibredb"), library_path=str(library),
+                              executor=CalibreExecutor(max_processes=2, timeout=30))
+
+    @pytest.fixture
+    def ebooks(self, tmp_path):
+        folder = tmp_path / "downloads"
+        folder.mkdir()
+        for name in ("first.epub", "second.epub"):
+            (folder / name).write_bytes(b"PK" + name.encode())
+        return EbookScanner().scan(folder)
+
+    def test_import_then_reimport(self, manager, ebooks):
+        first = manager.import_books(ebooks)
+        assert [book.status for book in first.books] == [ADDED, ADDED]
+
+        again = manager.import_books(ebooks)
+        assert [book.status for book in again.books] == [DUPLICATE, DUPLICATE]
+
+    def test_library_copies_point_into_library(self, manager, ebooks):
+        copies = manager.library_copies(manager.import_books(ebooks))
+        library = manager.get_library_path()
+        assert all(library in copy.path.parents for copy in copies)
+        assert [copy.path.read_bytes() for copy in copies] == [e.path.read_bytes() for e in ebooks]
+
+    def test_injected_failures_are_reported(self, manager, ebooks, monkeypatch):
+        monkeypatch.setenv("FAKE_CALIBRE_FAIL_RATE", "1")
+        monkeypatch.setenv("FAKE_CALIBRE_FAIL_MESSAGE", "disk on fire")
+        result = manager.import_books(ebooks)
+        assert [book.status for book in result.books] == [FAILED, FAILED]
+        assert "disk on fire" in result.books[0].error
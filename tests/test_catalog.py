@@ -0,0 +1,84 @@
+"""Tests for the cached /kobo catalog"""
+
+import os
+
+from flask import Flask, request
+
+from src.core.scanner import EbookScanner
+from src.web.catalog import Catalog
+
+
+def titles(catalog):
+    return ",".join(entry.title for entry in catalog.entries)
+
+
+def make_books(folder, *names):
+    for name in names:
+        (folder / name).write_bytes(b"")
+    return EbookScanner().scan(folder)
+
+
+class TestCatalog:
+    def test_generation_only_moves_when_files_change(self, tmp_path):
+        catalog = Catalog()
+        books = make_books(tmp_path, "a.epub", "b.pdf")
+
+        assert catalog.update(books)
+        assert catalog.generation == 1
+        assert not catalog.update(EbookScanner().scan(tmp_path))
+        assert catalog.generation == 1
+
+        os.utime(tmp_path / "a.epub", ns=(0, 10**9))
+        assert catalog.update(EbookScanner().scan(tmp_path))
+        assert catalog.generation == 2
+
+    def test_pages_are_rendered_once_per_generation(self, tmp_path):
+        catalog = Catalog()
+        renders = []
+
+        def render(c):
+            renders.append(c.generation)
+            return titles(c)
+
+        catalog.update(make_books(tmp_path, "a.epub"))
+        first = catalog.page("kobo", render)
+        assert catalog.page("kobo", render) is first
+        assert renders == [1]
+
+        catalog.update(make_books(tmp_path, "b.epub"))
+        second = catalog.page("kobo", render)
+        assert second.etag != first.etag
+        assert renders == [1, 2]
+
+    def test_registered_pages_are_rendered_in_the_background(self, tmp_path):
+        catalog = Catalog()
+        catalog.register("kobo", titles)
+        catalog.update(make_books(tmp_path, "a.epub"))
+        catalog._pending.result()
+
+        page = catalog.page("kobo", lambda c: "not used")
+        assert page.body == b"a"
+
+    def test_unchanged_page_is_not_modified(self, tmp_path):
+        catalog = Catalog()
+        catalog.update(make_books(tmp_path, "a.epub"))
+        app = Flask(__name__)
+
+        @app.route("/kobo")
+        def kobo():
+            return catalog.page("kobo", titles).response(request)
+
+        client = app.test_client()
+        first = client.get("/kobo")
+        assert first.status_code == 200
+        assert first.headers["Cache-Control"] == "no-cache"
+        etag = first.headers["ETag"]
+
+        again = client.get("/kobo", headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.data == b""
+
+        catalog.update(make_books(tmp_path, "b.epub"))
+        changed = client.get("/kobo", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.data == b"a,b"
@@ -0,0 +1,60 @@
+"""Tests for the library change feed"""
+
+import pytest
+
+from src.core.changes import LibraryChangeFeed
+from tests.fakes.calibre_tools import connect, run_command
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = tmp_path / "library"
+    conn = connect(library)
+    for name in ("a.epub", "b.epub", "c.epub"):
+        (tmp_path / name).write_bytes(b"PK")
+        run_command(conn, library, "add", [str(tmp_path / name)])
+    yield library, conn
+    conn.close()
+
+
+class TestLibraryChangeFeed:
+    def test_first_poll_returns_everything(self, library):
+        path, _ = library
+        changes = LibraryChangeFeed(path).poll()
+        assert [c.title for c in changes.changed] == ["a", "b", "c"]
+        assert changes.removed == []
+
+    def test_quiet_library_yields_nothing(self, library):
+        path, _ = library
+        feed = LibraryChangeFeed(path)
+        feed.poll()
+        assert not feed.poll()
+
+    def test_only_touched_books_are_returned(self, library):
+        path, conn = library
+        feed = LibraryChangeFeed(path)
+        feed.poll()
+
+        run_command(conn, path, "set_metadata", ["2", "--field", "isbn:9780000000000"])
+        changes = feed.poll()
+        assert [c.book_id for c in changes.changed] == [2]
+        assert not feed.poll()
+
+    def test_removed_books_are_reported(self, library):
+        path, conn = library
+        feed = LibraryChangeFeed(path)
+        feed.poll()
+
+        conn.execute("DELETE FROM books WHERE id = 1")
+        assert feed.poll().removed == [1]
+
+    def test_resume_from_watermark(self, library):
+        path, conn = library
+        feed = LibraryChangeFeed(path)
+        feed.poll()
+        watermark = feed.watermark
+        feed.close()
+
+        run_command(conn, path, "set_metadata", ["3", "--field", "title:Renamed"])
+        changes = LibraryChangeFeed(path, watermark=watermark).poll()
+        assert [c.title for c in changes.changed] == ["Renamed"]
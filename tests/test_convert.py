@@ -0,0 +1,92 @@
+"""Tests for the conversion stage"""
+
+import pytest
+
+from src.core.convert import EbookConverter
+from src.core.scanner import Ebook
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+@pytest.fixture
+def ebook_convert(tmp_path):
+    return str(install_fake_calibre(tmp_path / "bin") / "ebook-convert")
+
+
+def make_books(folder, *names):
+    folder.mkdir(exist_ok=True)
+    ebooks = []
+    for name in names:
+        path = folder / name
+        path.write_bytes(name.encode())
+        ebooks.append(Ebook(path=path))
+    return ebooks
+
+
+class TestEbookConverter:
+    def test_converts_epub_to_kepub(self, tmp_path, ebook_convert):
+        converter = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache")
+        [conversion] = converter.convert(make_books(tmp_path / "src", "book.epub"))
+
+        assert conversion.error == ""
+        assert conversion.output.name == "book.kepub.epub"
+        assert conversion.output.read_bytes().endswith(b"converted:.kepub")
+
+    def test_second_conversion_is_cached(self, tmp_path, ebook_convert):
+        converter = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache")
+        ebooks = make_books(tmp_path / "src", "a.epub", "b.epub")
+        first = converter.convert(ebooks)
+        second = converter.convert(ebooks)
+
+        assert not any(c.cached for c in first)
+        assert all(c.cached for c in second)
+        assert [c.output for c in first] == [c.output for c in second]
+        assert converter.executor.metrics().completed == 2
+
+    def test_cache_key_includes_options(self, tmp_path, ebook_convert):
+        [ebook] = make_books(tmp_path / "src", "book.epub")
+        plain = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache")
+        tuned = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache",
+                               options=["--no-default-epub-cover"])
+        assert plain.cache_path(ebook.path) != tuned.cache_path(ebook.path)
+
+    def test_identical_content_shares_cache_entry(self, tmp_path, ebook_convert):
+        converter = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache")
+        [a] = make_books(tmp_path / "one", "book.epub")
+        [b] = make_books(tmp_path / "two", "book.epub")
+        converter.convert([a])
+        assert converter.convert([b])[0].cached
+
+    def test_other_formats_pass_through(self, tmp_path, ebook_convert):
+        converter = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache")
+        ebooks = make_books(tmp_path / "src", "comic.cbz", "done.kepub.epub")
+        assert converter.converted(ebooks) == ebooks
+
+    def test_failure_falls_back_to_source(self, tmp_path):
+        converter = EbookConverter("/bin/false", cache_dir=tmp_path / "cache")
+        [ebook] = make_books(tmp_path / "src", "book.epub")
+        [conversion] = converter.convert([ebook])
+        assert conversion.output == ebook.path
+        assert conversion.error
+        assert converter.convert([ebook])[0].cached
+
+    def test_without_tool_nothing_is_converted(self, tmp_path):
+        converter = EbookConverter(None, cache_dir=tmp_path / "cache")
+        ebooks = make_books(tmp_path / "src", "book.epub")
+        assert converter.converted(ebooks) == ebooks
+
+    def test_mkdir_failure_falls_back_to_source(self, tmp_path, ebook_convert):
+        (tmp_path / "cache").write_text("not a directory")
+        converter = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache")
+        [conversion] = converter.convert(make_books(tmp_path / "src", "book.epub"))
+        assert conversion.output == conversion.source
+        assert conversion.error
+
+    def test_background_conversion_is_served_once_ready(self, tmp_path, ebook_convert):
+        converter = EbookConverter(ebook_convert, cache_dir=tmp_path / "cache")
+        [ebook] = make_books(tmp_path / "src", "book.epub")
+        assert converter.cached_output(ebook.path) == ebook.path
+
+        converter.convert_in_background(ebook.path).result()
+
+        assert converter.cached_output(ebook.path) == converter.cache_path(ebook.path)
+        assert converter.convert_one(ebook.path).cached
@@ -0,0 +1,78 @@
+"""Tests for Kobo detection from the mount table"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from src.core.calibre import CalibreManager
+from src.core.detect import KoboDetector, MountTable, parse_mountinfo
+
+ROOT_LINE = "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n"
+
+
+def mount_line(mount_point: Path, fstype: str = "vfat") -> str:
+    escaped = str(mount_point).replace(" ", "\\040")
+    return f"98 22 8:17 / {escaped} rw,nosuid shared:50 - {fstype} /dev/sdb rw,uid=1000\n"
+
+
+def write_table(path: Path, *lines: str):
+    path.write_text(ROOT_LINE + "".join(lines))
+    # Make sure a rewrite is seen even within the filesystem's mtime granularity
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture
+def kobo(tmp_path):
+    mount_point = tmp_path / "media" / "KOBO eReader"
+    (mount_point / ".kobo").mkdir(parents=True)
+    return mount_point
+
+
+def test_parse_mountinfo_unescapes_paths():
+    mounts = parse_mountinfo(ROOT_LINE + mount_line(Path("/media/KOBO eReader")) + "garbage\n")
+    assert [m.mount_point for m in mounts] == [Path("/"), Path("/media/KOBO eReader")]
+    assert mounts[1].fstype == "vfat"
+    assert mounts[1].source == "/dev/sdb"
+
+
+class TestKoboDetector:
+    def test_finds_kobo_and_caches_until_table_changes(self, tmp_path, kobo, monkeypatch):
+        table = tmp_path / "mountinfo"
+        write_table(table)
+        detector = KoboDetector(mount_table=table)
+        assert detector.find() is None
+
+        write_table(table, mount_line(kobo))
+        assert detector.find() == kobo
+
+        reads = []
+        original = MountTable.read
+        monkeypatch.setattr(MountTable, "read", lambda self: reads.append(1) or original(self))
+        for _ in range(5):
+            assert detector.find() == kobo
+        assert reads == []
+
+        write_table(table)
+        assert detector.find() is None
+        assert reads == [1]
+
+    def test_ignores_non_removable_filesystems(self, tmp_path, kobo):
+        table = tmp_path / "mountinfo"
+        write_table(table, mount_line(kobo, fstype="nfs4"))
+        assert KoboDetector(mount_table=table).find() is None
+
+    def test_volumes_fallback(self, tmp_path, kobo, monkeypatch):
+        monkeypatch.setattr("src.core.detect.PROC_MOUNTINFO", tmp_path / "missing")
+        detector = KoboDetector(volumes=kobo.parent)
+        assert detector.find() == kobo
+
+    def test_manager_uses_configured_mount_table(self, tmp_path, kobo, monkeypatch):
+        table = tmp_path / "mountinfo"
+        write_table(table, mount_line(kobo))
+        monkeypatch.setenv("KOBO_MOUNT_TABLE", str(table))
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path))
+        device = manager.check_kobo_usb()
+        assert device.name == "KOBO eReader"
+        assert device.path == str(kobo)
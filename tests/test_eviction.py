@@ -0,0 +1,86 @@
+"""Tests for removing read books from the device to make room"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from src.core.calibre import CalibreManager
+from src.core.eviction import EvictionPolicy
+from src.core.kobo_db import FINISHED, READING, KoboDatabase
+from src.core.scanner import Ebook
+from src.core.thumbnails import thumbnail_paths
+from tests.fakes.kobo_device import FakeKobo
+
+NOW = datetime(2026, 10, 1)
+
+BOOKS = [
+    {"path": "finished.epub", "Title": "Finished", "ReadStatus": FINISHED,
+     "DateLastRead": "2026-09-30T10:00:00Z"},
+    {"path": "old.epub", "Title": "Old", "ReadStatus": READING, "DateLastRead": "2025-01-01T10:00:00Z"},
+    {"path": "recent.epub", "Title": "Recent", "ReadStatus": READING, "DateLastRead": "2026-09-29T10:00:00Z"},
+    {"path": "never.epub", "Title": "Never opened"},
+]
+
+
+@pytest.fixture
+def kobo(tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBO_SYNC_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("KOBO_THUMBNAILS", "0")
+    monkeypatch.setenv("KOBO_RESERVE_MB", "0")
+    kobo = FakeKobo(tmp_path, books=BOOKS)
+    for book in BOOKS:
+        (kobo.root / book["path"]).write_bytes(os.urandom(40_000))
+    return kobo
+
+
+def index_of(kobo):
+    with KoboDatabase(kobo.root) as db:
+        return db.index()
+
+
+class TestEvictionPolicy:
+    def test_disabled_by_default(self, kobo):
+        assert EvictionPolicy().choose(index_of(kobo), kobo.root, 10**9, now=NOW) == []
+
+    def test_finished_first_then_least_recently_read(self, kobo):
+        policy = EvictionPolicy(finished=True, days=30)
+        chosen = policy.choose(index_of(kobo), kobo.root, 10**9, now=NOW)
+        assert [e.path for e in chosen] == ["finished.epub", "old.epub"]
+
+    def test_stops_once_enough_is_freed(self, kobo):
+        chosen = EvictionPolicy(finished=True, days=30).choose(index_of(kobo), kobo.root, 1, now=NOW)
+        assert [e.path for e in chosen] == ["finished.epub"]
+
+    def test_books_being_sent_are_kept(self, kobo):
+        chosen = EvictionPolicy(finished=True).choose(index_of(kobo), kobo.root, 10**9,
+                                                      keep=["FINISHED.epub"], now=NOW)
+        assert chosen == []
+
+
+def test_send_evicts_finished_book_to_make_room(kobo, tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBO_EVICT_FINISHED", "1")
+    thumbnail = kobo.root / thumbnail_paths("finished.epub")["N3_FULL"]
+    thumbnail.parent.mkdir(parents=True)
+    thumbnail.write_bytes(b"jpeg")
+    kobo.quota = kobo.used() + 30_000
+    new_book = tmp_path / "new.epub"
+    new_book.write_bytes(os.urandom(50_000))
+
+    with kobo.attached():
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path))
+        plan = manager.plan_kobo_usb([Ebook(new_book)], kobo.device_info)
+        assert [e.path for e in plan.evict] == ["finished.epub"]
+        assert (kobo.root / "finished.epub").exists()
+
+        report = manager.send_to_kobo_usb([Ebook(new_book)], kobo.device_info, plan)
+
+    assert report.copied == [new_book]
+    assert not (kobo.root / "finished.epub").exists()
+    assert not thumbnail.exists()
+    assert (kobo.root / "old.epub").exists()
+    conn = sqlite3.connect(str(kobo.db_path))
+    titles = {row[0] for row in conn.execute("SELECT Title FROM content")}
+    conn.close()
+    assert titles == {"Old", "Recent", "Never opened"}
@@ -0,0 +1,79 @@
+"""Tests for the calibre subprocess executor"""
+
+import sys
+import threading
+import time
+
+import pytest
+
+from src.core.executor import CalibreExecutor, CommandTimeout
+
+
+def python_cmd(code):
+    return [sys.executable, "-c", code]
+
+
+class TestCalibreExecutor:
+    def test_runs_command(self):
+        executor = CalibreExecutor(max_processes=1, timeout=10)
+        result = executor.run(python_cmd("print('ok')"))
+        assert result.returncode == 0
+        assert result.stdout.strip() == "ok"
+        assert executor.metrics().completed == 1
+
+    def test_timeout_kills_process_group(self, tmp_path):
+        marker = tmp_path / "child-survived"
+        child = tmp_path / "child.py"
+        child.write_text(f"import time\ntime.sleep(1.5)\nopen({str(marker)!r}, 'w')\n")
+        # The child outlives the parent's timeout unless the whole group is killed
+        code = (
+            "import subprocess, sys, time;"
+            f"subprocess.Popen([sys.executable, {str(child)!r}]);"
+            "time.sleep(30)"
+        )
+        executor = CalibreExecutor(max_processes=1, timeout=0.5)
+        with pytest.raises(CommandTimeout):
+            executor.run(python_cmd(code))
+        time.sleep(2)
+        assert not marker.exists()
+        assert executor.metrics().timeouts == 1
+
+    def test_concurrency_cap(self):
+        executor = CalibreExecutor(max_processes=2, timeout=10)
+        peak = []
+
+        def worker():
+            executor.run(python_cmd("import time; time.sleep(0.3)"))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.15)
+        peak.append(executor.metrics())
+        for thread in threads:
+            thread.join()
+
+        assert peak[0].running <= 2
+        assert executor.metrics().max_queued >= 3
+        assert executor.metrics().completed == 5
+
+    def test_retries_lock_errors(self, tmp_path):
+        counter = tmp_path / "attempts"
+        code = (
+            "import pathlib, sys;"
+            f"p = pathlib.Path({str(counter)!r});"
+            "n = int(p.read_text()) if p.exists() else 0;"
+            "p.write_text(str(n + 1));"
+            "sys.exit(0) if n >= 2 else sys.exit('database is locked')"
+        )
+        executor = CalibreExecutor(max_processes=1, timeout=10, retries=3, backoff=0.01)
+        result = executor.run(python_cmd(code))
+        assert result.returncode == 0
+        assert counter.read_text() == "3"
+        assert executor.metrics().retries == 2
+
+    def test_other_errors_not_retried(self):
+        executor = CalibreExecutor(max_processes=1, timeout=10, retries=3, backoff=0.01)
+        result = executor.run(python_cmd("import sys; sys.exit('no such file')"))
+        assert result.returncode == 1
+        assert executor.metrics().retries == 0
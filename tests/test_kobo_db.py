@@ -0,0 +1,87 @@
+"""Tests for the Kobo device database reader"""
+
+import sqlite3
+import time
+
+import pytest
+
+from src.core.calibre import CalibreManager, DeviceInfo
+from src.core.kobo_db import FINISHED, KoboDatabase, normalise
+from src.core.metadata import BookMetadata
+from src.core.scanner import Ebook
+from tests.fakes.kobo_device import create_kobo_db
+
+
+@pytest.fixture
+def device(tmp_path):
+    root = tmp_path / "KOBOeReader"
+    create_kobo_db(root, [
+        {"path": "Calvino - Le città invisibili.kepub.epub", "Title": "Le città invisibili",
+         "Attribution": "Italo Calvino", "ReadStatus": FINISHED, "___PercentRead": 100},
+        {"ContentID": "0a1b2c3d-store-book", "Title": "Dune", "Attribution": "Frank Herbert",
+         "ISBN": "978-0-441-17271-9"},
+        {"ContentID": "file:///mnt/onboard/x.epub#(1)chapter1", "ContentType": 9, "Title": "Chapter 1"},
+    ])
+    return root
+
+
+class TestKoboDatabase:
+    def test_reads_books_only(self, device):
+        with KoboDatabase(device) as db:
+            books = db.books()
+        assert sorted(b.title for b in books) == ["Dune", "Le città invisibili"]
+        sideloaded = next(b for b in books if b.path)
+        assert sideloaded.path == "Calvino - Le città invisibili.kepub.epub"
+        assert sideloaded.read_status == FINISHED
+
+    def test_device_file_is_not_locked(self, device):
+        with KoboDatabase(device) as db:
+            writer = sqlite3.connect(str(device / ".kobo" / "KoboReader.sqlite"), timeout=0)
+            writer.execute("BEGIN EXCLUSIVE")
+            writer.execute("UPDATE content SET ReadStatus = 1")
+            writer.commit()
+            writer.close()
+            assert len(db.books()) == 2
+
+    def test_index_lookups(self, device):
+        with KoboDatabase(device) as db:
+            index = db.index()
+        assert index.find(title="le citta invisibili", author="ITALO CALVINO").title == "Le città invisibili"
+        assert index.find(isbn="9780441172719").title == "Dune"
+        assert index.find(path="calvino - le città invisibili.kepub.epub") is not None
+        assert index.find(title="Dune", author="Someone Else") is None
+
+    def test_index_scales_to_thousands(self, tmp_path):
+        root = tmp_path / "big"
+        create_kobo_db(root, ({"path": f"book{i}.epub", "Title": f"Title {i}",
+                               "Attribution": f"Author {i % 50}"} for i in range(5000)))
+        start = time.perf_counter()
+        with KoboDatabase(root) as db:
+            index = db.index()
+        assert time.perf_counter() - start < 2
+        assert index.find(title="Title 4321", author="Author 21") is not None
+
+
+def test_normalise():
+    assert normalise("  Le Città   Invisibili! ") == "le citta invisibili"
+
+
+class TestSendSkipsBooksOnDevice:
+    def test_same_book_under_other_name_is_skipped(self, device, tmp_path, monkeypatch):
+        monkeypatch.setenv("KOBO_SYNC_CACHE_DIR", str(tmp_path / "cache"))
+        manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path))
+        sources = tmp_path / "books"
+        sources.mkdir()
+        for name in ("citta.epub", "new.epub"):
+            (sources / name).write_bytes(b"PK")
+        metadata = {
+            "citta.epub": BookMetadata(title="Le Città Invisibili", author="Italo Calvino"),
+            "new.epub": BookMetadata(title="Marcovaldo", author="Italo Calvino"),
+        }
+        monkeypatch.setattr(manager.metadata_cache, "get", lambda path: metadata[path.name])
+
+        info = DeviceInfo(name="KOBOeReader", path=str(device), connected=True)
+        report = manager.send_to_kobo_usb([Ebook(sources / "citta.epub"), Ebook(sources / "new.epub")], info)
+
+        assert report.on_device == [sources / "citta.epub"]
+        assert report.copied == [sources / "new.epub"]
@@ -0,0 +1,83 @@
+"""End-to-end USB send tests against the simulated Kobo"""
+
+import os
+
+import pytest
+
+from src.core.calibre import CalibreManager
+from src.core.executor import CalibreExecutor
+from src.core.scanner import EbookScanner
+from src.core.usb_copy import partial_path
+from tests.fakes.calibre_tools import install_fake_calibre
+from tests.fakes.kobo_device import FakeKobo
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBO_CONVERT", "none")
+    monkeypatch.setenv("KOBO_THUMBNAILS", "0")
+    monkeypatch.setenv("KOBO_SYNC_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("KOBO_RESERVE_MB", "0")
+    return tmp_path
+
+
+def make_manager(tmp_path):
+    bin_dir = install_fake_calibre(tmp_path / "bin")
+    library = tmp_path / "library"
+    library.mkdir(exist_ok=True)
+    return CalibreManager(calibredb_path=str(bin_dir / "calibredb"), library_path=str(library),
+                          executor=CalibreExecutor(max_processes=2, timeout=30))
+
+
+def make_books(folder, count, size=50_000):
+    folder.mkdir()
+    for i in range(count):
+        (folder / f"book{i}.epub").write_bytes(b"PK" + os.urandom(size))
+    return EbookScanner().scan(folder)
+
+
+def test_detected_only_while_mounted(env):
+    kobo = FakeKobo(env)
+    with kobo.attached():
+        manager = make_manager(env)
+        assert manager.check_kobo_usb() == kobo.device_info
+        kobo.unmount()
+        assert manager.check_kobo_usb() is None
+
+
+def test_send_to_device_end_to_end(env):
+    kobo = FakeKobo(env, write_latency_ms=1)
+    ebooks = make_books(env / "downloads", 3)
+    with kobo.attached():
+        manager = make_manager(env)
+        result = manager.send_to_device(ebooks)
+        assert result["kobo_connected"]
+        assert result["imported"] == result["sent_usb"] == 3
+        assert sorted(p.name for p in kobo.root.glob("*.epub")) == ["book0.epub", "book1.epub", "book2.epub"]
+
+        again = manager.send_to_device(ebooks)
+        assert again["sent_usb"] == 0
+        assert again["skipped_usb"] == 3
+
+
+def test_quota_leaves_out_what_does_not_fit(env):
+    kobo = FakeKobo(env, quota=0)
+    kobo.quota = kobo.used() + 120_000
+    ebooks = make_books(env / "downloads", 4)
+    with kobo.attached():
+        report = make_manager(env).send_to_kobo_usb(ebooks, kobo.device_info)
+    assert len(report.copied) == 2
+    assert len(report.no_space) == 2
+    assert report.failed == []
+
+
+def test_injected_failures_leave_no_partial_files(env):
+    kobo = FakeKobo(env, fail_rate=1.0)
+    ebooks = make_books(env / "downloads", 2)
+    with kobo.attached():
+        report = make_manager(env).send_to_kobo_usb(ebooks, kobo.device_info)
+    assert len(report.failed) == 2
+    assert kobo.failures == 2
+    for ebook in ebooks:
+        assert not (kobo.root / ebook.path.name).exists()
+        assert not partial_path(kobo.root / ebook.path.name).exists()
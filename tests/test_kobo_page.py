@@ -0,0 +1,88 @@
+"""Tests for the paginated /kobo pages"""
+
+import re
+
+from flask import Flask, request
+
+from src.web.catalog import AUTHOR, RECENT, TITLE, Catalog, CatalogEntry, paginate
+from src.web.kobo_page import KoboPages
+
+
+def make_catalog(books):
+    """A catalog of (title, author, mtime) without scanning any files"""
+    catalog = Catalog()
+    catalog.entries = [CatalogEntry(i, title, author, "EPUB", mtime)
+                       for i, (title, author, mtime) in enumerate(books)]
+    return catalog
+
+
+def downloads(html):
+    return [int(i) for i in re.findall(r'href="/download/(\d+)"', html)]
+
+
+class TestPaginate:
+    def test_budget_and_item_limit(self):
+        assert paginate([4, 4, 4, 4, 4], budget=10, max_items=5) == [(0, 2), (2, 4), (4, 5)]
+        assert paginate([1] * 5, budget=100, max_items=2) == [(0, 2), (2, 4), (4, 5)]
+
+    def test_oversized_item_gets_its_own_page(self):
+        assert paginate([3, 50, 3], budget=10, max_items=5) == [(0, 1), (1, 2), (2, 3)]
+
+    def test_empty(self):
+        assert paginate([], budget=10, max_items=5) == [(0, 0)]
+
+
+class TestKoboPages:
+    def test_every_page_fits_the_budget_and_every_book_appears_once(self):
+        books = [(f"Libro {i} " + "parola " * (i % 20), f"Autore {i % 37}", float(i)) for i in range(400)]
+        pages = KoboPages(make_catalog(books), budget=4096, max_books=30)
+
+        for sort in (RECENT, TITLE, AUTHOR):
+            seen = []
+            for number in range(1, len(pages.layout(sort).pages) + 1):
+                html = pages.render(sort, number)
+                assert len(html.encode("utf-8")) <= 4096
+                seen += downloads(html)
+            assert sorted(seen) == list(range(400))
+
+    def test_sorting(self):
+        books = [("Zeno", "Italo Svevo", 1.0), ("èra", "Anna Bianchi", 3.0), ("Alba", "", 2.0)]
+        pages = KoboPages(make_catalog(books))
+
+        assert downloads(pages.render(RECENT, 1)) == [1, 2, 0]
+        assert downloads(pages.render(TITLE, 1)) == [2, 1, 0]
+        # Author sort is by surname; books without an author go last
+        assert downloads(pages.render(AUTHOR, 1)) == [1, 0, 2]
+
+    def test_letter_jumps_link_to_the_page_where_the_letter_starts(self):
+        books = [(f"{letter} libro {i}", "", 0.0) for letter in "ABC" for i in range(10)]
+        pages = KoboPages(make_catalog(books), max_books=4)
+
+        assert pages.layout(TITLE).letters == {"A": 1, "B": 3, "C": 6}
+        html = pages.render(TITLE, 1)
+        assert '<a href="/kobo?sort=title&amp;page=3">B</a>' in html
+        assert "<i>D</i>" in html
+        assert "<nav>" in html and "Pagina 1 di 8" in html
+
+    def test_no_inline_styles_or_external_resources(self):
+        pages = KoboPages(make_catalog([("<Titolo>", "Autore", 0.0)] * 50))
+        html = pages.render(RECENT, 1)
+
+        assert "style=" not in html
+        assert "http" not in html
+        assert "&lt;Titolo&gt;" in html
+
+    def test_response_clamps_page_and_revalidates(self):
+        pages = KoboPages(make_catalog([("Libro", "Autore", 0.0)]))
+        app = Flask(__name__)
+
+        @app.route("/kobo")
+        def kobo():
+            return pages.response(request.args.get("sort", ""), int(request.args.get("page", 1)), request)
+
+        client = app.test_client()
+        first = client.get("/kobo?sort=bogus&page=9")
+        assert first.status_code == 200
+        assert b"Pagina 1 di 1" in first.data
+        again = client.get("/kobo", headers={"If-None-Match": first.headers["ETag"]})
+        assert again.status_code == 304
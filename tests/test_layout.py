@@ -0,0 +1,76 @@
+"""Tests for on-device layout templates"""
+
+from pathlib import Path
+
+from src.core.calibre import CalibreManager, DeviceInfo
+from src.core.layout import DeviceLayout, directories, sanitise_component
+from src.core.metadata import BookMetadata
+from src.core.scanner import Ebook
+
+
+def test_sanitise_component_for_fat32():
+    assert sanitise_component('Che cos\'è? "Una" <prova>: a/b') == "Che cos'è_ _Una_ _prova__ a_b"
+    assert sanitise_component("Trailing dots... ") == "Trailing dots"
+    assert sanitise_component("con") == "con_"
+    assert sanitise_component("   ") == "Sconosciuto"
+    assert len(sanitise_component("x" * 500)) == 120
+
+
+def test_template_uses_metadata_and_keeps_compound_extension():
+    layout = DeviceLayout("{author}/{series}/{title}")
+    metadata = BookMetadata(title="Il barone rampante", author="Italo Calvino",
+                            series="I nostri antenati", series_index=2.0)
+    assert layout.relative_path(Path("/cache/x.kepub.epub"), metadata) == \
+        "Italo Calvino/I nostri antenati/Il barone rampante.kepub.epub"
+    # Empty components are dropped, missing metadata falls back to the file name
+    assert layout.relative_path(Path("/lib/Some Book.epub"), None) == "Sconosciuto/Some Book.epub"
+
+
+def test_slashes_in_metadata_do_not_create_directories():
+    layout = DeviceLayout("{author}/{title}")
+    metadata = BookMetadata(title="Either/Or", author="A/B")
+    assert layout.relative_path(Path("/lib/x.epub"), metadata) == "A_B/Either_Or.epub"
+
+
+def test_collisions_are_resolved_deterministically():
+    layout = DeviceLayout("{author}/{title}")
+    same = BookMetadata(title="Dune", author="Frank Herbert")
+    paths = [Path("/lib/b/Dune.epub"), Path("/lib/a/Dune.epub"), Path("/lib/c/DUNE.epub")]
+    meta = {p: (BookMetadata(title="DUNE", author="frank herbert") if "c" in str(p.parent) else same)
+            for p in paths}
+    first = layout.assign(paths, meta.get)
+    second = layout.assign(list(reversed(paths)), meta.get)
+    assert dict(first) == dict(second)
+    assert dict(first) == {
+        Path("/lib/a/Dune.epub"): "Frank Herbert/Dune.epub",
+        Path("/lib/b/Dune.epub"): "Frank Herbert/Dune (2).epub",
+        Path("/lib/c/DUNE.epub"): "frank herbert/DUNE (3).epub",
+    }
+
+
+def test_directories_parents_first():
+    assert directories(["a/b/x.epub", "a/y.epub", "z.epub", "c/w.epub"]) == ["a", "c", "a/b"]
+
+
+def test_send_uses_layout_and_keeps_files_it_did_not_put_there(tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBO_SYNC_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("KOBO_LAYOUT", "{author}/{title}")
+    device_root = tmp_path / "KOBOeReader"
+    (device_root / "Italo Calvino").mkdir(parents=True)
+    # A different file the user put there by hand
+    (device_root / "Italo Calvino" / "Marcovaldo.epub").write_bytes(b"user's own copy")
+
+    book = tmp_path / "marcovaldo.epub"
+    book.write_bytes(b"PK")
+    manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path))
+    monkeypatch.setattr(manager.metadata_cache, "get",
+                        lambda path: BookMetadata(title="Marcovaldo", author="Italo Calvino"))
+
+    report = manager.send_to_kobo_usb([Ebook(book)], DeviceInfo("KOBOeReader", str(device_root), True))
+    assert report.copied == [book]
+    assert (device_root / "Italo Calvino" / "Marcovaldo (2).epub").read_bytes() == b"PK"
+    assert (device_root / "Italo Calvino" / "Marcovaldo.epub").read_bytes() == b"user's own copy"
+
+    # Sending again finds it in the manifest under the same name
+    report = manager.send_to_kobo_usb([Ebook(book)], DeviceInfo("KOBOeReader", str(device_root), True))
+    assert report.skipped == [book]
@@ -0,0 +1,122 @@
+"""Tests for the library registry"""
+
+import os
+import socket
+import time
+
+import pytest
+
+from src.core.calibre import CalibreError, DeviceInfo
+from src.core.library import LibraryRegistry, parse_libraries
+from src.core.network import get_local_ip
+from src.core.scanner import Ebook
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+class TestParseLibraries:
+    def test_pairs_in_order(self):
+        value = os.pathsep.join(["it=/srv/libri", "en=/srv/books"])
+        assert list(parse_libraries(value).items()) == [("it", "/srv/libri"), ("en", "/srv/books")]
+
+    def test_invalid_entry(self):
+        with pytest.raises(CalibreError):
+            parse_libraries("/srv/libri")
+
+
+class TestLibraryRegistry:
+    @pytest.fixture
+    def registry(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("KOBO_CONVERT", "none")
+        bin_dir = install_fake_calibre(tmp_path / "bin")
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        paths = {}
+        for name in ("it", "en"):
+            paths[name] = tmp_path / name
+            paths[name].mkdir()
+        monkeypatch.setenv("CALIBRE_LIBRARIES", os.pathsep.join(f"{n}={p}" for n, p in paths.items()))
+        registry = LibraryRegistry.from_env(calibredb_path=str(bin_dir / "calibredb"))
+        yield registry
+        registry.shutdown()
+
+    def test_default_is_first(self, registry):
+        assert registry.names() == ["it", "en"]
+        assert registry.default().name == "it"
+        with pytest.raises(CalibreError):
+            registry.get("fr")
+
+    def test_imports_go_to_their_library(self, registry, tmp_path):
+        book = tmp_path / "libro.epub"
+        book.write_bytes(b"PK")
+        result = registry.import_books("en", [Ebook(path=book)])
+        assert result.book_ids == [1]
+
+        # The index is refreshed after every queued write
+        english = registry.get("en")
+        assert [b.title for b in english.books.values()] == ["libro"]
+        assert not english.refresh_index()
+        assert not (registry.get("it").path / "metadata.db").exists()
+
+    def test_writes_serialised_per_library_only(self, registry):
+        spans = {"it": [], "en": []}
+
+        def write(name):
+            start = time.monotonic()
+            time.sleep(0.2)
+            spans[name].append((start, time.monotonic()))
+
+        futures = [registry.get(name).submit(write, name) for name in ("it", "it", "en")]
+        for future in futures:
+            future.result()
+
+        (a_start, a_end), (b_start, b_end) = sorted(spans["it"])
+        assert b_start >= a_end
+        en_start, en_end = spans["en"][0]
+        assert en_start < a_end
+
+    def test_each_library_gets_its_own_content_server(self, registry):
+        ports = []
+        for _ in range(2):
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                ports.append(sock.getsockname()[1])
+        it, en = registry.get("it").manager, registry.get("en").manager
+        it.server_port, en.server_port = ports
+        registry.discovery.ports = tuple(ports)
+        ip = get_local_ip()
+        try:
+            it.start_content_server()
+            # "it"'s server is running, but it does not serve "en"
+            assert it.get_opds_url() == f"http://{ip}:{ports[0]}/opds?library_id=it"
+            assert en.get_opds_url() == ""
+
+            en.start_content_server()
+            assert en.get_opds_url() == f"http://{ip}:{ports[1]}/opds?library_id=en"
+        finally:
+            it.stop_content_server()
+            en.stop_content_server()
+
+    def test_usb_sends_take_turns_on_the_same_device(self, registry, tmp_path, monkeypatch):
+        spans = []
+
+        def send(ebooks, device, plan):
+            start = time.monotonic()
+            time.sleep(0.2)
+            spans.append((start, time.monotonic()))
+
+        device = DeviceInfo("KOBOeReader", str(tmp_path), True)
+        futures = []
+        for name in ("it", "en"):
+            manager = registry.get(name).manager
+            monkeypatch.setattr(manager, "_send_to_kobo_usb", send)
+            futures.append(registry.get(name).submit(manager.send_to_kobo_usb, [], device))
+        for future in futures:
+            future.result()
+
+        (a_start, a_end), (b_start, b_end) = sorted(spans)
+        assert b_start >= a_end
+
+    def test_libraries_have_distinct_server_ports(self, registry):
+        ports = {registry.get(name).manager.server_port for name in registry.names()}
+        assert len(ports) == 2
+        assert registry.get("it").manager.discovery is registry.get("en").manager.discovery
+
@@ -0,0 +1,70 @@
+"""Tests for the device manifest and delta USB send"""
+
+import pytest
+
+from src.core.calibre import CalibreManager, DeviceInfo
+from src.core.manifest import DEVICE_MANIFEST, DeviceManifest, device_id
+from src.core.scanner import Ebook
+
+
+@pytest.fixture
+def device(tmp_path):
+    root = tmp_path / "KOBOeReader"
+    (root / ".kobo").mkdir(parents=True)
+    (root / ".kobo" / "version").write_text("N418123456789,4.38.21908,4.38.21908,4.38.21908,4.38.21908,00000000-0000-0000-0000-000000000388")
+    return root
+
+
+@pytest.fixture
+def sources(tmp_path):
+    folder = tmp_path / "books"
+    folder.mkdir()
+    ebooks = []
+    for name in ("a.epub", "b.epub"):
+        (folder / name).write_bytes(name.encode() * 100)
+        ebooks.append(Ebook(path=folder / name))
+    return ebooks
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBO_SYNC_CACHE_DIR", str(tmp_path / "cache"))
+    return CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path))
+
+
+class TestDeviceManifest:
+    def test_device_id_from_serial(self, device):
+        assert device_id(device) == "N418123456789"
+
+    def test_round_trip_and_local_fallback(self, device, sources, tmp_path):
+        cache = tmp_path / "cache"
+        manifest = DeviceManifest(device, cache)
+        (device / "a.epub").write_bytes(sources[0].path.read_bytes())
+        manifest.record(sources[0].path, "a.epub")
+        manifest.save()
+
+        assert DeviceManifest.load(device, cache).entries == manifest.entries
+        (device / DEVICE_MANIFEST).unlink()
+        assert DeviceManifest.load(device, cache).entries == manifest.entries
+
+
+class TestDeltaSend:
+    def test_second_send_skips_unchanged(self, manager, device, sources):
+        info = DeviceInfo(name="KOBOeReader", path=str(device), connected=True)
+        first = manager.send_to_kobo_usb(sources, info)
+        assert len(first.copied) == 2
+
+        second = manager.send_to_kobo_usb(sources, info)
+        assert second.copied == []
+        assert second.skipped == [e.path for e in sources]
+
+    def test_changed_or_deleted_files_are_recopied(self, manager, device, sources):
+        info = DeviceInfo(name="KOBOeReader", path=str(device), connected=True)
+        manager.send_to_kobo_usb(sources, info)
+
+        sources[0].path.write_bytes(b"new edition")
+        (device / "b.epub").unlink()
+        report = manager.send_to_kobo_usb(sources, info)
+
+        assert report.copied == [e.path for e in sources]
+        assert (device / "a.epub").read_bytes() == b"new edition"
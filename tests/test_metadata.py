@@ -0,0 +1,63 @@
+"""Tests for metadata extraction and caching"""
+
+from ebooklib import epub
+
+from src.core.metadata import MetadataCache, MetadataExtractor
+from src.core.writeback import metadata_fields
+
+
+def make_epub(path, authors):
+    """EPUB 3 with one creator per (name, file_as) pair"""
+    book = epub.EpubBook()
+    book.set_identifier("id")
+    book.set_title("Good Omens")
+    book.set_language("en")
+    for i, (name, file_as) in enumerate(authors):
+        book.add_author(name, file_as=file_as, uid=f"creator{i}")
+    chapter = epub.EpubHtml(title="1", file_name="1.xhtml", content="<p>1</p>")
+    book.add_item(chapter)
+    book.spine = [chapter]
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(str(path), book)
+    return path
+
+
+class TestAuthorSort:
+    def test_declared_sort_covers_every_author(self, tmp_path):
+        path = make_epub(tmp_path / "go.epub", [("Terry Pratchett", "Pratchett, Terry"),
+                                                ("Neil Gaiman", "Gaiman, Neil")])
+        metadata = MetadataExtractor().extract(path)
+
+        assert metadata.author == "Terry Pratchett"
+        assert metadata.author_sort == "Pratchett, Terry & Gaiman, Neil"
+        assert metadata_fields(metadata)["author_sort"] == "Pratchett, Terry & Gaiman, Neil"
+
+    def test_no_sort_written_unless_every_author_declares_one(self, tmp_path):
+        path = make_epub(tmp_path / "go.epub", [("Terry Pratchett", "Pratchett, Terry"),
+                                                ("Neil Gaiman", None)])
+        metadata = MetadataExtractor().extract(path)
+
+        assert metadata.author_sort is None
+        assert "author_sort" not in metadata_fields(metadata)
+
+
+class TestMetadataCache:
+    def test_reuses_until_file_changes(self, tmp_path):
+        calls = []
+
+        class CountingExtractor:
+            def extract(self, path):
+                calls.append(path)
+                return object()
+
+        path = tmp_path / "book.epub"
+        path.write_bytes(b"PK")
+        cache = MetadataCache(CountingExtractor())
+        first = cache.get(path)
+        assert cache.get(path) is first
+        assert len(calls) == 1
+
+        path.write_bytes(b"PK changed")
+        cache.get(path)
+        assert len(calls) == 2
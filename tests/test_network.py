@@ -0,0 +1,68 @@
+"""Tests for local address discovery"""
+
+from src.core import network
+from src.core.network import LocalAddress, pick_address
+
+
+class TestPickAddress:
+    def test_skips_loopback_and_link_local(self):
+        interfaces = [("lo", "127.0.0.1"), ("eth1", "169.254.3.4"), ("eth0", "192.168.1.20")]
+        assert pick_address(interfaces) == "192.168.1.20"
+
+    def test_prefers_private_addresses(self):
+        assert pick_address([("eth0", "8.8.4.4"), ("eth1", "10.0.0.5")]) == "10.0.0.5"
+
+    def test_skips_bridge_interfaces(self):
+        interfaces = [("docker0", "172.17.0.1"), ("lxcbr0", "10.0.3.1"),
+                      ("br-1a2b", "172.18.0.1"), ("eth0", "192.168.1.50")]
+        assert pick_address(interfaces) == "192.168.1.50"
+
+    def test_no_candidates(self):
+        assert pick_address([("lo", "127.0.0.1")]) is None
+
+
+class TestDiscover:
+    def test_default_route_address_wins_over_bridges(self, monkeypatch):
+        monkeypatch.setattr(network, "route_address", lambda: "192.168.1.50")
+        monkeypatch.setattr(network, "interface_addresses",
+                            lambda: [("docker0", "172.17.0.1"), ("eth0", "192.168.1.50")])
+        assert LocalAddress(pinned="")._discover() == "192.168.1.50"
+
+    def test_interfaces_without_default_route(self, monkeypatch):
+        monkeypatch.setattr(network, "route_address", lambda: None)
+        monkeypatch.setattr(network, "interface_addresses",
+                            lambda: [("virbr0", "192.168.122.1"), ("wlan0", "192.168.1.50")])
+        assert LocalAddress(pinned="")._discover() == "192.168.1.50"
+
+
+class TestLocalAddress:
+    def test_pinned_address_from_env(self, monkeypatch):
+        monkeypatch.setenv("ADVERTISED_IP", "192.168.1.50")
+        assert LocalAddress().get() == "192.168.1.50"
+
+    def test_discovery_is_memoised(self, monkeypatch):
+        monkeypatch.delenv("ADVERTISED_IP", raising=False)
+        address = LocalAddress(ttl=60)
+        calls = []
+        monkeypatch.setattr(address, "_discover", lambda: calls.append(1) or "10.0.0.7")
+
+        assert address.get() == "10.0.0.7"
+        assert address.get() == "10.0.0.7"
+        assert len(calls) == 1
+
+        address.invalidate()
+        address.get()
+        assert len(calls) == 2
+
+    def test_interface_change_triggers_refresh(self, monkeypatch):
+        monkeypatch.delenv("ADVERTISED_IP", raising=False)
+        interfaces = [[(1, "lo")]]
+        monkeypatch.setattr("socket.if_nameindex", lambda: interfaces[0])
+        address = LocalAddress(ttl=60)
+        calls = []
+        monkeypatch.setattr(address, "_discover", lambda: calls.append(1) or "10.0.0.7")
+
+        address.get()
+        interfaces[0] = [(1, "lo"), (2, "eth0")]
+        address.get()
+        assert len(calls) == 2
@@ -0,0 +1,68 @@
+"""Tests for the free-space send planner"""
+
+import os
+import shutil
+from collections import namedtuple
+
+import pytest
+
+from src.core.planner import NEWEST, SELECTION, SpacePlanner, on_disk_size
+
+Usage = namedtuple("Usage", "total used free")
+
+
+@pytest.fixture
+def books(tmp_path):
+    """Three books of 100, 200 and 300 bytes, the last selected being the oldest"""
+    paths = []
+    for i, size in enumerate((100, 200, 300)):
+        path = tmp_path / f"book{i}.epub"
+        path.write_bytes(b"x" * size)
+        os.utime(path, (1000 + (2 - i), 1000 + (2 - i)))
+        paths.append((path, path.name))
+    return paths
+
+
+def free_space(monkeypatch, free):
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: Usage(10_000, 10_000 - free, free))
+    monkeypatch.setattr(os, "statvfs", lambda path: (_ for _ in ()).throw(OSError()))
+
+
+def test_on_disk_size_rounds_to_clusters():
+    assert on_disk_size(1, 4096) == 4096
+    assert on_disk_size(4096, 4096) == 4096
+    assert on_disk_size(4097, 4096) == 8192
+    assert on_disk_size(10, 0) == 10
+
+
+def test_everything_fits(books, tmp_path, monkeypatch):
+    free_space(monkeypatch, 1000)
+    plan = SpacePlanner(reserve=0).plan(tmp_path, books)
+    assert plan.fits == books
+    assert plan.left_out == []
+    assert plan.required == plan.planned == 600
+
+
+def test_newest_first(books, tmp_path, monkeypatch):
+    free_space(monkeypatch, 350)
+    plan = SpacePlanner(NEWEST, reserve=0).plan(tmp_path, books)
+    # book0 (100) and book1 (200) are newest; book2 (300) no longer fits
+    assert plan.fits == books[:2]
+    assert plan.left_out == books[2:]
+    assert plan.shortfall == 250
+
+
+def test_selection_order_takes_smaller_books_after_a_miss(books, tmp_path, monkeypatch):
+    free_space(monkeypatch, 450)
+    plan = SpacePlanner(SELECTION, reserve=0).plan(tmp_path, list(reversed(books)))
+    # book2 (300) first, book1 (200) does not fit, book0 (100) does
+    assert plan.fits == [books[2], books[0]]
+    assert plan.left_out == [books[1]]
+
+
+def test_reserve_is_kept_free(books, tmp_path, monkeypatch):
+    free_space(monkeypatch, 650)
+    plan = SpacePlanner(SELECTION, reserve=100).plan(tmp_path, books)
+    assert plan.available == 550
+    assert plan.left_out == [books[2]]
+    assert "esclusi" in plan.summary()
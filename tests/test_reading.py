@@ -0,0 +1,104 @@
+"""Tests for the reading-state sync from the Kobo into Calibre"""
+
+import sqlite3
+
+import pytest
+
+from src.core.calibre import CalibreManager, DeviceInfo
+from src.core.kobo_db import FINISHED, READING
+from src.core.writeback import WriteOutcome
+from tests.fakes.kobo_device import create_kobo_db
+
+LIBRARY = [
+    {"id": 1, "title": "Le città invisibili", "authors": "Italo Calvino", "isbn": ""},
+    {"id": 2, "title": "Dune", "authors": "Frank Herbert", "isbn": "9780441172719"},
+]
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBO_SYNC_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("KOBO_READING_COLUMNS", "1")
+    root = tmp_path / "KOBOeReader"
+    db = create_kobo_db(root, [
+        {"path": "calvino.kepub.epub", "Title": "Le Città Invisibili", "Attribution": "Italo Calvino",
+         "ReadStatus": FINISHED, "___PercentRead": 100, "DateLastRead": "2026-03-01T21:00:00Z"},
+        {"ContentID": "store-dune", "Title": "Dune (Deluxe)", "Attribution": "F. Herbert",
+         "ISBN": "978-0441172719", "ReadStatus": READING, "___PercentRead": 42},
+        {"path": "unread.epub", "Title": "Mai aperto", "Attribution": "Nessuno"},
+        {"path": "other.epub", "Title": "Not in Calibre", "Attribution": "X", "ReadStatus": READING,
+         "___PercentRead": 5},
+    ])
+    library = tmp_path / "library"
+    library.mkdir()
+    manager = CalibreManager(calibredb_path="calibredb", library_path=str(library))
+    calls = {"list": 0, "writes": []}
+
+    def library_books():
+        calls["list"] += 1
+        return LIBRARY
+
+    def write_metadata(updates):
+        calls["writes"].append(updates)
+        return [WriteOutcome(u.book_id, True) for u in updates]
+
+    monkeypatch.setattr(manager, "_library_books", library_books)
+    monkeypatch.setattr(manager, "write_metadata", write_metadata)
+    device = DeviceInfo("KOBOeReader", str(root), True)
+    return manager, device, db, calls
+
+
+def test_writes_changed_books_in_one_batch(setup):
+    manager, device, _, calls = setup
+    report = manager.sync_reading_state(device)
+
+    assert len(calls["writes"]) == 1
+    fields = {u.book_id: u.fields for u in calls["writes"][0]}
+    assert fields[1] == {"#kobo_status": "Letto", "#kobo_percent": "100",
+                         "#kobo_last_read": "2026-03-01T21:00:00Z"}
+    assert fields[2] == {"#kobo_status": "In lettura", "#kobo_percent": "42"}
+    assert sorted(report.written) == [1, 2]
+    assert report.unmatched == ["Not in Calibre"]
+
+
+def test_reconnect_without_progress_does_no_work(setup):
+    manager, device, _, calls = setup
+    manager.sync_reading_state(device)
+    manager._device_indexes.clear()
+
+    report = manager.sync_reading_state(device)
+    assert report.changed == 0
+    assert calls["list"] == 1
+    assert len(calls["writes"]) == 1
+
+
+def test_only_new_progress_is_written(setup):
+    manager, device, db, calls = setup
+    manager.sync_reading_state(device)
+    conn = sqlite3.connect(str(db))
+    conn.execute("UPDATE content SET ___PercentRead = 60 WHERE ContentID = 'store-dune'")
+    conn.commit()
+    conn.close()
+    manager._device_indexes.clear()
+
+    report = manager.sync_reading_state(device)
+    assert report.written == [2]
+    assert calls["writes"][-1][0].fields["#kobo_percent"] == "60"
+    # Dune was matched the first time, so the library is not listed again
+    assert calls["list"] == 1
+
+
+def test_columns_from_environment(setup, monkeypatch):
+    manager, device, _, calls = setup
+    monkeypatch.setenv("KOBO_READING_COLUMNS", "#stato,#percentuale,#ultima_lettura")
+    manager.sync_reading_state(device)
+    assert set(calls["writes"][0][0].fields) >= {"#stato", "#percentuale"}
+
+
+def test_off_unless_columns_configured(setup, monkeypatch):
+    manager, device, _, calls = setup
+    monkeypatch.delenv("KOBO_READING_COLUMNS")
+    report = manager.sync_reading_state(device)
+
+    assert not report.enabled
+    assert calls == {"list": 0, "writes": []}
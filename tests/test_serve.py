@@ -0,0 +1,88 @@
+"""Tests for the web app serving modes"""
+
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from src.main import parse_args
+from src.web.serve import DEV, PRODUCTION, ServeOptions
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+APP = """
+import sys, time
+sys.path.insert(0, {root!r})
+from flask import Flask
+from src.web.serve import ServeOptions, serve
+
+app = Flask(__name__)
+
+@app.route("/slow")
+def slow():
+    time.sleep(1)
+    return "done"
+
+@app.route("/ping")
+def ping():
+    return "pong"
+
+serve(app, ServeOptions(host="127.0.0.1", port={port}, mode="production", threads=2, grace=5))
+print("stopped", flush=True)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_options_from_environment(monkeypatch):
+    monkeypatch.setenv("KOBO_SERVER", "Production")
+    monkeypatch.setenv("KOBO_THREADS", "16")
+    options = ServeOptions()
+    assert (options.mode, options.threads) == (PRODUCTION, 16)
+    # The command line wins over the environment
+    assert parse_args(["--server", "dev", "--threads", "4", "--port", "6000"]) == \
+        ServeOptions(port=6000, mode=DEV, threads=4)
+
+
+def test_sigterm_lets_in_flight_requests_finish(tmp_path):
+    pytest.importorskip("waitress")
+    port = free_port()
+    script = tmp_path / "app.py"
+    script.write_text(APP.format(root=str(REPO_ROOT), port=port))
+    process = subprocess.Popen([sys.executable, str(script)], stdout=subprocess.PIPE, text=True)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                assert urllib.request.urlopen(f"{base}/ping", timeout=1).read() == b"pong"
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+        responses = []
+        slow = threading.Thread(
+            target=lambda: responses.append(urllib.request.urlopen(f"{base}/slow", timeout=10).read()))
+        slow.start()
+        time.sleep(0.3)
+        process.send_signal(signal.SIGTERM)
+        slow.join()
+
+        assert responses == [b"done"]
+        assert process.wait(timeout=10) == 0
+        assert "stopped" in process.stdout.read()
+    finally:
+        process.kill()
+        process.wait()
@@ -0,0 +1,138 @@
+"""Tests for content server discovery"""
+
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from src.core.server import (
+    ContentServerDiscovery,
+    ContentServerSupervisor,
+    ServerStartError,
+    is_calibre_server,
+)
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+def make_handler(status, body, headers=None):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(status=200, body=b"<feed></feed>", headers=None):
+        server = HTTPServer(("127.0.0.1", 0), make_handler(status, body, headers))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestIsCalibreServer:
+    def test_opds_feed(self, serve):
+        assert is_calibre_server(serve())
+
+    def test_calibre_auth_realm(self, serve):
+        port = serve(401, b"", {"WWW-Authenticate": 'Basic realm="calibre"'})
+        assert is_calibre_server(port)
+
+    def test_other_http_service(self, serve):
+        assert not is_calibre_server(serve(200, b"<html></html>"))
+
+    def test_nothing_listening(self):
+        assert not is_calibre_server(unused_port())
+
+
+class TestContentServerDiscovery:
+    def test_finds_first_calibre_port_in_order(self, serve):
+        other = serve(200, b"<html></html>")
+        first = serve()
+        second = serve()
+        discovery = ContentServerDiscovery(ports=[unused_port(), other, first, second])
+        assert discovery.find_port() == first
+
+    def test_result_cached_until_invalidated(self, serve):
+        port = unused_port()
+        discovery = ContentServerDiscovery(ports=[port], ttl=60)
+        assert discovery.find_port() is None
+
+        server = HTTPServer(("127.0.0.1", port), make_handler(200, b"<feed/>"))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            assert discovery.find_port() is None
+            discovery.invalidate()
+            assert discovery.find_port() == port
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestContentServerSupervisor:
+    @pytest.fixture
+    def command(self, tmp_path):
+        bin_dir = install_fake_calibre(tmp_path / "bin")
+        port = unused_port()
+        return [str(bin_dir / "calibre-server"), str(tmp_path / "library"), "--port", str(port)], port
+
+    def test_start_waits_until_ready(self, command):
+        cmd, port = command
+        supervisor = ContentServerSupervisor(cmd, port, ready_timeout=20)
+        supervisor.start()
+        try:
+            assert is_calibre_server(port)
+        finally:
+            supervisor.stop()
+        assert not supervisor.is_running()
+
+    def test_start_fails_when_process_exits(self, tmp_path):
+        supervisor = ContentServerSupervisor(
+            [sys.executable, "-c", "print('boom')"], unused_port(), ready_timeout=5)
+        with pytest.raises(ServerStartError, match="boom"):
+            supervisor.start()
+
+    def test_restarts_after_crash(self, command):
+        cmd, port = command
+        changes = []
+        supervisor = ContentServerSupervisor(cmd, port, ready_timeout=20, backoff=0.1,
+                                             on_change=lambda: changes.append(1))
+        supervisor.start()
+        try:
+            os.kill(supervisor._process.pid, signal.SIGKILL)
+            deadline = time.monotonic() + 20
+            while supervisor.restarts == 0 or not is_calibre_server(port):
+                assert time.monotonic() < deadline
+                time.sleep(0.1)
+            assert supervisor.is_running()
+            assert any("restarting" in line for line in supervisor.logs())
+            assert len(changes) >= 3
+        finally:
+            supervisor.stop()
@@ -0,0 +1,92 @@
+"""Tests for host-side Kobo thumbnail generation"""
+
+import zipfile
+
+import pytest
+
+from src.core.calibre import CalibreManager, DeviceInfo
+from src.core.scanner import Ebook
+from src.core.thumbnails import (
+    Thumbnail,
+    ThumbnailGenerator,
+    epub_cover,
+    image_id,
+    qhash,
+    thumbnail_paths,
+)
+
+CONTAINER = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+OPF = """<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="2.0">
+  <metadata><meta name="cover" content="cover-img"/></metadata>
+  <manifest>
+    <item id="cover-img" href="images/cover.jpg" media-type="image/jpeg"/>
+    <item id="ch1" href="ch1.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+</package>"""
+
+
+def make_epub(path, cover: bytes = b"JPEGDATA"):
+    with zipfile.ZipFile(path, "w") as book:
+        book.writestr("mimetype", "application/epub+zip")
+        book.writestr("META-INF/container.xml", CONTAINER)
+        book.writestr("OEBPS/content.opf", OPF)
+        book.writestr("OEBPS/images/cover.jpg", cover)
+    return path
+
+
+def test_image_id_and_paths():
+    assert image_id("Author/My Book.kepub.epub") == "file____mnt_onboard_Author_My_Book_kepub_epub"
+    h = qhash("file____mnt_onboard_Author_My_Book_kepub_epub")
+    assert 0 <= h < 2 ** 28
+    paths = thumbnail_paths("Author/My Book.kepub.epub")
+    assert paths["N3_FULL"] == (f".kobo-images/{h & 0xFF}/{(h >> 8) & 0xFF}/"
+                                "file____mnt_onboard_Author_My_Book_kepub_epub - N3_FULL.parsed")
+    assert set(paths) == {"N3_FULL", "N3_LIBRARY_FULL", "N3_LIBRARY_GRID"}
+
+
+def test_epub_cover_follows_opf_meta(tmp_path):
+    assert epub_cover(make_epub(tmp_path / "a.epub", b"cover bytes")) == b"cover bytes"
+    (tmp_path / "b.epub").write_bytes(b"not a zip")
+    assert epub_cover(tmp_path / "b.epub") is None
+
+
+def test_renders_and_caches(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    cover = tmp_path / "cover.jpg"
+    Image.new("RGB", (1200, 1800), "red").save(cover)
+    book = make_epub(tmp_path / "book.epub", cover.read_bytes())
+
+    generator = ThumbnailGenerator(cache_dir=tmp_path / "cache", max_workers=1)
+    generator.enabled = True
+    thumbnails = generator.generate([(book, "book.epub")])
+    assert len(thumbnails) == 3
+    full = next(t for t in thumbnails if "N3_FULL" in t.device_path)
+    assert Image.open(full.host_path).size[1] <= 1448
+
+    # Second run is served from the cache
+    assert generator.generate([(book, "book.epub")]) == thumbnails
+
+
+def test_send_copies_thumbnails_of_copied_books(tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBO_SYNC_CACHE_DIR", str(tmp_path / "cache"))
+    device_root = tmp_path / "KOBOeReader"
+    (device_root / ".kobo").mkdir(parents=True)
+    book = tmp_path / "book.epub"
+    book.write_bytes(b"PK")
+    rendered = tmp_path / "N3_FULL.jpg"
+    rendered.write_bytes(b"jpeg")
+    device_path = thumbnail_paths("book.epub")["N3_FULL"]
+
+    manager = CalibreManager(calibredb_path="calibredb", library_path=str(tmp_path))
+    monkeypatch.setattr(manager.thumbnails, "generate",
+                        lambda items: [Thumbnail(book, rendered, device_path)])
+    report = manager.send_to_kobo_usb([Ebook(book)], DeviceInfo("KOBOeReader", str(device_root), True))
+
+    assert report.copied == [book]
+    assert len(report.thumbnails.succeeded) == 1
+    assert (device_root / device_path).read_bytes() == b"jpeg"
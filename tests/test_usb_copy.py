@@ -0,0 +1,65 @@
+"""Tests for the USB copy engine"""
+
+import os
+
+import pytest
+
+from src.core.usb_copy import UsbCopyEngine, partial_path, transfer
+
+
+@pytest.fixture
+def files(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    items = []
+    for i in range(5):
+        source = src / f"book{i}.epub"
+        source.write_bytes(os.urandom(300_000 + i))
+        items.append((source, dst / source.name))
+    return items
+
+
+class TestTransfer:
+    def test_buffered_fallback_resumes(self, tmp_path, monkeypatch):
+        source = tmp_path / "in"
+        source.write_bytes(os.urandom(100_000))
+        monkeypatch.delattr(os, "copy_file_range", raising=False)
+        monkeypatch.setattr("sys.platform", "darwin")
+        with open(source, "rb") as src, open(tmp_path / "out", "wb") as dst:
+            method = transfer(src.fileno(), dst.fileno(), 100_000, buffer_size=4096)
+        assert method == "buffered"
+        assert (tmp_path / "out").read_bytes() == source.read_bytes()
+
+
+class TestUsbCopyEngine:
+    def test_copies_all_files(self, files):
+        report = UsbCopyEngine(workers=2, fsync_batch=2).copy(files)
+
+        assert len(report.succeeded) == 5
+        for source, dest in files:
+            assert dest.read_bytes() == source.read_bytes()
+            assert dest.stat().st_mtime == source.stat().st_mtime
+            assert not partial_path(dest).exists()
+        assert report.bytes == sum(s.stat().st_size for s, _ in files)
+        assert report.throughput > 0
+        assert all(r.method for r in report.results)
+
+    def test_failure_leaves_no_partial_file(self, files, tmp_path):
+        missing = (tmp_path / "src" / "missing.epub", tmp_path / "dst" / "missing.epub")
+        report = UsbCopyEngine().copy([files[0], missing])
+
+        assert [r.ok for r in report.results] == [True, False]
+        assert not missing[1].exists()
+        assert not partial_path(missing[1]).exists()
+
+    def test_overwrites_atomically(self, files):
+        source, dest = files[0]
+        dest.write_bytes(b"old")
+        UsbCopyEngine().copy([files[0]])
+        assert dest.read_bytes() == source.read_bytes()
+
+    def test_methods_can_be_restricted(self, files):
+        report = UsbCopyEngine(methods=("buffered",)).copy(files[:2])
+        assert [r.method for r in report.results] == ["buffered", "buffered"]
@@ -0,0 +1,138 @@
+"""Tests for metadata write-back"""
+
+import sqlite3
+
+import pytest
+
+from src.core.calibre import CalibreManager
+from src.core.executor import CalibreExecutor
+from src.core.metadata import BookMetadata
+from src.core.scanner import Ebook
+from src.core.writeback import MetadataUpdate, author_sort, metadata_fields, normalise_isbn
+from tests.fakes.calibre_tools import install_fake_calibre
+
+
+class TestFields:
+    @pytest.mark.parametrize("author, expected", [
+        ("Italo Calvino", "Calvino, Italo"),
+        ("Ursula K. Le Guin", "Guin, Ursula K. Le"),
+        ("Calvino, Italo", "Calvino, Italo"),
+        ("Homer", "Homer"),
+        ("Terry Pratchett & Neil Gaiman", "Pratchett, Terry & Gaiman, Neil"),
+    ])
+    def test_author_sort(self, author, expected):
+        assert author_sort(author) == expected
+
+    def test_normalise_isbn(self):
+        assert normalise_isbn("urn:isbn:978-0-306-40615-7") == "9780306406157"
+        assert normalise_isbn("0-8044-2957-x") == "080442957X"
+        assert normalise_isbn("urn:uuid:1234") is None
+
+    def test_metadata_fields(self):
+        metadata = BookMetadata(author="Italo Calvino", isbn="urn:isbn:9780306406157",
+                                series="Trilogia", series_index=2.0, author_sort="Calvino, Italo")
+        assert metadata_fields(metadata) == {
+            "author_sort": "Calvino, Italo",
+            "isbn": "9780306406157",
+            "series": "Trilogia",
+            "series_index": "2.0",
+        }
+        assert metadata_fields(BookMetadata()) == {}
+        # No declared sort: Calibre's own is kept
+        assert metadata_fields(BookMetadata(author="Martin Luther King Jr.")) == {}
+
+
+class TestWriteMetadata:
+    @pytest.fixture
+    def manager(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("KOBO_CONVERT", "none")
+        bin_dir = install_fake_calibre(tmp_path / "bin")
+        library = tmp_path / "library"
+        library.mkdir()
+        manager = CalibreManager(calibredb_path=str(bin_dir / "calibredb"),
+                                 library_path=str(library),
+                                 executor=CalibreExecutor(max_processes=1, timeout=30))
+        manager.calibre_debug = str(bin_dir / "calibre-debug")
+        books = []
+        for name in ("a.epub", "b.epub"):
+            (tmp_path / name).write_bytes(b"PK")
+            books.append(Ebook(path=tmp_path / name))
+        manager.import_books(books)
+        return manager
+
+    def rows(self, manager):
+        conn = sqlite3.connect(str(manager.get_library_path() / "metadata.db"))
+        try:
+            return conn.execute("SELECT id, author_sort, isbn, series FROM books ORDER BY id").fetchall()
+        finally:
+            conn.close()
+
+    def updates(self):
+        return [
+            MetadataUpdate(1, {"author_sort": "Calvino, Italo", "isbn": "9780306406157"}),
+            MetadataUpdate(2, {"series": "Trilogia", "series_index": "2.0"}),
+            MetadataUpdate(99, {"isbn": "9780306406157"}),
+        ]
+
+    def test_bulk_write_uses_one_invocation(self, manager):
+        before = manager.executor.metrics().completed
+        outcomes = manager.write_metadata(self.updates())
+
+        assert manager.executor.metrics().completed - before == 1
+        assert [(o.book_id, o.ok) for o in outcomes] == [(1, True), (2, True), (99, False)]
+        assert self.rows(manager) == [
+            (1, "Calvino, Italo", "9780306406157", None),
+            (2, "Unknown", "", "Trilogia"),
+        ]
+
+    def test_bulk_script_sets_fields_through_the_library_api(self, manager):
+        manager.write_metadata(self.updates())
+        conn = sqlite3.connect(str(manager.get_library_path() / "metadata.db"))
+        try:
+            series_index = conn.execute("SELECT series_index FROM books WHERE id = 2").fetchone()[0]
+        finally:
+            conn.close()
+
+        # The fake cache only accepts a float, as calibre's does
+        assert series_index == 2.0
+        outcomes = manager.write_metadata([MetadataUpdate(1, {"isbn": "0306406152"})])
+        assert outcomes[0].ok
+        assert self.rows(manager)[0] == (1, "Calvino, Italo", "0306406152", None)
+
+    def test_bulk_script_reports_a_failing_field_per_book(self, manager):
+        before = manager.executor.metrics().completed
+        outcomes = manager.write_metadata([
+            MetadataUpdate(1, {"publisher": "Einaudi"}),
+            MetadataUpdate(2, {"series": "Trilogia"}),
+        ])
+
+        assert manager.executor.metrics().completed - before == 1
+        assert not outcomes[0].ok and "publisher" in outcomes[0].error
+        assert outcomes[1].ok
+        assert self.rows(manager)[1] == (2, "Unknown", "", "Trilogia")
+
+    def test_falls_back_to_set_metadata_per_book(self, manager):
+        manager.calibre_debug = None
+        before = manager.executor.metrics().completed
+        outcomes = manager.write_metadata(self.updates())
+
+        assert manager.executor.metrics().completed - before == 3
+        assert [(o.book_id, o.ok) for o in outcomes] == [(1, True), (2, True), (99, False)]
+        assert self.rows(manager)[0] == (1, "Calvino, Italo", "9780306406157", None)
+
+    def test_empty_updates_do_nothing(self, manager):
+        before = manager.executor.metrics().completed
+        assert manager.write_metadata([MetadataUpdate(1)]) == []
+        assert manager.executor.metrics().completed == before
+
+    def test_send_to_device_writes_back_metadata(self, manager, tmp_path, monkeypatch):
+        (tmp_path / "c.epub").write_bytes(b"PK new")
+        monkeypatch.setattr(manager.metadata_cache, "get",
+                            lambda path: BookMetadata(author="Italo Calvino", author_sort="Calvino, Italo"))
+        monkeypatch.setattr(manager, "check_kobo_usb", lambda: None)
+        monkeypatch.setattr(manager, "get_opds_url", lambda for_remote=True: "http://kobo/opds")
+
+        result = manager.send_to_device([Ebook(path=tmp_path / "c.epub")])
+
+        assert result["metadata_updated"] == 1
+        assert self.rows(manager)[2] == (3, "Calvino, Italo", "", None)